@@ -0,0 +1,96 @@
+"""
+Recall and latency of the ANN index types against the exact flat baseline.
+
+Generates clustered synthetic vectors, builds each index type through repository.ann_index and reports
+recall@k against IndexFlatL2 ground truth plus p50/p99 single-query latency for a sweep of nprobe and
+efSearch values.
+
+Usage:
+    python -m benchmarks.ann_index_benchmark --sizes 100000,1000000 --dimension 1536
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from repository.ann_index import create_index, search
+
+
+def synthetic_vectors(n, dimension, rng, clusters=256):
+    # Embeddings are far from uniform; a gaussian mixture gives IVF something realistic to partition.
+    centers = rng.standard_normal((clusters, dimension), dtype="float32")
+    labels = rng.integers(0, clusters, n)
+    return centers[labels] + 0.3 * rng.standard_normal((n, dimension), dtype="float32")
+
+
+def recall_at_k(ids, ground_truth):
+    k = ground_truth.shape[1]
+    hits = sum(len(set(row[:k]) & set(truth)) for row, truth in zip(ids, ground_truth))
+    return hits / ground_truth.size
+
+
+def latency_percentiles(index, queries, k, **params):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        search(index, query.reshape(1, -1), k, **params)
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    return round(float(np.percentile(timings, 50)), 3), round(float(np.percentile(timings, 99)), 3)
+
+
+def benchmark_size(n, args, rng):
+    vectors = synthetic_vectors(n, args.dimension, rng)
+    queries = synthetic_vectors(args.queries, args.dimension, rng)
+    nlist = args.nlist or int(4 * np.sqrt(n))
+
+    flat = create_index("flat", args.dimension)
+    flat.add(vectors)
+    _, ground_truth = flat.search(queries, args.k)
+    p50, p99 = latency_percentiles(flat, queries, args.k)
+    results = [{"index": "flat", "recall": 1.0, "p50_ms": p50, "p99_ms": p99}]
+
+    sweeps = {
+        "ivf_flat": [{"nprobe": p} for p in args.nprobe],
+        "ivf_pq": [{"nprobe": p} for p in args.nprobe],
+        "hnsw": [{"ef_search": ef} for ef in args.ef_search],
+    }
+    for index_type, sweep in sweeps.items():
+        index = create_index(index_type, args.dimension, nlist=nlist, pq_m=args.pq_m, hnsw_m=args.hnsw_m)
+        start = time.perf_counter()
+        if not index.is_trained:
+            index.train(vectors[:min(n, 256 * nlist)])
+        index.add(vectors)
+        build_seconds = round(time.perf_counter() - start, 2)
+        for params in sweep:
+            _, ids = search(index, queries, args.k, **params)
+            p50, p99 = latency_percentiles(index, queries, args.k, **params)
+            results.append({"index": index_type, **params, "build_seconds": build_seconds,
+                            "recall": round(recall_at_k(ids, ground_truth), 4), "p50_ms": p50, "p99_ms": p99})
+    return {"vectors": n, "nlist": nlist, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="100000,1000000")
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--nlist", type=int, default=None, help="defaults to 4 * sqrt(vectors)")
+    parser.add_argument("--pq-m", type=int, default=64)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--nprobe", type=lambda s: [int(v) for v in s.split(",")], default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", type=lambda s: [int(v) for v in s.split(",")], default=[16, 64, 256])
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads for the searches")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    rng = np.random.default_rng(0)
+    report = [benchmark_size(int(n), args, rng) for n in args.sizes.split(",")]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Per-request cost of authentication, and memory of login sessions under a login-heavy load.
+
+Times the CurrentUser dependency on a request carrying a bearer token, once with every request decoding
+its JWT and once with the claims cache, the default. Then logs users in wave after wave, with sessions
+expiring after --session-seconds and the sweeper ending them between waves, and reports the number of
+live sessions and the traced memory after each wave, which should stay flat. Users and sessions are kept
+in memory, or in SQLite with --user-db. Passwords are hashed with cheap scrypt parameters, as hashing is not
+what is measured here.
+
+Usage:
+    python -m benchmarks.auth_benchmark --requests 100000 --waves 5 --logins-per-wave 20000
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+
+import numpy as np
+from starlette.requests import Request
+
+from repository.user_store import InMemoryUserStore, SQLiteUserStore
+from service.password_hasher import PasswordHasher
+from service.user_service import UserService
+from utils.get_current_user import CurrentUser
+
+
+def make_request(token):
+    return Request({"type": "http", "method": "GET", "path": "/",
+                    "headers": [(b"authorization", f"Bearer {token}".encode())]})
+
+
+def create_user_service(args, claims_cache_size=10_000):
+    store = SQLiteUserStore(args.user_db) if args.user_db else InMemoryUserStore()
+    return UserService(claims_cache_size=claims_cache_size, store=store,
+                       password_hasher=PasswordHasher(n=2 ** 4, r=1, workers=0))
+
+
+async def time_requests(args, claims_cache_size):
+    user_service = create_user_service(args, claims_cache_size)
+    await user_service.set_user_details("alice", "password")
+    token = (await user_service.login("alice", "password"))["token"]
+    current_user = CurrentUser(user_service)
+    timings = np.empty(args.requests)
+    for i in range(args.requests):
+        # A fresh request each time, as the request state starts empty.
+        request = make_request(token)
+        start = time.perf_counter()
+        await current_user(request)
+        timings[i] = time.perf_counter() - start
+    user_service.store.close()
+    timings *= 1e6
+    return {
+        "p50_us": round(float(np.percentile(timings, 50)), 2),
+        "p99_us": round(float(np.percentile(timings, 99)), 2),
+        "requests_per_sec": round(args.requests / (timings.sum() / 1e6), 1),
+    }
+
+
+async def login_storm(args):
+    user_service = create_user_service(args)
+    user_service.expiry_time = args.session_seconds / 60
+    for i in range(args.logins_per_wave):
+        await user_service.set_user_details(f"user{i}", "password")
+    tracemalloc.start()
+    results = []
+    for wave in range(args.waves):
+        for i in range(args.logins_per_wave):
+            token = (await user_service.login(f"user{i}", "password"))["token"]
+            await user_service.verify_token(token)
+        peak_sessions = user_service.store.session_count()
+        await asyncio.sleep(args.session_seconds * 1.1)
+        ended = await user_service.sweep_sessions()
+        results.append({
+            "wave": wave,
+            "sessions_before_sweep": peak_sessions,
+            "sessions_ended": ended,
+            "sessions_after_sweep": user_service.store.session_count(),
+            "traced_mb": round(tracemalloc.get_traced_memory()[0] / 2 ** 20, 2),
+        })
+    tracemalloc.stop()
+    user_service.store.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=100_000)
+    parser.add_argument("--waves", type=int, default=5)
+    parser.add_argument("--logins-per-wave", type=int, default=20_000)
+    parser.add_argument("--session-seconds", type=float, default=3.0)
+    parser.add_argument("--user-db", help="SQLite file to keep users and sessions in, instead of memory")
+    args = parser.parse_args()
+
+    results = {}
+    # Without the cache, every request decodes and checks the signature of its JWT.
+    for name, claims_cache_size in (("decode_every_request", 0), ("cached_claims", 10_000)):
+        results[name] = asyncio.run(time_requests(args, claims_cache_size))
+
+    print(json.dumps({
+        "requests": args.requests,
+        "user_db": args.user_db or "memory",
+        **results,
+        "login_storm": asyncio.run(login_storm(args)),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Local stand-in for the OpenAI embeddings and chat completions APIs, for running the application offline.
+
+Embeddings are deterministic and hash-seeded: each word of a text adds +1 or -1, chosen by its hash, to the
+dimension its hash selects, and the sum is normalized. Texts sharing words therefore get similar vectors,
+so retrieval and the response cache behave much as they would with a real model, at no cost. Chat
+completions wait --chat-latency-ms before answering, as if for the model, and stream their tokens
+--token-interval-ms apart.
+
+Usage:
+    python -m benchmarks.fake_openai --port 8001 --chat-latency-ms 200
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 python main.py
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import re
+import time
+
+import numpy as np
+import uvicorn
+from fastapi import Body, FastAPI
+from fastapi.responses import StreamingResponse
+
+DIMENSION = 1536
+_WORD = re.compile(r"\w+")
+
+
+def fake_embedding(text, dimension=DIMENSION):
+    """
+    Embed a text deterministically, by hashing its words.
+
+    Args:
+        text (str): The text.
+        dimension (int): Dimension of the vector.
+
+    Returns:
+        np.ndarray: A float32 unit vector; texts without words get one seeded by the hash of the whole text.
+    """
+    vector = np.zeros(dimension, dtype="float32")
+    for word in _WORD.findall(text.lower()):
+        value = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+        vector[value % dimension] += 1.0 if value >> 63 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        seed = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+        vector = np.random.default_rng(seed).standard_normal(dimension).astype("float32")
+        norm = np.linalg.norm(vector)
+    return vector / norm
+
+
+def create_app(chat_latency=0.05, completion_tokens=32, token_interval=0.0, dimension=DIMENSION):
+    """
+    Build the fake API.
+
+    Args:
+        chat_latency (float): Seconds before a chat completion answers, or sends its first token.
+        completion_tokens (int): Number of tokens, i.e. words, in every completion.
+        token_interval (float): Seconds between streamed tokens.
+        dimension (int): Dimension of the embeddings.
+
+    Returns:
+        FastAPI: The app, serving /v1/models, /v1/embeddings and /v1/chat/completions.
+    """
+    app = FastAPI()
+    words = [f"word{i}" for i in range(completion_tokens)]
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "fake", "object": "model", "created": 0, "owned_by": "fake"}]}
+
+    @app.post("/v1/embeddings")
+    async def embeddings(body: dict = Body(...)):
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = []
+        for i, text in enumerate(inputs):
+            vector = fake_embedding(text, dimension)
+            # The client asks for base64 whenever numpy is installed, and decodes it as float32.
+            embedding = (base64.b64encode(vector.tobytes()).decode() if body.get("encoding_format") == "base64"
+                         else vector.tolist())
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        tokens = sum(len(_WORD.findall(text)) for text in inputs)
+        return {"object": "list", "data": data, "model": body["model"],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(body: dict = Body(...)):
+        await asyncio.sleep(chat_latency)
+        completion = {"id": "chatcmpl-fake", "created": int(time.time()), "model": body["model"]}
+        if not body.get("stream"):
+            prompt_tokens = sum(len(_WORD.findall(message.get("content") or "")) for message in body["messages"])
+            return {
+                **completion,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": " ".join(words)}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                          "total_tokens": prompt_tokens + len(words)},
+            }
+
+        async def stream():
+            for i, word in enumerate(words):
+                if i and token_interval:
+                    await asyncio.sleep(token_interval)
+                chunk = {**completion, "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": {"content": f" {word}" if i else word},
+                                      "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--chat-latency-ms", type=float, default=50)
+    parser.add_argument("--completion-tokens", type=int, default=32)
+    parser.add_argument("--token-interval-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    app = create_app(args.chat_latency_ms / 1000, args.completion_tokens, args.token_interval_ms / 1000)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Startup time and memory of loading a persisted FAISS index, memory-mapped versus read into memory.
+
+Builds a synthetic IndexFlatL2, saves it through IndexStore and then loads it in fresh subprocesses,
+reporting load time and the anonymous (per-worker) and file-backed (shared page cache) resident memory
+after a full scan.
+
+Usage:
+    python -m benchmarks.index_load_benchmark --vectors 1000000 --dimension 1536
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+_LOADER = """
+import json, sys, time
+import faiss
+import numpy as np
+from repository.index_store import IndexStore
+
+directory, mode = sys.argv[1], sys.argv[2]
+start = time.perf_counter()
+if mode == "mmap":
+    vdb = IndexStore(directory).load(None)
+    index = vdb.index
+else:
+    store = IndexStore(directory)
+    index = faiss.read_index(str(store._current_snapshot() / "index.faiss"))
+load_seconds = time.perf_counter() - start
+index.search(np.zeros((1, index.d), dtype="float32"), 1)
+status = dict(line.split(":", 1) for line in open("/proc/self/status") if line.startswith("Rss"))
+print(json.dumps({
+    "mode": mode,
+    "load_seconds": round(load_seconds, 3),
+    "rss_anon_mb": int(status["RssAnon"].split()[0]) // 1024,
+    "rss_file_mb": int(status["RssFile"].split()[0]) // 1024,
+}))
+"""
+
+
+def build_and_save(directory, vectors, dimension, batch_size=100_000):
+    from langchain_community.docstore import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    from repository.index_store import IndexStore
+
+    index = faiss.IndexFlatL2(dimension)
+    rng = np.random.default_rng(0)
+    for start in range(0, vectors, batch_size):
+        index.add(rng.random((min(batch_size, vectors - start), dimension), dtype="float32"))
+    vdb = FAISS(
+        embedding_function=None,
+        index=index,
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={i: str(i) for i in range(vectors)},
+    )
+    start = time.perf_counter()
+    IndexStore(directory).save(vdb)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--vectors", type=int, default=1_000_000)
+    parser.add_argument("--dimension", type=int, default=1536)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        save_seconds = build_and_save(directory, args.vectors, args.dimension)
+        results = {"vectors": args.vectors, "dimension": args.dimension, "save_seconds": round(save_seconds, 3)}
+        for mode in ("mmap", "memory"):
+            output = subprocess.run([sys.executable, "-c", _LOADER, directory, mode],
+                                    check=True, capture_output=True, text=True).stdout
+            results[mode] = json.loads(output.strip().splitlines()[-1])
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Query latency and build throughput of the BM25 lexical index.
+
+Generates chunks of Zipf-distributed words, sprinkled with part-number style identifiers, indexes them
+through repository.lexical_index and reports p50/p99 latency of natural-language queries that mention
+an identifier, plus the on-disk size of the dumped index.
+
+Usage:
+    python -m benchmarks.lexical_index_benchmark --chunks 1000000
+"""
+import argparse
+import io
+import json
+import time
+
+import numpy as np
+
+from repository.lexical_index import LexicalIndex
+
+
+def synthetic_chunks(n, terms_per_chunk, vocabulary, rng, batch=10_000):
+    words = np.array([f"w{i}" for i in range(vocabulary)])
+    # Word frequencies in text follow a Zipf law: a handful of very common words and a long tail.
+    probabilities = 1.0 / np.arange(1, vocabulary + 1)
+    probabilities /= probabilities.sum()
+    for start in range(0, n, batch):
+        size = min(batch, n - start)
+        ids = rng.choice(vocabulary, size=(size, terms_per_chunk), p=probabilities)
+        for row, chunk in enumerate(words[ids]):
+            yield " ".join(chunk) + f" part XR-{start + row}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chunks", type=int, default=1_000_000)
+    parser.add_argument("--terms-per-chunk", type=int, default=100)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=32)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    index = LexicalIndex()
+    start = time.perf_counter()
+    batch = []
+    for chunk in synthetic_chunks(args.chunks, args.terms_per_chunk, args.vocabulary, rng):
+        batch.append(chunk)
+        if len(batch) == 10_000:
+            index.add(batch)
+            batch = []
+    index.add(batch)
+    build_seconds = time.perf_counter() - start
+
+    # A few common words, a rarer one and an identifier, like "how do I replace the seal of XR-1234".
+    queries = [f"w1 w5 w{rng.integers(100, args.vocabulary)} xr-{rng.integers(args.chunks)}"
+               for _ in range(args.queries)]
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        rows, _ = index.search(query, args.k)
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+
+    buffer = io.BytesIO()
+    index.dump(buffer)
+    print(json.dumps({
+        "chunks": args.chunks,
+        "build_seconds": round(build_seconds, 2),
+        "chunks_per_sec": round(args.chunks / build_seconds, 1),
+        "terms": len(index._postings),
+        "p50_ms": round(float(np.percentile(timings, 50)), 3),
+        "p99_ms": round(float(np.percentile(timings, 99)), 3),
+        "dump_mb": round(buffer.tell() / 2 ** 20, 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
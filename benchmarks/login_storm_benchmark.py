@@ -0,0 +1,109 @@
+"""
+/chat latency during a login storm, with passwords hashed inline on the event loop or in the hasher's pool.
+
+Serves /login through UserService and a stand-in /chat that authenticates its request and waits
+--chat-latency-ms, as if for the LLM, from one event loop. /chat requests arrive every --chat-interval-ms
+for as long as --logins concurrent logins take, and the p50/p99 of /chat and the login throughput are
+reported for each mode.
+
+Usage:
+    python -m benchmarks.login_storm_benchmark --logins 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import httpx
+import numpy as np
+from fastapi import Body, Depends, FastAPI
+
+from service.password_hasher import PasswordHasher
+from service.user_service import UserService
+from utils.get_current_user import CurrentUser
+
+
+def create_app(user_service, chat_latency):
+    app = FastAPI()
+    current_user = CurrentUser(user_service)
+
+    @app.post("/login")
+    async def login(username: str = Body(...), password: str = Body(...)):
+        return await user_service.login(username, password)
+
+    @app.post("/chat")
+    async def chat(username: str = Depends(current_user)):
+        await asyncio.sleep(chat_latency)
+        return {"response": f"Hello {username}"}
+
+    return app
+
+
+async def run(workers, args):
+    hasher = PasswordHasher(n=args.scrypt_n, workers=workers, max_pending=args.logins + 1)
+    user_service = UserService(password_hasher=hasher)
+    for i in range(args.logins):
+        await user_service.register(f"user{i}", "password")
+    await user_service.register("chatter", "password")
+    token = (await user_service.login("chatter", "password"))["token"]
+    app = create_app(user_service, args.chat_latency_ms / 1000)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        async def login(i):
+            response = await client.post("/login", json={"username": f"user{i}", "password": "password"})
+            response.raise_for_status()
+
+        async def chat(scheduled):
+            response = await client.post("/chat", headers={"Authorization": f"Bearer {token}"})
+            response.raise_for_status()
+            # Measured from when the request was due, so a stalled event loop cannot hide its own delay.
+            return time.perf_counter() - scheduled
+
+        async def chat_stream(storm):
+            # Requests arrive at a fixed rate, each on its own, until the storm is over.
+            chats = []
+            start = time.perf_counter()
+            while True:
+                # Every request that fell due while the event loop was busy is sent now.
+                while (scheduled := start + len(chats) * args.chat_interval_ms / 1000) <= time.perf_counter():
+                    chats.append(asyncio.ensure_future(chat(scheduled)))
+                if storm.done():
+                    break
+                await asyncio.sleep(scheduled - time.perf_counter())
+            return await asyncio.gather(*chats)
+
+        start = time.perf_counter()
+        storm = asyncio.ensure_future(asyncio.gather(*[login(i) for i in range(args.logins)]))
+        timings = np.array(await chat_stream(storm)) * 1000
+        await storm
+        login_seconds = time.perf_counter() - start
+    hasher.close()
+    return {
+        "workers": workers,
+        "logins_per_sec": round(args.logins / login_seconds, 1),
+        "chats": len(timings),
+        "chat_p50_ms": round(float(np.percentile(timings, 50)), 2),
+        "chat_p99_ms": round(float(np.percentile(timings, 99)), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--chat-latency-ms", type=float, default=5)
+    parser.add_argument("--chat-interval-ms", type=float, default=2)
+    parser.add_argument("--scrypt-n", type=int, default=2 ** 15)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    print(json.dumps({
+        "logins": args.logins,
+        "scrypt_n": args.scrypt_n,
+        "inline": asyncio.run(run(0, args)),
+        "pool": asyncio.run(run(args.workers, args)),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+End-to-end performance of the application, offline, compared against a stored baseline.
+
+Starts benchmarks.fake_openai in a subprocess and points the application at it, with all its data in a
+temporary directory, then drives the real app in-process through ASGI:
+
+- ingest: uploads a synthetic PDF of each of --pdf-pages sizes to /process-document and polls /jobs until it
+  is indexed; reports pages/sec and chunks/sec from upload to indexed.
+- chat: sends --chat-requests distinct questions about those documents to /chat from --concurrency users;
+  reports requests/sec and the p50/p95/p99 latency.
+- faiss: searches indexes of each of --corpus-sizes random vectors the way retrieval does; reports the
+  p50/p99 latency per query.
+- memory: the peak resident memory of the process after each phase, and of the largest PDF worker.
+
+Metrics ending in _per_sec are better higher, those ending in _ms or _mb better lower. Each is compared with
+the baseline, and the run fails if any is worse by more than --tolerance; regenerate the baseline with
+--update-baseline on the reference machine whenever performance changes on purpose. tiktoken downloads its
+encodings on first use, so without a cached copy a word-level tokenizer stands in, which changes the chunk
+counts; the tokenizer used is part of the run's config and only runs with the same config are compared.
+
+Usage:
+    python -m benchmarks.offline_suite --output results.json
+    python -m benchmarks.offline_suite --update-baseline
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+import pymupdf
+
+from benchmarks.worker_scaling_benchmark import free_port
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def use_offline_tokenizer_if_needed():
+    """
+    Make tiktoken fall back to a word-level encoding if its own cannot be loaded without the network.
+
+    Returns:
+        str: "tiktoken" or "offline", the tokenizer in use.
+    """
+    import tiktoken
+    try:
+        tiktoken.get_encoding("cl100k_base")
+        return "tiktoken"
+    except Exception:
+        from tests.fake_encoding import FakeEncoding
+        encoding = FakeEncoding()
+        tiktoken.get_encoding = lambda name: encoding
+        tiktoken.encoding_for_model = lambda model: encoding
+        return "offline"
+
+
+def vocabulary(size=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    syllables = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "po", "qua", "dri", "fen", "gor", "hul"]
+    return ["".join(rng.choice(syllables, size=rng.integers(2, 5))) for _ in range(size)]
+
+
+def build_pdf(path, pages, words, seed, lines_per_page=40, words_per_line=12):
+    rng = np.random.default_rng(seed)
+    document = pymupdf.open()
+    for _ in range(pages):
+        page = document.new_page()
+        text = "\n".join(" ".join(rng.choice(words, size=words_per_line)) for _ in range(lines_per_page))
+        page.insert_text((36, 36), text, fontsize=8)
+    document.save(path)
+    document.close()
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+
+
+def peak_worker_rss_mb():
+    # The PDF workers are still alive, so their high-water mark is read from /proc rather than from rusage.
+    peaks = []
+    for child in multiprocessing.active_children():
+        try:
+            with open(f"/proc/{child.pid}/status") as status:
+                peaks.extend(int(line.split()[1]) // 1024 for line in status if line.startswith("VmHWM:"))
+        except OSError:
+            pass
+    return max(peaks, default=None)
+
+
+def percentiles(timings):
+    timings = np.array(timings) * 1000
+    return {f"p{p}_ms": round(float(np.percentile(timings, p)), 2) for p in (50, 95, 99)}
+
+
+async def ingest(client, headers, args, words, tmp_dir):
+    results = {}
+    for i, pages in enumerate(args.pdf_pages):
+        path = os.path.join(tmp_dir, f"synthetic-{pages}.pdf")
+        build_pdf(path, pages, words, seed=i)
+        start = time.perf_counter()
+        with open(path, "rb") as f:
+            response = await client.post("/process-document", headers=headers,
+                                         files={"file": (os.path.basename(path), f, "application/pdf")})
+        response.raise_for_status()
+        job_id = response.json()["id"]
+        while True:
+            job = (await client.get(f"/jobs/{job_id}", headers=headers)).json()
+            if job["status"] in ("done", "failed"):
+                break
+            await asyncio.sleep(0.05)
+        seconds = time.perf_counter() - start
+        if job["status"] != "done":
+            raise RuntimeError(f"Ingesting {pages} pages failed: {job.get('error')}")
+        results[f"{pages}_pages"] = {
+            "seconds": round(seconds, 3),
+            "pages_per_sec": round(pages / seconds, 1),
+            "chunks_per_sec": round(job["chunks_total"] / seconds, 1),
+        }
+    return results
+
+
+async def chat(client, headers, args, words):
+    rng = np.random.default_rng(1)
+    questions = iter([" ".join(rng.choice(words, size=8)) for _ in range(args.chat_requests)])
+    timings = []
+
+    async def user(conversation_id):
+        for question in questions:
+            start = time.perf_counter()
+            response = await client.post("/chat", headers=headers, json=question,
+                                          params={"conversation_id": conversation_id})
+            response.raise_for_status()
+            timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[user(str(i)) for i in range(args.concurrency)])
+    elapsed = time.perf_counter() - start
+    return {"requests_per_sec": round(len(timings) / elapsed, 1), **percentiles(timings)}
+
+
+def faiss_search(args):
+    from config import CONTEXT_FETCH_K, EMBEDDING_DIMENSION, INDEX_EF_SEARCH, INDEX_NPROBE, INDEX_TYPE
+    from repository.ann_index import create_index, requires_training, search, with_ids
+
+    rng = np.random.default_rng(2)
+    queries = rng.standard_normal((args.queries, EMBEDDING_DIMENSION), dtype="float32")
+    results = {}
+    for size in args.corpus_sizes:
+        vectors = rng.standard_normal((size, EMBEDDING_DIMENSION), dtype="float32")
+        # IVF needs about 39 training vectors per cell.
+        index = with_ids(create_index(INDEX_TYPE, EMBEDDING_DIMENSION, nlist=max(1, min(1024, size // 39))))
+        if requires_training(INDEX_TYPE):
+            index.train(vectors)
+        index.add_with_ids(vectors, np.arange(size, dtype="int64"))
+        del vectors
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            search(index, query[None, :], CONTEXT_FETCH_K, nprobe=INDEX_NPROBE, ef_search=INDEX_EF_SEARCH)
+            timings.append(time.perf_counter() - start)
+        del index
+        results[f"{size}_vectors"] = {k: v for k, v in percentiles(timings).items() if k != "p95_ms"}
+    return results
+
+
+async def run_app(args, words, tmp_dir):
+    from main import app
+    from utils.metrics import STAGE_SECONDS
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test",
+                                     timeout=600) as client:
+            credentials = {"username": "benchmark", "password": "benchmark"}
+            (await client.post("/register", json=credentials)).raise_for_status()
+            response = await client.post("/login", json=credentials)
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['token']}"}
+            results["memory"] = {"startup_peak_rss_mb": peak_rss_mb()}
+
+            results["ingest"] = await ingest(client, headers, args, words, tmp_dir)
+            results["memory"]["ingest_peak_rss_mb"] = peak_rss_mb()
+            results["memory"]["peak_worker_rss_mb"] = peak_worker_rss_mb()
+
+            results["chat"] = await chat(client, headers, args, words)
+            results["memory"]["chat_peak_rss_mb"] = peak_rss_mb()
+    stages = {}
+    for stage in ("auth", "query_embed", "faiss_search", "context_build", "llm_call", "pdf_extract", "chunk",
+                  "embed", "index_add"):
+        snapshot = STAGE_SECONDS.snapshot(stage=stage)
+        if snapshot["count"]:
+            stages[stage] = round(snapshot["sum"] / snapshot["count"] * 1000, 3)
+    return results, stages
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif value is not None:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(metrics, baseline, tolerance):
+    """
+    Compare metrics with their baseline values.
+
+    Args:
+        metrics (dict): The run's metrics.
+        baseline (dict): The baseline's metrics.
+        tolerance (float): Largest relative change for the worse that is not a regression.
+
+    Returns:
+        dict: For each metric in both, its baseline value, the relative change and whether it regressed.
+    """
+    comparison = {}
+    for name, value in flatten(metrics).items():
+        base = flatten(baseline).get(name)
+        if name.endswith("_per_sec"):
+            higher_is_better = True
+        elif name.endswith(("_ms", "_mb")):
+            higher_is_better = False
+        else:
+            continue
+        if not base:
+            continue
+        change = (value - base) / base
+        comparison[name] = {
+            "baseline": base,
+            "value": value,
+            "change": round(change, 3),
+            "regressed": -change > tolerance if higher_is_better else change > tolerance,
+        }
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pdf-pages", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--chat-requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--chat-latency-ms", type=float, default=50)
+    parser.add_argument("--corpus-sizes", type=int, nargs="+", default=[1000, 10_000, 50_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--output", help="Where to write the results; printed if omitted.")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    tokenizer = use_offline_tokenizer_if_needed()
+    config = {key: getattr(args, key) for key in ("pdf_pages", "chat_requests", "concurrency", "chat_latency_ms",
+                                                  "corpus_sizes", "queries")}
+    config["tokenizer"] = tokenizer
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.fake_openai", "--port", str(port),
+                               "--chat-latency-ms", str(args.chat_latency_ms)])
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Read by config when the app is imported, so the run touches neither real data nor the network.
+            os.environ.update({
+                "OPENAI_BASE_URL": f"http://127.0.0.1:{port}/v1",
+                "UPLOAD_DIR": os.path.join(tmp_dir, "document_library"),
+                "INDEX_DIR": os.path.join(tmp_dir, "index_store"),
+                "CACHE_DIR": os.path.join(tmp_dir, "cache"),
+                "DATA_DIR": os.path.join(tmp_dir, "data"),
+                "USER_DB_PATH": os.path.join(tmp_dir, "data", "users.sqlite3"),
+                "SESSION_SPILL_PATH": os.path.join(tmp_dir, "data", "sessions.sqlite3"),
+            })
+            wait_until_up(port)
+            metrics, stages = asyncio.run(run_app(args, vocabulary(), tmp_dir))
+    finally:
+        server.terminate()
+        server.wait()
+    metrics["faiss"] = faiss_search(args)
+    metrics["memory"]["faiss_peak_rss_mb"] = peak_rss_mb()
+
+    results = {
+        "config": config,
+        "environment": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "metrics": metrics,
+        "stage_means_ms": stages,
+    }
+    regressed = []
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({key: results[key] for key in ("config", "environment", "metrics")}, f, indent=2)
+            f.write("\n")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["config"] == config:
+            results["comparison"] = compare(metrics, baseline["metrics"], args.tolerance)
+            regressed = [name for name, result in results["comparison"].items() if result["regressed"]]
+        else:
+            results["comparison"] = f"Not compared, the baseline was run with {baseline['config']}"
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    if regressed:
+        sys.exit(f"Regressed by more than {args.tolerance:.0%}: {', '.join(regressed)}")
+
+
+def wait_until_up(port):
+    for _ in range(200):
+        try:
+            httpx.post(f"http://127.0.0.1:{port}/v1/embeddings", json={"model": "fake", "input": ["up"]})
+            return
+        except httpx.TransportError:
+            time.sleep(0.05)
+    raise RuntimeError("The fake OpenAI server did not start")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Throughput and peak memory of PDF text extraction, streamed page-parallel versus the previous sequential path.
+
+Generates a synthetic text PDF and extracts it in fresh subprocesses, either the previous way (upload read
+into memory, PyPDF2 page by page into one string that is then split) or through DocumentService.iter_pages
+(PyMuPDF on a process pool, pages streamed into the splitter). Reports pages/sec and the peak resident memory
+of the benchmark process and of its largest worker.
+
+Usage:
+    python -m benchmarks.pdf_extraction_benchmark --pages 1000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import pymupdf
+
+_RUNNER = """
+import asyncio, json, resource, shutil, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from langchain_text_splitters import CharacterTextSplitter
+# Imported up front in both modes so that the resident memory of the application itself is in both baselines.
+from service import document_service
+
+pdf_path, directory, mode = sys.argv[1], sys.argv[2], sys.argv[3]
+splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=0)
+start = time.perf_counter()
+if mode == "sequential":
+    from PyPDF2 import PdfReader
+    with open(pdf_path, "rb") as f:
+        contents = f.read()
+    with open(directory + "/temp.pdf", "wb") as f:
+        f.write(contents)
+    reader = PdfReader(directory + "/temp.pdf")
+    text = ""
+    for page in reader.pages:
+        text += page.extract_text()
+    pages = len(reader.pages)
+    chunks = len(splitter.split_text(text))
+else:
+    document_service.UPLOAD_DIR = directory
+    shutil.copyfile(pdf_path, document_service.DocumentService.source_path("doc"))
+
+    async def run():
+        service = document_service.DocumentService.__new__(document_service.DocumentService)
+        pages, chunks = 0, 0
+        with ProcessPoolExecutor() as executor:
+            async for page in service.iter_pages("doc", executor=executor):
+                pages += 1
+                chunks += len(splitter.split_text(page))
+        return pages, chunks
+
+    pages, chunks = asyncio.run(run())
+seconds = time.perf_counter() - start
+print(json.dumps({
+    "mode": mode,
+    "pages": pages,
+    "chunks": chunks,
+    "seconds": round(seconds, 3),
+    "pages_per_sec": round(pages / seconds, 1),
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024,
+    "peak_worker_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // 1024,
+}))
+"""
+
+
+def build_pdf(path, pages, lines_per_page=40):
+    document = pymupdf.open()
+    for number in range(pages):
+        page = document.new_page()
+        text = "\n".join(f"Page {number} line {line}: the quick brown fox jumps over the lazy dog."
+                         for line in range(lines_per_page))
+        page.insert_text((36, 36), text, fontsize=8)
+    document.save(path)
+    document.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        pdf_path = os.path.join(directory, "benchmark.pdf")
+        build_pdf(pdf_path, args.pages)
+        results = {"pages": args.pages, "file_mb": round(os.path.getsize(pdf_path) / 2 ** 20, 2)}
+        for mode in ("sequential", "streamed"):
+            output = subprocess.run([sys.executable, "-c", _RUNNER, pdf_path, directory, mode],
+                                    check=True, capture_output=True, text=True).stdout
+            results[mode] = json.loads(output.strip().splitlines()[-1])
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+How long the application takes to import, and to become ready to serve once launched.
+
+- import: runs `import main` in --runs fresh interpreters and reports the median seconds, which is what every
+  uvicorn worker and every test run pays before anything else.
+- ready: launches `uvicorn main:app` --runs times, with its data in a temporary directory and the OpenAI API
+  served by benchmarks.fake_openai, and polls /health/live and /health/ready. Reports the median seconds
+  from launch until each answers 200, and the import and startup seconds the app reports about itself.
+
+Usage:
+    python -m benchmarks.startup_benchmark --runs 5
+    python -m benchmarks.startup_benchmark --warm-connections 4
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.worker_scaling_benchmark import free_port
+
+IMPORT_MAIN = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def import_seconds():
+    output = subprocess.run([sys.executable, "-c", IMPORT_MAIN], check=True, capture_output=True, text=True)
+    return float(output.stdout.split()[-1])
+
+
+def launch(env):
+    """
+    Launch the app and poll its health probes until it is ready.
+
+    Returns:
+        dict: Seconds from launch until live and until ready, and the app's own import and startup seconds.
+    """
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+                               "--log-level", "warning"], env=env)
+    result = {}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+            while "ready_seconds" not in result:
+                if server.poll() is not None:
+                    raise RuntimeError("The app exited before it was ready")
+                try:
+                    if "live_seconds" not in result and client.get("/health/live").status_code == 200:
+                        result["live_seconds"] = time.perf_counter() - start
+                    response = client.get("/health/ready")
+                except httpx.TransportError:
+                    response = None
+                if response is not None and response.status_code == 200:
+                    result["ready_seconds"] = time.perf_counter() - start
+                    result["app_import_seconds"] = response.json()["import_seconds"]
+                    result["app_startup_seconds"] = response.json()["startup_seconds"]
+                else:
+                    time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+    return result
+
+
+def median(results, key):
+    return round(statistics.median(result[key] for result in results), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warm-connections", type=int, default=0)
+    parser.add_argument("--warm-tokenizers", action="store_true",
+                        help="Load the tiktoken encodings on startup; they are downloaded unless cached.")
+    args = parser.parse_args()
+
+    imports = [{"import_seconds": import_seconds()} for _ in range(args.runs)]
+
+    fake_port = free_port()
+    fake_openai = subprocess.Popen([sys.executable, "-m", "benchmarks.fake_openai", "--port", str(fake_port)])
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            env = dict(
+                os.environ,
+                OPENAI_BASE_URL=f"http://127.0.0.1:{fake_port}/v1",
+                UPLOAD_DIR=os.path.join(tmp_dir, "document_library"),
+                INDEX_DIR=os.path.join(tmp_dir, "index_store"),
+                CACHE_DIR=os.path.join(tmp_dir, "cache"),
+                DATA_DIR=os.path.join(tmp_dir, "data"),
+                USER_DB_PATH=os.path.join(tmp_dir, "data", "users.sqlite3"),
+                SESSION_SPILL_PATH=os.path.join(tmp_dir, "data", "sessions.sqlite3"),
+                STARTUP_WARM_TOKENIZERS=str(args.warm_tokenizers).lower(),
+                STARTUP_WARM_CONNECTIONS=str(args.warm_connections),
+            )
+            launches = [launch(env) for _ in range(args.runs)]
+    finally:
+        fake_openai.terminate()
+        fake_openai.wait()
+
+    print(json.dumps({
+        "runs": args.runs,
+        "warm_connections": args.warm_connections,
+        "warm_tokenizers": args.warm_tokenizers,
+        "import_seconds": median(imports, "import_seconds"),
+        **{key: median(launches, key) for key in ("live_seconds", "ready_seconds", "app_import_seconds",
+                                                   "app_startup_seconds")},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
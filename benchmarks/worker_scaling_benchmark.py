@@ -0,0 +1,142 @@
+"""
+/chat throughput with 1, 2 and 4 uvicorn workers sharing users and login sessions through SQLite.
+
+Each run starts `uvicorn --workers N` serving this module's app: /login through a UserService backed by
+SQLiteUserStore, and a stand-in /chat that authenticates its request, spends --chat-cpu-ms of CPU, as
+retrieval and context building do, then waits --chat-latency-ms, as if for the LLM. The client logs in on
+whichever worker takes the request and then sends /chat from --concurrency connections for --seconds;
+any worker may serve them, which only works because the session is shared. Reports requests per second
+and p50/p99 for each worker count, and the scaling efficiency against one worker.
+
+Usage:
+    python -m benchmarks.worker_scaling_benchmark --workers 1 2 4 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+from fastapi import Body, Depends, FastAPI
+
+from repository.user_store import SQLiteUserStore
+from service.password_hasher import PasswordHasher
+from service.user_service import UserService
+from utils.get_current_user import CurrentUser
+
+
+def create_app():
+    user_service = UserService(
+        store=SQLiteUserStore(os.environ["BENCHMARK_USER_DB"]),
+        password_hasher=PasswordHasher(n=2 ** 4, r=1, workers=0),
+    )
+    current_user = CurrentUser(user_service)
+    chat_cpu = float(os.environ.get("BENCHMARK_CHAT_CPU_MS", 5)) / 1000
+    chat_latency = float(os.environ.get("BENCHMARK_CHAT_LATENCY_MS", 20)) / 1000
+    app = FastAPI()
+
+    @app.post("/login")
+    async def login(username: str = Body(...), password: str = Body(...)):
+        return await user_service.login(username, password)
+
+    @app.post("/chat")
+    async def chat(username: str = Depends(current_user)):
+        deadline = time.process_time() + chat_cpu
+        while time.process_time() < deadline:
+            pass
+        await asyncio.sleep(chat_latency)
+        return {"response": f"Hello {username}"}
+
+    return app
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_up(client):
+    for _ in range(200):
+        try:
+            await client.post("/chat")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("The server did not start")
+
+
+async def load(base_url, args):
+    async with httpx.AsyncClient(base_url=base_url, timeout=60,
+                                 limits=httpx.Limits(max_connections=args.concurrency)) as client:
+        await wait_until_up(client)
+        response = await client.post("/login", json={"username": "alice", "password": "password"})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['token']}"}
+        timings = []
+        deadline = time.perf_counter() + args.seconds
+
+        async def user():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = await client.post("/chat", headers=headers)
+                response.raise_for_status()
+                timings.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[user() for _ in range(args.concurrency)])
+        elapsed = time.perf_counter() - start
+    timings = np.array(timings) * 1000
+    return {
+        "requests_per_sec": round(len(timings) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(timings, 50)), 2),
+        "p99_ms": round(float(np.percentile(timings, 99)), 2),
+    }
+
+
+def run(workers, user_db, args):
+    port = free_port()
+    env = dict(os.environ, BENCHMARK_USER_DB=user_db, BENCHMARK_CHAT_CPU_MS=str(args.chat_cpu_ms),
+               BENCHMARK_CHAT_LATENCY_MS=str(args.chat_latency_ms))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.worker_scaling_benchmark:create_app", "--factory",
+         "--workers", str(workers), "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        return {"workers": workers, **asyncio.run(load(f"http://127.0.0.1:{port}", args))}
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--chat-cpu-ms", type=float, default=5)
+    parser.add_argument("--chat-latency-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        user_db = os.path.join(tmp_dir, "users.sqlite3")
+        store = SQLiteUserStore(user_db)
+        store.add_user("alice", asyncio.run(PasswordHasher(n=2 ** 4, r=1, workers=0).hash("password")))
+        store.close()
+        results = [run(workers, user_db, args) for workers in args.workers]
+
+    baseline = results[0]["requests_per_sec"] / results[0]["workers"]
+    for result in results:
+        result["scaling_efficiency"] = round(result["requests_per_sec"] / (baseline * result["workers"]), 2)
+    print(json.dumps({"cpus": os.cpu_count(), "chat_cpu_ms": args.chat_cpu_ms, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import asyncio
+
+from langchain_core.embeddings import Embeddings
+
+from repository.embedding_cache import cache_key
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that consults a content-addressed cache before calling the underlying model.
+
+    Only texts missing from the cache are sent to the model, each distinct text once, and their
+    vectors are written back to the cache. Document and query embeddings share the same cache.
+
+    Args:
+        embeddings (Embeddings): The underlying embedding model, e.g. OpenAIEmbeddings.
+        cache (EmbeddingCache): The persistent embedding cache.
+        model (str): Model name used in the cache key.
+    """
+
+    def __init__(self, embeddings, cache, model):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model
+
+    def embed_documents(self, texts):
+        keys = [cache_key(self.model, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+        missing = self._missing_texts(keys, texts, vectors)
+        if missing:
+            new_vectors = dict(zip(missing, self.embeddings.embed_documents(list(missing.values()))))
+            self.cache.put_many(new_vectors)
+            vectors.update(new_vectors)
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        vectors, _ = await self.aembed_documents_with_stats(texts)
+        return vectors
+
+    async def aembed_query(self, text):
+        vectors = await self.aembed_documents([text])
+        return vectors[0]
+
+    async def aembed_documents_with_stats(self, texts, progress=None):
+        """
+        Embed documents and report how many of them were served from the cache.
+
+        Args:
+            texts (list[str]): The texts to embed.
+            progress (callable, optional): Called with the number of texts embedded so far.
+
+        Returns:
+            tuple: (vectors, stats) where stats holds the cache hits, merged with the throughput stats
+                of the underlying model for the missing texts when it reports them.
+        """
+        keys = [cache_key(self.model, text) for text in texts]
+        vectors = await asyncio.to_thread(self.cache.get_many, keys)
+        stats = {"cache_hits": sum(1 for key in keys if key in vectors)}
+        if progress:
+            progress(stats["cache_hits"])
+        missing = self._missing_texts(keys, texts, vectors)
+        if missing:
+            missing_texts = list(missing.values())
+            if hasattr(self.embeddings, "aembed_documents_with_stats"):
+                embedded, embed_stats = await self.embeddings.aembed_documents_with_stats(
+                    missing_texts, progress=(lambda done: progress(stats["cache_hits"] + done)) if progress else None)
+                stats.update(embed_stats)
+            else:
+                embedded = await self.embeddings.aembed_documents(missing_texts)
+            new_vectors = dict(zip(missing, embedded))
+            await asyncio.to_thread(self.cache.put_many, new_vectors)
+            vectors.update(new_vectors)
+        if progress:
+            progress(len(texts))
+        return [vectors[key] for key in keys], stats
+
+    @staticmethod
+    def _missing_texts(keys, texts, vectors):
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+        return missing
@@ -0,0 +1,190 @@
+import asyncio
+import random
+import time
+
+import openai
+from langchain_core.embeddings import Embeddings
+
+from utils.logger import logger
+from utils.tokenizer import get_encoding
+
+# Per-request limits of the OpenAI embeddings endpoint.
+MAX_INPUT_TOKENS = 8191
+MAX_REQUEST_TOKENS = 300_000
+MAX_REQUEST_INPUTS = 2048
+
+_RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Embedding pipeline stage for the OpenAI embeddings API.
+
+    Texts are packed, in order, into batches bounded by their tiktoken token count and by the number of
+    inputs per request. Batches are sent concurrently under a semaphore, and rate limits or transient
+    errors are retried with exponential backoff and full jitter, honouring Retry-After when present.
+
+    Args:
+        async_client (AsyncOpenAI): Shared async OpenAI client.
+        client (OpenAI): Sync OpenAI client, used by the synchronous langchain entry points.
+        model (str): Embedding model name.
+        max_batch_tokens (int): Maximum tokens per request, capped at the API limit.
+        max_batch_inputs (int): Maximum inputs per request, capped at the API limit.
+        max_concurrency (int): Maximum number of batches in flight.
+        max_retries (int): Retries per batch before giving up.
+        base_delay (float): Initial backoff in seconds.
+        max_delay (float): Upper bound of a single backoff in seconds.
+        encoding (tiktoken.Encoding, optional): Tokenizer override; defaults to the model's encoding,
+            loaded on first use.
+    """
+
+    def __init__(self, async_client, client, model="text-embedding-ada-002", max_batch_tokens=MAX_REQUEST_TOKENS,
+                 max_batch_inputs=MAX_REQUEST_INPUTS, max_concurrency=4, max_retries=6, base_delay=0.5,
+                 max_delay=30.0, encoding=None):
+        # Retries are handled here, with jitter, instead of by the OpenAI client.
+        self.async_client = async_client.with_options(max_retries=0)
+        self.client = client.with_options(max_retries=0)
+        self.model = model
+        self.max_batch_tokens = min(max_batch_tokens, MAX_REQUEST_TOKENS)
+        self.max_batch_inputs = min(max_batch_inputs, MAX_REQUEST_INPUTS)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._encoding = encoding
+
+    @property
+    def encoding(self):
+        if self._encoding is None:
+            self._encoding = get_encoding(self.model)
+        return self._encoding
+
+    def embed_documents(self, texts):
+        inputs, batches = self._prepare(texts)
+        vectors = []
+        for start, end in batches:
+            vectors.extend(self._embed_batch_sync(inputs[start:end]))
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        vectors, _ = await self.aembed_documents_with_stats(texts)
+        return vectors
+
+    async def aembed_query(self, text):
+        vectors = await self.aembed_documents([text])
+        return vectors[0]
+
+    async def aembed_documents_with_stats(self, texts, progress=None):
+        """
+        Embed documents concurrently and report the throughput of the call.
+
+        Args:
+            texts (list[str]): The texts to embed.
+            progress (callable, optional): Called with the number of texts embedded so far as batches finish.
+
+        Returns:
+            tuple: (vectors, stats) where stats holds the number of texts, tokens and batches,
+                the elapsed seconds, and chunks/sec and tokens/sec.
+        """
+        start = time.perf_counter()
+        inputs, batches, tokens = await asyncio.to_thread(self._prepare_with_tokens, texts)
+        tasks = [asyncio.ensure_future(self._embed_batch(inputs[begin:end])) for begin, end in batches]
+        try:
+            done = 0
+            for task in asyncio.as_completed(tasks):
+                done += len(await task)
+                if progress:
+                    progress(done)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        results = [task.result() for task in tasks]
+        elapsed = time.perf_counter() - start
+
+        stats = {
+            "chunks": len(texts),
+            "tokens": tokens,
+            "batches": len(batches),
+            "seconds": round(elapsed, 3),
+            "chunks_per_sec": round(len(texts) / elapsed, 2) if elapsed > 0 else None,
+            "tokens_per_sec": round(tokens / elapsed, 2) if elapsed > 0 else None,
+        }
+        logger.info(f"Embedded {stats}")
+        return [vector for batch in results for vector in batch], stats
+
+    def batch_ranges(self, token_counts):
+        """
+        Pack consecutive texts into batches within the token and input limits.
+
+        Args:
+            token_counts (list[int]): Token count of each text.
+
+        Returns:
+            list[tuple]: (start, end) slices of the input, in order.
+        """
+        batches = []
+        start, batch_tokens = 0, 0
+        for i, count in enumerate(token_counts):
+            if i > start and (batch_tokens + count > self.max_batch_tokens or i - start >= self.max_batch_inputs):
+                batches.append((start, i))
+                start, batch_tokens = i, 0
+            batch_tokens += count
+        if start < len(token_counts):
+            batches.append((start, len(token_counts)))
+        return batches
+
+    def _prepare(self, texts):
+        inputs, batches, _ = self._prepare_with_tokens(texts)
+        return inputs, batches
+
+    def _prepare_with_tokens(self, texts):
+        encoded = self.encoding.encode_ordinary_batch(list(texts))
+        inputs = [
+            self.encoding.decode(tokens[:MAX_INPUT_TOKENS]) if len(tokens) > MAX_INPUT_TOKENS else text
+            for text, tokens in zip(texts, encoded)
+        ]
+        token_counts = [min(len(tokens), MAX_INPUT_TOKENS) for tokens in encoded]
+        return inputs, self.batch_ranges(token_counts), sum(token_counts)
+
+    async def _embed_batch(self, inputs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.semaphore:
+                    response = await self.async_client.embeddings.create(model=self.model, input=inputs)
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            except _RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise e
+                delay = self._backoff(attempt, e)
+                logger.info(f"Embedding batch failed with {type(e).__name__}, retrying in {delay:.2f}s")
+            # The backoff waits without a request slot, so that the other batches keep the API busy meanwhile.
+            await asyncio.sleep(delay)
+
+    def _embed_batch_sync(self, inputs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.client.embeddings.create(model=self.model, input=inputs)
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            except _RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise e
+                time.sleep(self._backoff(attempt, e))
+
+    def _backoff(self, attempt, error):
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_delay)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
@@ -1,4 +1,44 @@
-from openai import OpenAI
+import asyncio
+import time
+
+import httpx
+from openai import AsyncOpenAI
+
+from utils.metrics import STAGE_SECONDS, TOKENS, stage_timer
+
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_MAX_CONCURRENCY = 64
+
+
+def create_async_openai(api_key, base_url=None, timeout=DEFAULT_TIMEOUT,
+                        max_connections=DEFAULT_MAX_CONNECTIONS,
+                        max_keepalive_connections=DEFAULT_MAX_KEEPALIVE_CONNECTIONS):
+    """
+    Create an AsyncOpenAI client backed by a pooled httpx connection.
+
+    The returned client is meant to be shared across the application so that every chat and
+    embedding call reuses the same keep-alive connections instead of opening new ones.
+
+    Args:
+        api_key (str): The API key for accessing the OpenAI API.
+        base_url (str, optional): Override for the API base URL, e.g. a local fake server.
+        timeout (float): Request timeout in seconds.
+        max_connections (int): Maximum number of open connections in the pool.
+        max_keepalive_connections (int): Maximum number of idle connections kept alive.
+
+    Returns:
+        AsyncOpenAI: The configured async client.
+    """
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        ),
+        timeout=httpx.Timeout(timeout),
+    )
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout, http_client=http_client)
 
 
 class OpenAIClient:
@@ -9,25 +49,33 @@ class OpenAIClient:
 
     Args:
         api_key (str): The API key for accessing the OpenAI API.
+        client (AsyncOpenAI, optional): A shared async client to reuse instead of creating a new one.
+        max_concurrency (int): Maximum number of chat completions in flight at once.
     """
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, client=None, max_concurrency=DEFAULT_MAX_CONCURRENCY):
         """
         Initializes the OpenAIClient.
 
-        Initializes the OpenAI client with the provided API key and sets default temperature for text generation.
+        Initializes the async OpenAI client with the provided API key and sets default temperature for text
+        generation. Chat calls are bounded by a semaphore so a burst of requests cannot exhaust the pool.
 
         Args:
             api_key (str): The API key for accessing the OpenAI API.
+            client (AsyncOpenAI, optional): A shared async client to reuse instead of creating a new one.
+            max_concurrency (int): Maximum number of chat completions in flight at once.
         """
-        self.client = OpenAI(api_key=api_key)
+        self.client = client or create_async_openai(api_key)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.MODEL = "gpt-3.5-turbo"
         self.TEMPERATURE = 1.0
 
     async def get_chat_response(self, prompt_message):
         """
         Get response from the chat model.
 
-        Generates a response from the chat model based on the provided prompt message.
+        Generates a response from the chat model based on the provided prompt message. The call is timed as
+        the "llm_call" stage, and the prompt and completion tokens the API reports are counted.
 
         Args:
             prompt_message (str): The prompt message for generating the response.
@@ -39,16 +87,54 @@ class OpenAIClient:
             Exception: If there's an error during response generation.
         """
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=prompt_message,
-                # temperature=self.TEMPERATURE,
-                # max_tokens=20,
-            )
+            with stage_timer("llm_call"):
+                async with self.semaphore:
+                    response = await self.client.chat.completions.create(
+                        model=self.MODEL,
+                        messages=prompt_message,
+                        # temperature=self.TEMPERATURE,
+                        # max_tokens=20,
+                    )
+            if response.usage is not None:
+                TOKENS.inc(response.usage.prompt_tokens, kind="prompt")
+                TOKENS.inc(response.usage.completion_tokens, kind="completion")
             return response.choices[0].message.content
         except Exception as e:
             raise e
 
+    async def stream_chat_response(self, prompt_message):
+        """
+        Stream response from the chat model.
+
+        Requests a streamed completion and yields the content of each delta as soon as it arrives. The wait
+        for the first delta is timed as the "llm_first_token" stage and the whole stream as "llm_call"; each
+        delta carries roughly one token, so the deltas are counted as completion tokens.
+
+        Args:
+            prompt_message (list): The prompt messages for generating the response.
+
+        Yields:
+            str: The next piece of generated text.
+        """
+        start = time.perf_counter()
+        deltas = 0
+        try:
+            async with self.semaphore:
+                stream = await self.client.chat.completions.create(
+                    model=self.MODEL,
+                    messages=prompt_message,
+                    stream=True,
+                )
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if deltas == 0:
+                            STAGE_SECONDS.observe(time.perf_counter() - start, stage="llm_first_token")
+                        deltas += 1
+                        yield chunk.choices[0].delta.content
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage="llm_call")
+            TOKENS.inc(deltas, kind="completion")
+
     def get_prompt(self, query):
         """
         Get a prompt for processing query correctly for GPT API.
@@ -83,6 +169,21 @@ class OpenAIClient:
             "content": context
         }
 
+    def get_prompt_for_response(self, response):
+        """
+        Get a prompt for storing a model response in the conversation history.
+
+        Args:
+            response (str): The text generated by the model.
+
+        Returns:
+            dict: The prompt for the response.
+        """
+        return {
+            "role": "assistant",
+            "content": response
+        }
+
     def get_refined_query(self, query):
         """
         Refine the query for better search results.
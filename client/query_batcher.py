@@ -0,0 +1,146 @@
+import asyncio
+import bisect
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class QueryBatcher(Embeddings):
+    """
+    Embeddings wrapper that coalesces concurrent query embeddings into batched calls.
+
+    Queries arriving within window seconds of the first one of a batch, up to max_batch_size of them,
+    are embedded together with a single aembed_documents call on the underlying model and each result is
+    handed back to its caller. A query identical to one that is already waiting or in flight shares its
+    result instead of being embedded again. Documents are passed straight through.
+
+    Args:
+        embeddings (Embeddings): The underlying embedding model, e.g. CachedEmbeddings.
+        window (float): Seconds to wait for more queries after the first one of a batch.
+        max_batch_size (int): Number of distinct queries that sends a batch without waiting.
+        buckets (tuple[int]): Upper bounds of the batch size histogram.
+    """
+
+    def __init__(self, embeddings, window=0.005, max_batch_size=64, buckets=DEFAULT_BUCKETS):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.embeddings = embeddings
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.buckets = tuple(sorted(buckets))
+        self.queries = 0
+        self.deduplicated = 0
+        self.batches = 0
+        # Distinct queries sent in batches, i.e. the sum of the batch sizes.
+        self.batched = 0
+        self._histogram = [0] * (len(self.buckets) + 1)
+        # text -> future of its vector, for queries waiting in the current batch or in flight.
+        self._futures = {}
+        self._batch = []
+        self._timer = None
+        self._tasks = set()
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts):
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_documents_with_stats(self, texts, progress=None):
+        if hasattr(self.embeddings, "aembed_documents_with_stats"):
+            return await self.embeddings.aembed_documents_with_stats(texts, progress=progress)
+        vectors = await self.embeddings.aembed_documents(texts)
+        if progress:
+            progress(len(texts))
+        return vectors, {}
+
+    async def aembed_query(self, text):
+        """
+        Embed a query as part of the next batch.
+
+        Args:
+            text (str): The query.
+
+        Returns:
+            list[float]: The embedding of the query.
+        """
+        self.queries += 1
+        future = self._futures.get(text)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[text] = loop.create_future()
+            # Keeps the exception of a batch nobody waits for any more from being reported as unretrieved.
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._batch.append(text)
+            if len(self._batch) >= self.max_batch_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._flush)
+        else:
+            self.deduplicated += 1
+        # A cancelled caller must not cancel the batch for the others waiting on the same query.
+        return await asyncio.shield(future)
+
+    def stats(self):
+        """
+        Report how well queries are being coalesced.
+
+        Returns:
+            dict: Number of queries, of queries served by an identical one in flight, of batches sent,
+                the mean batch size, and a histogram of batch sizes keyed by bucket upper bound.
+        """
+        labels = [str(bound) for bound in self.buckets] + ["+Inf"]
+        return {
+            "queries": self.queries,
+            "deduplicated": self.deduplicated,
+            "batches": self.batches,
+            "mean_batch_size": round((self.queries - self.deduplicated) / self.batches, 2) if self.batches else None,
+            "batch_size_histogram": dict(zip(labels, self._histogram)),
+        }
+
+    def batch_size_histogram(self):
+        """
+        Report the distribution of batch sizes, e.g. as the callback of a Histogram over the same buckets.
+
+        Returns:
+            list: The number of batches in each bucket, plus one for batches above the last bucket, then the
+                sum of the batch sizes.
+        """
+        return [*self._histogram, self.batched]
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._batch = self._batch, []
+        if batch:
+            self.batches += 1
+            self.batched += len(batch)
+            self._histogram[bisect.bisect_left(self.buckets, len(batch))] += 1
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, texts):
+        futures = [self._futures[text] for text in texts]
+        try:
+            vectors = await self.embeddings.aembed_documents(texts)
+        except asyncio.CancelledError:
+            for future in futures:
+                future.cancel()
+            raise
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for future, vector in zip(futures, vectors):
+                if not future.done():
+                    future.set_result(vector)
+        finally:
+            for text in texts:
+                self._futures.pop(text, None)
@@ -0,0 +1,240 @@
+import asyncio
+import os
+import time
+
+from openai import OpenAI
+
+from client.cached_embeddings import CachedEmbeddings
+from client.embedding_client import BatchedEmbeddings
+from client.openai_client import OpenAIClient, create_async_openai
+from client.query_batcher import QueryBatcher
+from config import (API_KEY, AUTH_CLAIMS_CACHE_SIZE, AUTH_SESSION_CACHE_TTL, AUTH_SESSION_SWEEP_INTERVAL, CACHE_DIR,
+                    DATA_DIR, EMBEDDING_BATCH_MAX_INPUTS, EMBEDDING_BATCH_MAX_TOKENS, EMBEDDING_CACHE_MAX_ENTRIES,
+                    EMBEDDING_DIMENSION, EMBEDDING_MAX_CONCURRENCY, EMBEDDING_MAX_RETRIES, EMBEDDING_MODEL, INDEX_DIR,
+                    INDEX_HNSW_M, INDEX_NLIST, INDEX_PQ_M, INDEX_SAVE_DEBOUNCE, INDEX_TRAIN_THRESHOLD, INDEX_TYPE,
+                    INGEST_HEARTBEAT_INTERVAL, INGEST_MAX_QUEUE_DEPTH, INGEST_PAGES_PER_TASK, INGEST_PROCESS_WORKERS,
+                    INGEST_STALE_AFTER, INGEST_WORKERS, METRICS_LOOP_LAG_INTERVAL, OPENAI_BASE_URL,
+                    OPENAI_MAX_CONCURRENCY, OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE_CONNECTIONS, OPENAI_TIMEOUT,
+                    PASSWORD_HASH_MAX_PENDING, PASSWORD_HASH_WORKERS, PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_P,
+                    PASSWORD_SCRYPT_R, QUERY_BATCH_MAX_SIZE, QUERY_BATCH_WINDOW_MS, RESPONSE_CACHE_MAX_ENTRIES,
+                    RESPONSE_CACHE_THRESHOLD, RESPONSE_CACHE_TTL,
+                    SESSION_MAX_CHARS, SESSION_MAX_MESSAGES, SESSION_MAX_SESSIONS, SESSION_SPILL_PATH, SESSION_TTL,
+                    SHARD_MEMORY_BUDGET_MB, STARTUP_PRELOAD_SHARDS, STARTUP_WARM_CONNECTIONS, STARTUP_WARM_TOKENIZERS,
+                    USER_DB_PATH, USER_DB_POOL_SIZE)
+from repository.ann_index import IndexMigrator, create_index, requires_training, with_ids
+from repository.document_catalog import DocumentCatalog
+from repository.embedding_cache import EmbeddingCache
+from repository.job_store import JobStore
+from repository.response_cache import ResponseCache
+from repository.session_store import SessionStore
+from repository.shard_store import ShardStore
+from repository.user_store import SQLiteUserStore
+from service.conversation_service import ConversationService
+from service.document_service import DocumentService
+from service.ingestion_service import IngestionService
+from service.password_hasher import PasswordHasher
+from service.user_service import UserService
+from utils.logger import logger
+from utils.metrics import EVENT_LOOP_LAG_SECONDS, EventLoopLagMonitor, registry
+from utils.tokenizer import get_encoding
+
+
+def create_empty_index():
+    index_type = "flat" if requires_training(INDEX_TYPE) else INDEX_TYPE
+    return with_ids(create_index(index_type, EMBEDDING_DIMENSION, hnsw_m=INDEX_HNSW_M))
+
+
+def create_index_migrator(index_store):
+    return IndexMigrator(
+        INDEX_TYPE,
+        EMBEDDING_DIMENSION,
+        index_store,
+        train_threshold=INDEX_TRAIN_THRESHOLD,
+        nlist=INDEX_NLIST,
+        pq_m=INDEX_PQ_M,
+        hnsw_m=INDEX_HNSW_M,
+    )
+
+
+class Container:
+    """
+    The clients, stores and services of the application, built once per process from the settings in config.
+
+    The app's lifespan builds the container in the process that serves, rather than at import, so importing
+    the app stays cheap and every router shares one OpenAI client, one embeddings pipeline and one set of
+    stores. start() runs the background tasks and warms what the first requests would otherwise pay for;
+    ready is True from then until stop() begins.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.openai_client = OpenAI(api_key=API_KEY, base_url=OPENAI_BASE_URL, timeout=OPENAI_TIMEOUT)
+        self.async_openai_client = create_async_openai(
+            API_KEY,
+            base_url=OPENAI_BASE_URL,
+            timeout=OPENAI_TIMEOUT,
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        )
+        self.open_ai_client = OpenAIClient(API_KEY, client=self.async_openai_client,
+                                           max_concurrency=OPENAI_MAX_CONCURRENCY)
+        self.openai_embeddings = BatchedEmbeddings(
+            self.async_openai_client,
+            self.openai_client,
+            model=EMBEDDING_MODEL,
+            max_batch_tokens=EMBEDDING_BATCH_MAX_TOKENS,
+            max_batch_inputs=EMBEDDING_BATCH_MAX_INPUTS,
+            max_concurrency=EMBEDDING_MAX_CONCURRENCY,
+            max_retries=EMBEDDING_MAX_RETRIES,
+        )
+        self.embedding_cache = EmbeddingCache(os.path.join(CACHE_DIR, "embeddings.sqlite3"),
+                                              max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+        self.embeddings = QueryBatcher(
+            CachedEmbeddings(self.openai_embeddings, self.embedding_cache, model=self.openai_embeddings.model),
+            window=QUERY_BATCH_WINDOW_MS / 1000,
+            max_batch_size=QUERY_BATCH_MAX_SIZE,
+        )
+        self.password_hasher = PasswordHasher(
+            n=PASSWORD_SCRYPT_N,
+            r=PASSWORD_SCRYPT_R,
+            p=PASSWORD_SCRYPT_P,
+            workers=PASSWORD_HASH_WORKERS,
+            max_pending=PASSWORD_HASH_MAX_PENDING,
+        )
+        self.user_store = SQLiteUserStore(
+            USER_DB_PATH,
+            pool_size=USER_DB_POOL_SIZE,
+            cache_size=AUTH_CLAIMS_CACHE_SIZE,
+            cache_ttl=AUTH_SESSION_CACHE_TTL,
+        )
+        self.user_service = UserService(claims_cache_size=AUTH_CLAIMS_CACHE_SIZE,
+                                        password_hasher=self.password_hasher, store=self.user_store)
+        self.job_store = JobStore(os.path.join(DATA_DIR, "jobs.sqlite3"))
+        self.document_catalog = DocumentCatalog(os.path.join(DATA_DIR, "documents.sqlite3"))
+        self.session_store = SessionStore(
+            max_sessions=SESSION_MAX_SESSIONS,
+            ttl=SESSION_TTL,
+            max_messages=SESSION_MAX_MESSAGES,
+            max_chars=SESSION_MAX_CHARS,
+            spill_path=SESSION_SPILL_PATH or None,
+        )
+        self.response_cache = ResponseCache(
+            EMBEDDING_DIMENSION,
+            threshold=RESPONSE_CACHE_THRESHOLD,
+            max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+            ttl=RESPONSE_CACHE_TTL,
+        )
+        self.shard_store = ShardStore(
+            os.path.join(INDEX_DIR, "shards"),
+            self.embeddings,
+            create_empty_index,
+            memory_budget=SHARD_MEMORY_BUDGET_MB * 2 ** 20,
+            debounce=INDEX_SAVE_DEBOUNCE,
+            create_migrator=create_index_migrator,
+        )
+        self.document_service = DocumentService(self.shard_store, self.embeddings, self.response_cache,
+                                                self.document_catalog)
+        self.ingestion_service = IngestionService(
+            self.document_service,
+            self.job_store,
+            max_queue_depth=INGEST_MAX_QUEUE_DEPTH,
+            workers=INGEST_WORKERS,
+            process_workers=INGEST_PROCESS_WORKERS,
+            pages_per_task=INGEST_PAGES_PER_TASK,
+            heartbeat_interval=INGEST_HEARTBEAT_INTERVAL,
+            stale_after=INGEST_STALE_AFTER,
+        )
+        self.conversation_service = ConversationService(self.session_store, self.response_cache, self.shard_store,
+                                                        self.open_ai_client)
+        self.loop_lag_monitor = EventLoopLagMonitor(EVENT_LOOP_LAG_SECONDS, interval=METRICS_LOOP_LAG_INTERVAL)
+        self._metrics = self._register_metrics()
+
+    async def start(self):
+        """
+        Start the background tasks and warm up, then report ready.
+        """
+        self.ingestion_service.start()
+        self.user_service.start_sweeper(AUTH_SESSION_SWEEP_INTERVAL)
+        self.loop_lag_monitor.start()
+        await self.warm()
+        self.ready = True
+
+    async def warm(self):
+        """
+        Load what the first requests would otherwise wait for: the tokenizers, the shards of the users most
+        likely to come back, and connections to the OpenAI API. Failures are logged, not raised, since each of
+        these is retried on first use anyway.
+        """
+        start = time.perf_counter()
+        if STARTUP_WARM_TOKENIZERS:
+            for model in (self.open_ai_client.MODEL, EMBEDDING_MODEL):
+                try:
+                    await asyncio.to_thread(get_encoding, model)
+                except Exception as e:
+                    logger.warning(f"Could not load the tokenizer of {model}: {e!r}")
+        if STARTUP_PRELOAD_SHARDS:
+            users = await asyncio.to_thread(self.user_store.recent_users, STARTUP_PRELOAD_SHARDS)
+            await self.shard_store.preload(users)
+        if STARTUP_WARM_CONNECTIONS:
+            # Any response, even an error, leaves its connection open in the pool for the requests to come.
+            results = await asyncio.gather(*[self.async_openai_client.models.list()
+                                             for _ in range(STARTUP_WARM_CONNECTIONS)], return_exceptions=True)
+            errors = [result for result in results if isinstance(result, Exception)]
+            if errors:
+                logger.warning(f"Warming connections to the OpenAI API: {errors[0]!r}")
+        logger.info(f"Warmed up in {time.perf_counter() - start:.3f}s: {self.shard_store.stats()['resident']} "
+                    f"shards loaded")
+
+    async def stop(self):
+        """
+        Report not ready, stop the background tasks, save the shards and release every client and store.
+        """
+        self.ready = False
+        await self.ingestion_service.stop()
+        await self.user_service.stop_sweeper()
+        await self.loop_lag_monitor.stop()
+        await self.shard_store.flush()
+        self.session_store.close()
+        self.document_catalog.close()
+        self.job_store.close()
+        self.embedding_cache.close()
+        self.password_hasher.close()
+        self.user_store.close()
+        await self.async_openai_client.close()
+        self.openai_client.close()
+        for metric in self._metrics:
+            registry.unregister(metric.name)
+
+    def _register_metrics(self):
+        # Counts the caches and stores already keep are read when /metrics is scraped, at no cost per request.
+        response_cache, embedding_cache, shard_store = self.response_cache, self.embedding_cache, self.shard_store
+        return [
+            registry.counter("rag_cache_hits_total", "Lookups served by a cache, by cache.", ("cache",),
+                             callback=lambda: {("response",): response_cache.hits,
+                                               ("embedding",): embedding_cache.hits, ("shard",): shard_store.hits}),
+            registry.counter("rag_cache_misses_total", "Lookups a cache could not serve, by cache.", ("cache",),
+                             callback=lambda: {("response",): response_cache.misses,
+                                               ("embedding",): embedding_cache.misses,
+                                               ("shard",): shard_store.loads}),
+            registry.gauge("rag_response_cache_entries", "Answers in the response cache.",
+                           callback=lambda: response_cache.stats()["entries"]),
+            registry.counter("rag_response_cache_latency_saved_seconds_total",
+                             "Seconds of model latency saved by answering from the response cache.",
+                             callback=lambda: response_cache.latency_saved),
+            registry.gauge("rag_shards_resident", "Index shards loaded in memory.",
+                           callback=lambda: shard_store.stats()["resident"]),
+            registry.gauge("rag_index_vectors", "Vectors in the index shards loaded in memory.",
+                           callback=lambda: shard_store.stats()["vectors"]),
+            registry.gauge("rag_shard_memory_bytes", "Estimated memory taken by the index shards loaded in memory.",
+                           callback=shard_store.memory_usage),
+            registry.counter("rag_shard_evictions_total", "Index shards evicted to stay within the memory budget.",
+                             callback=lambda: shard_store.evictions),
+            registry.counter("rag_query_embeddings_total",
+                             "Queries embedded, including those served by an identical one.",
+                             callback=lambda: self.embeddings.queries),
+            registry.counter("rag_query_embedding_batches_total", "Batches of query embeddings sent to the model.",
+                             callback=lambda: self.embeddings.batches),
+            registry.histogram("rag_query_embedding_batch_size", "Distinct queries per batch of query embeddings.",
+                               buckets=self.embeddings.buckets, callback=self.embeddings.batch_size_histogram),
+            registry.gauge("rag_login_sessions", "Live login sessions.", callback=self.user_store.session_count),
+        ]
@@ -1,11 +1,44 @@
+import time
+
+_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from router.document import document_router
 from router.conversation import conversation_router
 from router.user import user_router
+from utils.logger import logger
+from utils.metrics import STARTUP_SECONDS, registry
+from utils.tracing import TraceMiddleware
+
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Build the application's clients, stores and services, warm them up, and release them on shutdown.
+    """
+    # Imported here, not at the top, so that importing the app does not pay for building it.
+    from container import Container
+
+    container = Container()
+    app.state.container = container
+    await container.start()
+    app.state.startup_seconds = time.perf_counter() - _started
+    STARTUP_SECONDS.set(app.state.startup_seconds, phase="ready")
+    logger.info(f"Ready {app.state.startup_seconds:.3f}s after the import of main began, "
+                f"{import_seconds:.3f}s of which importing it")
+    try:
+        yield
+    finally:
+        await container.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(TraceMiddleware)
 
 app.include_router(document_router, prefix="", tags=["document_router"])
 app.include_router(conversation_router, prefix="", tags=["conversation_router"])
@@ -16,5 +49,36 @@ app.include_router(user_router, prefix="", tags=["user_router"])
 async def root():
     return {"message": "Hello World"}
 
+
+@app.get("/health/live")
+async def live():
+    """
+    Liveness probe: the process is up and its event loop responds.
+    """
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def ready():
+    """
+    Readiness probe: the services are built and warmed up, and not shutting down.
+
+    Returns:
+        JSONResponse: 200 with the import and time-to-ready seconds once ready, 503 until then.
+    """
+    container = getattr(app.state, "container", None)
+    if container is None or not container.ready:
+        return JSONResponse({"status": "not ready"}, status_code=503)
+    return {"status": "ready", "import_seconds": import_seconds, "startup_seconds": app.state.startup_seconds}
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+import_seconds = time.perf_counter() - _started
+STARTUP_SECONDS.set(import_seconds, phase="import")
+
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
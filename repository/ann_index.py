@@ -0,0 +1,475 @@
+import asyncio
+import contextlib
+import uuid
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from utils.logger import logger
+from utils.metrics import stage_timer
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+
+def create_index(index_type, dimension, nlist=1024, pq_m=64, hnsw_m=32):
+    """
+    Create an empty FAISS index of the given type.
+
+    Args:
+        index_type (str): One of "flat", "ivf_flat", "ivf_pq" or "hnsw".
+        dimension (int): Dimension of the vectors.
+        nlist (int): Number of IVF cells (IVF types only).
+        pq_m (int): Number of PQ sub-quantizers, must divide the dimension (IVF-PQ only).
+        hnsw_m (int): Number of neighbours per HNSW node (HNSW only).
+
+    Returns:
+        faiss.Index: The new index. IVF indexes still need to be trained before vectors can be added, and
+            keep a direct map so that vectors can be reconstructed and removed by id.
+
+    Raises:
+        ValueError: If the index type is unknown.
+    """
+    factory_strings = {
+        "flat": "Flat",
+        "ivf_flat": f"IVF{nlist},Flat",
+        "ivf_pq": f"IVF{nlist},PQ{pq_m}",
+        "hnsw": f"HNSW{hnsw_m}",
+    }
+    if index_type not in factory_strings:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    index = faiss.index_factory(dimension, factory_strings[index_type], faiss.METRIC_L2)
+    if index_type.startswith("ivf"):
+        # Lets vectors be reconstructed and removed by id, e.g. for lexical matches or deleted documents.
+        faiss.extract_index_ivf(index).set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+
+def with_ids(index):
+    """
+    Make an index addressable by stable 64-bit ids instead of by row.
+
+    Flat and HNSW indexes are wrapped in an IndexIDMap2, IVF indexes store the ids natively and get a
+    hashtable direct map. An index that already holds vectors keeps them, with their rows as ids, which
+    upgrades indexes saved before ids were introduced without copying any vector.
+
+    Args:
+        index (faiss.Index): The index.
+
+    Returns:
+        faiss.Index: An index supporting add_with_ids, reconstruct by id and, except HNSW, remove_ids.
+    """
+    # Only for the type check: the wrapper returned by downcast_index does not own the index.
+    if isinstance(faiss.downcast_index(index), faiss.IndexIDMap2):
+        return index
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        if ivf.direct_map.type != faiss.DirectMap.Hashtable:
+            ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
+    if index.ntotal == 0:
+        wrapped = faiss.IndexIDMap2(index)
+    else:
+        # IndexIDMap2 only wraps empty indexes, so the populated one is swapped in after construction.
+        wrapped = faiss.IndexIDMap2(faiss.IndexFlatL2(index.d))
+        wrapped.index = index
+        faiss.copy_array_to_vector(np.arange(index.ntotal, dtype="int64"), wrapped.id_map)
+        wrapped.ntotal = index.ntotal
+        wrapped.construct_rev_map()
+    wrapped.own_fields = False
+    # Keeps the wrapped index alive as long as the wrapper.
+    wrapped.referenced_objects = [index]
+    return wrapped
+
+
+def base_index(index):
+    """
+    The index that actually stores the vectors, i.e. the one inside an IndexIDMap2.
+
+    Args:
+        index (faiss.Index): The index.
+
+    Returns:
+        faiss.Index: The downcast storage index.
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def index_ids(index):
+    """
+    The ids of the vectors of an index, in storage order.
+
+    Args:
+        index (faiss.Index): The index.
+
+    Returns:
+        np.ndarray: int64 ids; the rows for an index without ids.
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.vector_to_array(index.id_map).astype("int64")
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        invlists = ivf.invlists
+        lists = [faiss.rev_swig_ptr(invlists.get_ids(i), invlists.list_size(i)).copy()
+                 for i in range(ivf.nlist) if invlists.list_size(i)]
+        return np.concatenate(lists).astype("int64") if lists else np.empty(0, dtype="int64")
+    return np.arange(index.ntotal, dtype="int64")
+
+
+def remove_ids(index, ids):
+    """
+    Remove vectors by id, in place, without touching the others.
+
+    Args:
+        index (faiss.Index): An index made by with_ids.
+        ids (np.ndarray): The ids to remove.
+
+    Returns:
+        int: The number of vectors removed; 0 for HNSW, which cannot remove vectors, so callers must
+            drop the ids from their own mapping and treat the vectors as orphans.
+    """
+    ids = np.ascontiguousarray(ids, dtype="int64")
+    if len(ids) == 0 or isinstance(base_index(index), faiss.IndexHNSW):
+        return 0
+    if faiss.try_extract_index_ivf(index) is not None:
+        # The hashtable direct map only supports removing an explicit array of ids.
+        return index.remove_ids(faiss.IDSelectorArray(ids))
+    return index.remove_ids(faiss.IDSelectorBatch(ids))
+
+
+def requires_training(index_type):
+    """
+    Whether indexes of this type must be trained before use.
+
+    Args:
+        index_type (str): One of INDEX_TYPES.
+
+    Returns:
+        bool: True for the IVF types.
+    """
+    return index_type.startswith("ivf")
+
+
+def search_parameters(index, nprobe=None, ef_search=None):
+    """
+    Build per-query search parameters for the given index.
+
+    Passing parameters per call, rather than setting them on the index, keeps concurrent queries with
+    different settings from interfering with each other.
+
+    Args:
+        index (faiss.Index): The index about to be searched.
+        nprobe (int, optional): Number of IVF cells to visit.
+        ef_search (int, optional): Size of the HNSW candidate list.
+
+    Returns:
+        faiss.SearchParameters: The parameters, or None if none apply to this index.
+    """
+    if nprobe is not None and faiss.try_extract_index_ivf(index) is not None:
+        return faiss.SearchParametersIVF(nprobe=nprobe)
+    if ef_search is not None and isinstance(base_index(index), faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+    return None
+
+
+def search(index, vectors, k, nprobe=None, ef_search=None):
+    """
+    Search the index with optional per-query nprobe/efSearch.
+
+    Args:
+        index (faiss.Index): The index to search.
+        vectors (np.ndarray): float32 query matrix of shape (n, dimension).
+        k (int): Number of neighbours per query.
+        nprobe (int, optional): Number of IVF cells to visit.
+        ef_search (int, optional): Size of the HNSW candidate list.
+
+    Returns:
+        tuple: (distances, ids), each of shape (n, k); missing results have id -1.
+    """
+    params = search_parameters(index, nprobe, ef_search)
+    if params is None:
+        return index.search(vectors, k)
+    return index.search(vectors, k, params=params)
+
+
+def search_and_reconstruct(index, vectors, k, nprobe=None, ef_search=None):
+    """
+    Search the index with optional per-query nprobe/efSearch, also returning the stored vectors of the results.
+
+    Args:
+        index (faiss.Index): The index to search.
+        vectors (np.ndarray): float32 query matrix of shape (n, dimension).
+        k (int): Number of neighbours per query.
+        nprobe (int, optional): Number of IVF cells to visit.
+        ef_search (int, optional): Size of the HNSW candidate list.
+
+    Returns:
+        tuple: (distances, ids, reconstructed), the first two of shape (n, k) and the last (n, k, dimension);
+            PQ indexes return approximate vectors.
+    """
+    return index.search_and_reconstruct(vectors, k, params=search_parameters(index, nprobe, ef_search))
+
+
+def add_documents(vdb, ids, texts, vectors, metadatas):
+    """
+    Add chunks to a langchain FAISS store under the given vector ids.
+
+    FAISS.add_embeddings numbers vectors by row, which deleting would shift, so chunks are added by id
+    and index_to_docstore_id maps ids rather than rows.
+
+    Args:
+        vdb (FAISS): The vector store, whose index was made by with_ids.
+        ids (Sequence[int]): One new, unique vector id per chunk.
+        texts (list[str]): The text of each chunk.
+        vectors (list[list[float]]): The embedding of each chunk.
+        metadatas (list[dict]): The metadata of each chunk.
+
+    Returns:
+        list[str]: The docstore ids of the chunks.
+    """
+    ids = np.asarray(ids, dtype="int64")
+    docstore_ids = [str(uuid.uuid4()) for _ in range(len(ids))]
+    if len(ids):
+        vdb.index.add_with_ids(np.asarray(vectors, dtype="float32"), ids)
+    vdb.docstore.add({docstore_id: Document(page_content=text, metadata=metadata)
+                      for docstore_id, text, metadata in zip(docstore_ids, texts, metadatas)})
+    vdb.index_to_docstore_id.update(zip(ids.tolist(), docstore_ids))
+    return docstore_ids
+
+
+def remove_documents(vdb, ids):
+    """
+    Remove chunks from a langchain FAISS store by vector id, leaving every other vector in place.
+
+    Args:
+        vdb (FAISS): The vector store, whose index was made by with_ids.
+        ids (Sequence[int]): The vector ids of the chunks.
+
+    Returns:
+        int: The number of chunks removed.
+    """
+    ids = known_ids(vdb, ids)
+    remove_ids(vdb.index, ids)
+    return forget_documents(vdb, ids)
+
+
+def known_ids(vdb, ids):
+    """
+    Args:
+        vdb (FAISS): The vector store.
+        ids (Sequence[int]): Vector ids.
+
+    Returns:
+        np.ndarray: The distinct ids among them that map to a chunk of the store, as int64.
+    """
+    return np.array([i for i in np.unique(np.asarray(ids, dtype="int64")).tolist() if i in vdb.index_to_docstore_id],
+                    dtype="int64")
+
+
+def forget_documents(vdb, ids):
+    """
+    Drop chunks from the docstore and id map of a langchain FAISS store, leaving its index alone.
+
+    With remove_ids, this lets the index be compacted in a worker thread while the mappings, which are read
+    on the event loop, are only changed there.
+
+    Args:
+        vdb (FAISS): The vector store.
+        ids (Sequence[int]): The vector ids of the chunks.
+
+    Returns:
+        int: The number of chunks dropped.
+    """
+    docstore_ids = [vdb.index_to_docstore_id.pop(i) for i in np.asarray(ids, dtype="int64").tolist()
+                    if i in vdb.index_to_docstore_id]
+    if docstore_ids:
+        vdb.docstore.delete(docstore_ids)
+    return len(docstore_ids)
+
+
+def vector_ids_by_document(vdb):
+    """
+    Group the vector ids of a langchain FAISS store by the doc_id in their chunk's metadata.
+
+    Args:
+        vdb (FAISS): The vector store.
+
+    Returns:
+        dict: doc_id -> list of vector ids.
+    """
+    groups = {}
+    for i, docstore_id in vdb.index_to_docstore_id.items():
+        doc_id = vdb.docstore.search(docstore_id).metadata.get("doc_id")
+        groups.setdefault(doc_id, []).append(i)
+    return groups
+
+
+def _reading(lock):
+    # Callers that own the store outright, e.g. tests and benchmarks, have no lock to take.
+    return lock.read() if lock is not None else contextlib.nullcontext()
+
+
+def _orphans(vdb):
+    # Vectors an HNSW index could not remove are still found by searches, but map to no chunk.
+    return max(0, vdb.index.ntotal - len(vdb.index_to_docstore_id))
+
+
+async def similarity_search(vdb, query, k=4, nprobe=None, ef_search=None, lock=None):
+    """
+    Embed a query and return the most similar documents from a langchain FAISS store.
+
+    Equivalent to FAISS.asimilarity_search, except that nprobe/efSearch can be set per query.
+    The FAISS search runs in a worker thread so large scans do not block the event loop. The query is
+    embedded before the lock is taken, so writers only wait for the search itself.
+
+    Args:
+        vdb (FAISS): The vector store.
+        query (str): The query text.
+        k (int): Number of documents to return.
+        nprobe (int, optional): Number of IVF cells to visit.
+        ef_search (int, optional): Size of the HNSW candidate list.
+        lock (ReadWriteLock, optional): The store's lock, held for reading during the search.
+
+    Returns:
+        list[Document]: The matching documents, closest first.
+    """
+    with stage_timer("query_embed"):
+        embedding = await vdb.embedding_function.aembed_query(query)
+    vector = np.asarray([embedding], dtype="float32")
+    async with _reading(lock):
+        with stage_timer("faiss_search"):
+            _, ids = await asyncio.to_thread(search, vdb.index, vector, k + _orphans(vdb), nprobe, ef_search)
+        docstore_ids = [vdb.index_to_docstore_id.get(i) for i in ids[0].tolist() if i != -1]
+        return [vdb.docstore.search(docstore_id) for docstore_id in docstore_ids if docstore_id is not None][:k]
+
+
+async def similarity_search_with_vectors(vdb, query, k=4, nprobe=None, ef_search=None, lock=None):
+    """
+    Like similarity_search, but also returns what is needed to re-rank the results.
+
+    Args:
+        vdb (FAISS): The vector store.
+        query (str): The query text.
+        k (int): Number of documents to return.
+        nprobe (int, optional): Number of IVF cells to visit.
+        ef_search (int, optional): Size of the HNSW candidate list.
+        lock (ReadWriteLock, optional): The store's lock, held for reading during the search.
+
+    Returns:
+        tuple: (query_vector, hits, vectors) where hits are (docstore_id, Document, distance) closest first
+            and vectors is the matrix of their stored embeddings, one row per hit.
+    """
+    with stage_timer("query_embed"):
+        embedding = await vdb.embedding_function.aembed_query(query)
+    vector = np.asarray([embedding], dtype="float32")
+    async with _reading(lock):
+        with stage_timer("faiss_search"):
+            distances, ids, vectors = await asyncio.to_thread(search_and_reconstruct, vdb.index, vector,
+                                                              k + _orphans(vdb), nprobe, ef_search)
+        found = np.array([i in vdb.index_to_docstore_id for i in ids[0].tolist()], dtype=bool)
+        found[np.cumsum(found) > k] = False
+        hits = []
+        for i, distance in zip(ids[0][found].tolist(), distances[0][found]):
+            docstore_id = vdb.index_to_docstore_id[i]
+            hits.append((docstore_id, vdb.docstore.search(docstore_id), float(distance)))
+    return vector[0], hits, vectors[0][found]
+
+
+class IndexMigrator:
+    """
+    Migrates a vector store from a flat index to a trained ANN index in the background.
+
+    IVF codebooks need a representative sample to train on, so the store starts out flat and is rebuilt
+    once train_threshold vectors have arrived. Training and re-adding happen in a worker thread against
+    a copy of the vectors; taking that copy holds the index lock for reading, and only the final catch-up of
+    vectors added or removed meanwhile and the swap hold the store for writing. Vector ids are preserved, so
+    index_to_docstore_id stays valid across the swap.
+
+    Args:
+        index_type (str): The target index type.
+        dimension (int): Dimension of the vectors.
+        index_store (IndexStore): Persistence store whose lock guards the index.
+        train_threshold (int): Number of vectors required before migrating.
+        **index_params: Extra arguments for create_index (nlist, pq_m, hnsw_m).
+    """
+
+    def __init__(self, index_type, dimension, index_store, train_threshold, **index_params):
+        self.index_type = index_type
+        self.dimension = dimension
+        self.index_store = index_store
+        self.train_threshold = train_threshold
+        self.index_params = index_params
+        self._migration = None
+
+    @property
+    def is_running(self):
+        """
+        bool: Whether a migration has been started and not finished yet.
+        """
+        return self._migration is not None and not self._migration.done()
+
+    def is_migrated(self, vdb):
+        """
+        Whether the vector store no longer needs migrating.
+
+        Args:
+            vdb (FAISS): The vector store.
+
+        Returns:
+            bool: True unless the store still holds a flat index while a different type is configured.
+        """
+        return self.index_type == "flat" or vdb.index.ntotal == 0 or not isinstance(
+            base_index(vdb.index), faiss.IndexFlat)
+
+    def maybe_migrate(self, vdb):
+        """
+        Start a background migration if the store is still flat and has enough vectors.
+
+        Args:
+            vdb (FAISS): The vector store.
+        """
+        if self.is_running:
+            return
+        if self.is_migrated(vdb) or vdb.index.ntotal < self.train_threshold:
+            return
+        self._migration = asyncio.ensure_future(self.migrate(vdb))
+
+    async def migrate(self, vdb):
+        """
+        Train the target index on the current vectors and swap it into the vector store.
+
+        Args:
+            vdb (FAISS): The vector store.
+        """
+        async with self.index_store.lock.read():
+            flat_index = vdb.index
+            ids = index_ids(flat_index)
+            # Copied under the lock: an add could otherwise reallocate the codes while they are read.
+            vectors = await asyncio.to_thread(base_index(flat_index).reconstruct_n, 0, len(ids))
+        new_index = await asyncio.to_thread(self._build, vectors, ids)
+
+        async with self.index_store.writing():
+            if vdb.index is not flat_index or self.index_store.is_stale():
+                # Either way the index is reloaded or replaced, and migrated again on the next ingest if need be.
+                logger.info("Index changed during migration, discarding the trained index")
+                return
+            current = index_ids(flat_index)
+            remove_ids(new_index, np.setdiff1d(ids, current))
+            added = np.setdiff1d(current, ids)
+            if len(added):
+                new_index.add_with_ids(flat_index.reconstruct_batch(added), added)
+            vdb.index = new_index
+            self.index_store.is_mapped = False
+            self.index_store.schedule_save(vdb)
+        logger.info(f"Migrated {new_index.ntotal} vectors from flat to {self.index_type}")
+
+    def _build(self, vectors, ids):
+        index = with_ids(create_index(self.index_type, self.dimension, **self.index_params))
+        if not index.is_trained:
+            index.train(vectors)
+        index.add_with_ids(vectors, ids)
+        return index
@@ -0,0 +1,187 @@
+import base64
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+_COLUMNS = (
+    "doc_id", "owner", "filename", "status", "size", "pages", "chunks", "error", "created_at", "updated_at",
+    "indexed_at",
+)
+_UPDATABLE = set(_COLUMNS) - {"doc_id", "owner", "created_at"}
+# Columns documents can be listed by; none of them is ever NULL, which keyset comparisons rely on.
+SORTABLE = ("created_at", "updated_at", "filename", "size", "pages", "chunks")
+
+
+class DocumentCatalog:
+    """
+    Durable catalog of uploaded documents, backed by SQLite.
+
+    Each document has an owner, its original filename and size, its page and chunk counts once indexed, and
+    its status: "uploaded", "processing", "indexed" or "failed". Listing uses keyset pagination: a page ends
+    with an opaque cursor holding the sort value and doc_id of its last row, and the next page is read from
+    an index starting right after it, so every page costs the same however deep it is and rows added in
+    the meantime never shift or repeat results.
+
+    Args:
+        path (str): Location of the SQLite database file.
+    """
+
+    def __init__(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                status TEXT NOT NULL,
+                size INTEGER NOT NULL DEFAULT 0,
+                pages INTEGER NOT NULL DEFAULT 0,
+                chunks INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                indexed_at REAL
+            )
+            """
+        )
+        # The listings by upload time, with and without a status filter, read straight from these.
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_owner ON documents (owner, created_at, doc_id)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS documents_owner_status ON documents (owner, status, created_at, doc_id)")
+        self._conn.commit()
+
+    def add(self, doc_id, owner, filename, size):
+        """
+        Record a new upload in the "uploaded" status.
+
+        Args:
+            doc_id (str): The document's id.
+            owner (str): The namespace, i.e. the user, the document belongs to.
+            filename (str): Original filename of the upload.
+            size (int): Size of the upload in bytes.
+
+        Returns:
+            dict: The new document.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO documents (doc_id, owner, filename, status, size, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'uploaded', ?, ?, ?)",
+                (doc_id, owner, filename, size, now, now),
+            )
+            self._conn.commit()
+        return self.get(doc_id)
+
+    def get(self, doc_id):
+        """
+        Get a document by id.
+
+        Args:
+            doc_id (str): The document's id.
+
+        Returns:
+            dict: The document, or None if it does not exist.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def update(self, doc_id, **fields):
+        """
+        Update fields of a document; updated_at is set to the current time.
+
+        Args:
+            doc_id (str): The document's id.
+            **fields: Column values to set.
+        """
+        unknown = set(fields) - _UPDATABLE
+        if unknown:
+            raise ValueError(f"Unknown document fields: {unknown}")
+        fields.setdefault("updated_at", time.time())
+        assignments = ", ".join(f"{field} = ?" for field in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE documents SET {assignments} WHERE doc_id = ?", (*fields.values(), doc_id))
+            self._conn.commit()
+
+    def delete(self, doc_id):
+        """
+        Remove a document from the catalog.
+
+        Args:
+            doc_id (str): The document's id.
+
+        Returns:
+            bool: True if the document existed.
+        """
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def list(self, owner, status=None, sort="created_at", descending=True, limit=10, cursor=None):
+        """
+        List the documents of an owner, one page at a time.
+
+        Args:
+            owner (str): The namespace, i.e. the user.
+            status (str, optional): Only list documents in this status.
+            sort (str): The column to sort by, one of SORTABLE.
+            descending (bool): Whether to list the largest values first.
+            limit (int): Maximum number of documents in the page.
+            cursor (str, optional): The next_cursor of the previous page; the first page if None.
+
+        Returns:
+            dict: The "documents" of the page and the "next_cursor" to pass for the next one, None after the
+                last page.
+
+        Raises:
+            ValueError: If the sort column or the cursor is invalid.
+        """
+        if sort not in SORTABLE:
+            raise ValueError(f"Cannot sort by {sort!r}, expected one of {', '.join(SORTABLE)}")
+        conditions, parameters = ["owner = ?"], [owner]
+        if status is not None:
+            conditions.append("status = ?")
+            parameters.append(status)
+        if cursor is not None:
+            conditions.append(f"({sort}, doc_id) {'<' if descending else '>'} (?, ?)")
+            parameters.extend(self._decode_cursor(cursor, sort, descending))
+        direction = "DESC" if descending else "ASC"
+        query = (f"SELECT * FROM documents WHERE {' AND '.join(conditions)} "
+                 f"ORDER BY {sort} {direction}, doc_id {direction} LIMIT ?")
+        with self._lock:
+            rows = self._conn.execute(query, (*parameters, limit + 1)).fetchall()
+        documents = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = documents[-1]
+            next_cursor = self._encode_cursor(sort, descending, last[sort], last["doc_id"])
+        return {"documents": documents, "next_cursor": next_cursor}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _encode_cursor(sort, descending, value, doc_id):
+        payload = json.dumps([sort, descending, value, doc_id]).encode("utf-8")
+        return base64.urlsafe_b64encode(payload).decode("ascii")
+
+    @staticmethod
+    def _decode_cursor(cursor, sort, descending):
+        try:
+            cursor_sort, cursor_descending, value, doc_id = json.loads(base64.urlsafe_b64decode(cursor))
+        except (ValueError, TypeError):
+            raise ValueError("Invalid cursor") from None
+        if (cursor_sort, cursor_descending) != (sort, descending):
+            raise ValueError("The cursor belongs to a listing with a different sort order")
+        return value, doc_id
@@ -0,0 +1,129 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+
+
+def normalize_text(text):
+    """
+    Normalize chunk text so that trivially different copies share a cache entry.
+
+    Applies Unicode NFC normalization and collapses runs of whitespace.
+
+    Args:
+        text (str): The chunk text.
+
+    Returns:
+        str: The normalized text.
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model, text):
+    """
+    Content address of an embedding: a hash of the model name and the normalized text.
+
+    Args:
+        model (str): The embedding model name.
+        text (str): The chunk text.
+
+    Returns:
+        str: Hex digest identifying the embedding.
+    """
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent, size-bounded embedding cache stored in SQLite.
+
+    Vectors are stored as raw float32 blobs keyed by cache_key. Every hit refreshes the entry's
+    last-used timestamp and inserts beyond max_entries evict the least recently used rows.
+
+    Args:
+        path (str): Location of the SQLite database file.
+        max_entries (int): Maximum number of cached embeddings.
+    """
+
+    def __init__(self, path, max_entries=100_000):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def __len__(self):
+        return self._size
+
+    def get_many(self, keys):
+        """
+        Look up several embeddings at once.
+
+        Args:
+            keys (list[str]): Cache keys.
+
+        Returns:
+            dict: Mapping of the keys that were found to their vectors (list[float]).
+        """
+        if not keys:
+            return {}
+        unique_keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            # SQLite limits the number of bound parameters per statement.
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update((key, np.frombuffer(vector, dtype=np.float32).tolist()) for key, vector in rows)
+            if found:
+                now = time.time_ns()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+                self._conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items):
+        """
+        Store several embeddings, evicting the least recently used entries beyond max_entries.
+
+        Args:
+            items (dict): Mapping of cache key to vector.
+        """
+        if not items:
+            return
+        now = time.time_ns()
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items.items()]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+            self._size += self._conn.total_changes - before
+            overflow = self._size - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+                self._size -= overflow
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,322 @@
+import asyncio
+import contextlib
+import os
+import pickle
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+import faiss
+from langchain_community.vectorstores import FAISS
+
+from repository.ann_index import index_ids, with_ids
+from repository.lexical_index import LexicalIndex
+from utils.locks import ReadWriteLock
+from utils.logger import logger
+
+try:
+    import fcntl
+except ImportError:  # Windows, where the app runs as a single process and there is no other writer to exclude.
+    fcntl = None
+
+_CURRENT = "CURRENT"
+_LEASE_FILE = "LEASE"
+_INDEX_FILE = "index.faiss"
+_DOCSTORE_FILE = "index.pkl"
+_LEXICAL_FILE = "lexical.pkl"
+
+
+class IndexStore:
+    """
+    Persistence layer for the FAISS vector store.
+
+    Every save writes the index, docstore and index_to_docstore_id into a fresh snapshot directory
+    and then atomically repoints the CURRENT file at it, so a crash mid-save never leaves a torn index
+    behind. Loading memory-maps the index read-only, which lets several workers share one page-cached
+    copy; the first write detaches the index into process memory. The lexical index, once attached by
+    load_lexical, is written into the same snapshot so that both always describe the same chunks.
+
+    The lock guards the index and its mappings within the process: FAISS releases the GIL, so a search in a
+    worker thread while another thread adds, removes or compacts vectors can crash the process. Searches and
+    saves hold it for reading, anything that changes the index or swaps it out holds it for writing.
+
+    Across processes, e.g. uvicorn workers sharing the directory, every copy is loaded from a snapshot and each
+    save replaces the snapshot with the whole copy, so writers take turns through writing(): it holds a
+    file lock on the directory, the lease, from before the change until the change is saved. A writer that
+    gets the lease after another process saved must bring its copy up to date first, see is_stale, or it
+    would save over the other process's changes.
+
+    Args:
+        directory (str): Directory holding the snapshots.
+        debounce (float): Seconds to wait for further ingests before a scheduled save runs.
+        lease_poll (float): Seconds between attempts to take the lease while another process holds it.
+    """
+
+    def __init__(self, directory, debounce=2.0, lease_poll=0.05):
+        self.directory = Path(directory)
+        self.debounce = debounce
+        self.lease_poll = lease_poll
+        self.lock = ReadWriteLock()
+        self.is_mapped = False
+        self.lexical_index = None
+        # Name of the snapshot the process's copy was loaded from or last saved to.
+        self.snapshot = None
+        self._pending_save = None
+        # Whether the copy has changes that are not saved yet.
+        self._dirty = False
+        # Coroutines inside writing(), and the file descriptor holding the lease while any of them or a pending
+        # save needs it.
+        self._writers = 0
+        self._lease = None
+        self._lease_lock = asyncio.Lock()
+
+    @property
+    def has_pending_save(self):
+        """
+        bool: Whether a scheduled save has not completed yet.
+        """
+        return self._pending_save is not None and not self._pending_save.done()
+
+    def is_stale(self):
+        """
+        Check whether another process saved a snapshot since the process's copy was loaded or saved.
+
+        Returns:
+            bool: True if the copy must be loaded again to see the latest changes.
+        """
+        current = self._current_name()
+        return current is not None and current != self.snapshot
+
+    @contextlib.asynccontextmanager
+    async def writing(self):
+        """
+        Hold the store for writing, within the process and across processes.
+
+        Takes the lease, waiting for any other process to save its changes, then the lock for writing. Changes
+        made in the block must be saved with schedule_save before it exits; the lease is kept until they are,
+        and released right away otherwise.
+        """
+        self._writers += 1
+        try:
+            # Taken before the lock, so that searches in this process go on while another process saves.
+            await self._acquire_lease()
+            async with self.lock.write():
+                yield
+        finally:
+            self._writers -= 1
+            self._release_lease_if_idle()
+
+    def load(self, embedding_function):
+        """
+        Load the latest snapshot, memory-mapping the index.
+
+        Args:
+            embedding_function: Embeddings used by the returned vector store.
+
+        Returns:
+            FAISS: The restored vector store, or None if nothing has been saved yet.
+        """
+        start = time.perf_counter()
+        while True:
+            snapshot = self._current_snapshot()
+            if snapshot is None:
+                return None
+            try:
+                # Snapshots from before vector ids were introduced are upgraded, with their rows as ids.
+                index = with_ids(faiss.read_index(str(snapshot / _INDEX_FILE), self._mmap_flags()))
+                with open(snapshot / _DOCSTORE_FILE, "rb") as f:
+                    docstore, index_to_docstore_id = pickle.load(f)
+                break
+            except (OSError, RuntimeError):
+                # Another process saved a newer snapshot and removed this one while it was being read.
+                if self._current_snapshot() == snapshot:
+                    raise
+        self.is_mapped = True
+        self.snapshot = snapshot.name
+        logger.info(f"Loaded {index.ntotal} vectors from {snapshot} in {time.perf_counter() - start:.3f}s")
+        return FAISS(
+            embedding_function=embedding_function,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id,
+        )
+
+    def load_lexical(self, vdb):
+        """
+        Load the lexical index of the latest snapshot and save it along with every later snapshot.
+
+        The index is rebuilt from the docstore when the snapshot has none, e.g. because it predates lexical
+        search, or when it does not cover the same chunks as the vector index. Rows are vector ids, so the
+        rebuilt index has a removed row for every id that no longer maps to a chunk.
+
+        Args:
+            vdb (FAISS): The vector store the lexical index must match.
+
+        Returns:
+            LexicalIndex: The lexical index of the vector store's chunks.
+        """
+        # The snapshot the vector store was loaded from, rather than one another process may have saved since.
+        name = self.snapshot or self._current_name()
+        lexical_index = None
+        if name is not None:
+            with contextlib.suppress(FileNotFoundError):
+                with open(self.directory / name / _LEXICAL_FILE, "rb") as f:
+                    lexical_index = LexicalIndex.load(f)
+        ids = index_ids(vdb.index)
+        size = int(ids.max()) + 1 if len(ids) else 0
+        if lexical_index is None or len(lexical_index) != len(vdb.index_to_docstore_id) or lexical_index.size < size:
+            start = time.perf_counter()
+            lexical_index = LexicalIndex()
+            docstore_ids = [vdb.index_to_docstore_id.get(row) for row in range(size)]
+            lexical_index.add(["" if docstore_id is None else vdb.docstore.search(docstore_id).page_content
+                               for docstore_id in docstore_ids])
+            lexical_index.remove(row for row, docstore_id in enumerate(docstore_ids) if docstore_id is None)
+            logger.info(f"Rebuilt the lexical index of {len(lexical_index)} chunks in "
+                        f"{time.perf_counter() - start:.3f}s")
+        self.lexical_index = lexical_index
+        return lexical_index
+
+    def make_writable(self, vdb):
+        """
+        Copy a memory-mapped index into process memory so that it can be added to.
+
+        Args:
+            vdb (FAISS): The vector store about to be written.
+        """
+        if self.is_mapped:
+            vdb.index = faiss.deserialize_index(faiss.serialize_index(vdb.index))
+            self.is_mapped = False
+
+    def save(self, vdb):
+        """
+        Write a new snapshot of the vector store and make it current.
+
+        Args:
+            vdb (FAISS): The vector store to persist.
+        """
+        start = time.perf_counter()
+        # Writes wait for the save, so anything changed from here on is saved by a later one.
+        self._dirty = False
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_dir = self.directory / f".tmp-{uuid.uuid4()}"
+        tmp_dir.mkdir()
+        faiss.write_index(vdb.index, str(tmp_dir / _INDEX_FILE))
+        with open(tmp_dir / _DOCSTORE_FILE, "wb") as f:
+            pickle.dump((vdb.docstore, vdb.index_to_docstore_id), f)
+            f.flush()
+            os.fsync(f.fileno())
+        if self.lexical_index is not None:
+            with open(tmp_dir / _LEXICAL_FILE, "wb") as f:
+                self.lexical_index.dump(f)
+                f.flush()
+                os.fsync(f.fileno())
+
+        snapshot = self.directory / f"snapshot-{time.time_ns()}"
+        os.rename(tmp_dir, snapshot)
+        current_tmp = self.directory / f"{_CURRENT}.tmp"
+        with open(current_tmp, "w") as f:
+            f.write(snapshot.name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(current_tmp, self.directory / _CURRENT)
+        self.snapshot = snapshot.name
+
+        self._remove_stale_snapshots(keep=snapshot.name)
+        logger.info(f"Saved {vdb.index.ntotal} vectors to {snapshot} in {time.perf_counter() - start:.3f}s")
+
+    async def save_async(self, vdb):
+        """
+        Save the vector store in a worker thread while holding the lock for reading, so that searches go on
+        but writes wait for the snapshot to complete.
+
+        Args:
+            vdb (FAISS): The vector store to persist.
+        """
+        try:
+            async with self.lock.read():
+                await asyncio.to_thread(self.save, vdb)
+        finally:
+            self._release_lease_if_idle()
+
+    def schedule_save(self, vdb):
+        """
+        Debounce a save: bursts of ingests within the debounce window produce a single snapshot.
+
+        Args:
+            vdb (FAISS): The vector store to persist.
+        """
+        self._dirty = True
+        if self.has_pending_save:
+            self._pending_save.cancel()
+        self._pending_save = asyncio.ensure_future(self._save_later(vdb))
+
+    async def flush(self, vdb):
+        """
+        Run a scheduled save immediately instead of waiting out the debounce.
+
+        Args:
+            vdb (FAISS): The vector store to persist.
+        """
+        if not self.has_pending_save:
+            return
+        self._pending_save.cancel()
+        self._pending_save = None
+        await self.save_async(vdb)
+
+    async def _save_later(self, vdb):
+        await asyncio.sleep(self.debounce)
+        # Shielded so that a newer schedule_save cannot interrupt a snapshot half way through.
+        await asyncio.shield(self.save_async(vdb))
+
+    async def _acquire_lease(self):
+        async with self._lease_lock:
+            if self._lease is not None or fcntl is None:
+                return
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.directory / _LEASE_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        # Polled rather than waited for in a thread: another process holds it until its save.
+                        await asyncio.sleep(self.lease_poll)
+            except BaseException:
+                os.close(fd)
+                raise
+            self._lease = fd
+
+    def _release_lease_if_idle(self):
+        if self._lease is not None and self._writers == 0 and not self._dirty:
+            # Closing the descriptor releases the lock.
+            os.close(self._lease)
+            self._lease = None
+
+    def _current_name(self):
+        try:
+            return (self.directory / _CURRENT).read_text().strip()
+        except FileNotFoundError:
+            return None
+
+    def _current_snapshot(self):
+        name = self._current_name()
+        if name is None:
+            return None
+        snapshot = self.directory / name
+        if not (snapshot / _INDEX_FILE).exists():
+            return None
+        return snapshot
+
+    def _remove_stale_snapshots(self, keep):
+        for path in self.directory.iterdir():
+            if path.is_dir() and path.name.startswith("snapshot-") and path.name != keep:
+                # Workers that still map an old snapshot keep their view until they unmap it.
+                shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def _mmap_flags():
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        # Newer FAISS releases can also map the codes of flat indexes, not just inverted lists.
+        return flags | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
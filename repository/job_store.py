@@ -0,0 +1,222 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+_COLUMNS = (
+    "id", "doc_id", "namespace", "filename", "status", "stage", "pages_done", "pages_total", "chunks_done", "chunks_total",
+    "error", "result", "timings", "created_at", "started_at", "finished_at", "owner", "heartbeat_at",
+)
+_UPDATABLE = set(_COLUMNS) - {"id", "doc_id", "namespace", "created_at", "owner", "heartbeat_at"}
+_UNFINISHED = "('uploading', 'queued', 'running')"
+
+
+class JobStore:
+    """
+    Durable store for ingestion jobs, backed by SQLite.
+
+    Jobs move through the statuses "uploading", "queued", "running", "done" and "failed"; while running,
+    their stage and page/chunk progress are updated in place. Because the rows outlive the process,
+    jobs interrupted by a restart can be queued again.
+
+    Several processes can share the database. Each unfinished job belongs to the process that created,
+    claimed or last recovered it, which keeps the job's heartbeat fresh while it is alive; only jobs whose
+    heartbeat went stale are recovered, so a worker never takes over jobs another live worker is running.
+
+    Args:
+        path (str): Location of the SQLite database file.
+        owner (str, optional): Identifies the process in the jobs it owns; unique per process if None.
+    """
+
+    def __init__(self, path, owner=None):
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                doc_id TEXT NOT NULL,
+                namespace TEXT NOT NULL DEFAULT '',
+                filename TEXT,
+                status TEXT NOT NULL,
+                stage TEXT,
+                pages_done INTEGER NOT NULL DEFAULT 0,
+                pages_total INTEGER,
+                chunks_done INTEGER NOT NULL DEFAULT 0,
+                chunks_total INTEGER,
+                error TEXT,
+                result TEXT,
+                timings TEXT NOT NULL DEFAULT '{}',
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                owner TEXT,
+                heartbeat_at REAL
+            )
+            """
+        )
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "namespace" not in columns:
+            # Databases created before jobs belonged to a namespace.
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN namespace TEXT NOT NULL DEFAULT ''")
+        if "owner" not in columns:
+            # Databases created before jobs had owners; their unfinished jobs have no heartbeat, so they are stale.
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        self._conn.commit()
+
+    def create(self, doc_id, filename, namespace="", max_pending=None):
+        """
+        Create a job in the "uploading" status.
+
+        Args:
+            doc_id (str): The document the job ingests.
+            filename (str): Original filename of the upload.
+            namespace (str): The namespace, i.e. the user, whose shard the document is indexed into.
+            max_pending (int, optional): Only create the job while fewer jobs than this are pending, see
+                count_pending; checked in the same statement as the insert, so concurrent creates cannot
+                overshoot it.
+
+        Returns:
+            dict: The new job, or None if max_pending jobs were already pending.
+        """
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (id, doc_id, namespace, filename, status, created_at, owner, heartbeat_at) "
+                "SELECT ?, ?, ?, ?, 'uploading', ?, ?, ? "
+                "WHERE ? IS NULL OR (SELECT COUNT(*) FROM jobs WHERE status IN ('uploading', 'queued')) < ?",
+                (job_id, doc_id, namespace, filename, now, self.owner, now, max_pending, max_pending),
+            )
+            self._conn.commit()
+        return self.get(job_id) if cursor.rowcount else None
+
+    def get(self, job_id):
+        """
+        Get a job by id.
+
+        Args:
+            job_id (str): The job id.
+
+        Returns:
+            dict: The job, or None if it does not exist.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["timings"] = json.loads(job["timings"])
+        return job
+
+    def update(self, job_id, **fields):
+        """
+        Update fields of a job.
+
+        Args:
+            job_id (str): The job id.
+            **fields: Column values to set; timings may be given as a dict.
+        """
+        unknown = set(fields) - _UPDATABLE
+        if unknown:
+            raise ValueError(f"Unknown job fields: {unknown}")
+        if "timings" in fields:
+            fields["timings"] = json.dumps(fields["timings"])
+        assignments = ", ".join(f"{field} = ?" for field in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def claim(self, job_id):
+        """
+        Move a queued job to "running" and take it over, unless another worker got there first.
+
+        Args:
+            job_id (str): The job id.
+
+        Returns:
+            dict: The claimed job, or None if it was not queued.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, owner = ?, heartbeat_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (now, self.owner, now, job_id),
+            )
+            self._conn.commit()
+        return self.get(job_id) if cursor.rowcount else None
+
+    def count_pending(self):
+        """
+        Count jobs that are waiting to run, including uploads still being received.
+
+        Returns:
+            int: The queue depth.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('uploading', 'queued')"
+            ).fetchone()[0]
+
+    def heartbeat(self):
+        """
+        Record that the process is alive in every unfinished job it owns.
+
+        Returns:
+            int: The number of jobs it owns.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status IN {_UNFINISHED}",
+                (time.time(), self.owner),
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def recover(self, stale_after):
+        """
+        Take over the jobs of processes that stopped: re-queue the jobs they had queued or were running, and fail
+        the uploads they never completed.
+
+        Args:
+            stale_after (float): Seconds without a heartbeat after which the owner of a job is deemed stopped.
+
+        Returns:
+            list[str]: Ids of the jobs taken over and queued, oldest first.
+        """
+        now = time.time()
+        stale = "owner IS NOT ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)"
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id FROM jobs WHERE status IN ('queued', 'running') AND {stale} ORDER BY created_at",
+                (self.owner, now - stale_after),
+            ).fetchall()
+            # Re-checked by the update, in case the owner beat or another process recovered the job in between.
+            ids = [row["id"] for row in rows if self._conn.execute(
+                f"UPDATE jobs SET status = 'queued', stage = NULL, owner = ?, heartbeat_at = ? "
+                f"WHERE id = ? AND status IN ('queued', 'running') AND {stale}",
+                (self.owner, now, row["id"], self.owner, now - stale_after),
+            ).rowcount]
+            self._conn.execute(
+                f"UPDATE jobs SET status = 'failed', error = 'Upload interrupted', finished_at = ? "
+                f"WHERE status = 'uploading' AND {stale}",
+                (now, self.owner, now - stale_after),
+            )
+            self._conn.commit()
+        return ids
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,252 @@
+import math
+import pickle
+import re
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+
+# Words, and identifiers such as part numbers or versions joined by "-", ".", "/" or ":".
+_TOKEN = re.compile(r"\w+(?:[-./:]\w+)*")
+_SEPARATOR = re.compile(r"[-./:]")
+_MAX_TERM_FREQUENCY = 2 ** 16 - 1
+
+
+def tokenize(text):
+    """
+    Cut a text into lowercase search terms.
+
+    An identifier such as "XR-1200/b" is kept whole, so that it matches exactly, and is also split into
+    its parts, so that "xr" or "1200" alone still finds it.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        list[str]: The terms, in order, with repetitions.
+    """
+    terms = []
+    for match in _TOKEN.finditer(text.lower()):
+        term = match.group()
+        terms.append(term)
+        if _SEPARATOR.search(term):
+            terms.extend(part for part in _SEPARATOR.split(term) if part)
+    return terms
+
+
+class LexicalIndex:
+    """
+    In-memory inverted index with BM25 ranking.
+
+    Documents are numbered in the order they are added, and their row is used as the id of their vector in
+    the FAISS index, so a row identifies the same chunk in both. Each term's postings are two compact
+    arrays, of rows and of term frequencies, that only ever grow at the end, so adding a document touches
+    only the postings of its own terms. Removed documents are tombstoned: they are never returned and no
+    longer count towards the average length, while their postings stay in place. Queries score the
+    postings of their terms with NumPy and never walk a posting list in Python.
+
+    Args:
+        k1 (float): BM25 term frequency saturation.
+        b (float): BM25 document length normalization.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        # term -> (rows, term frequencies)
+        self._postings = {}
+        self._lengths = np.zeros(1024, dtype="uint32")
+        self._count = 0
+        self._total_length = 0
+        self._deleted = np.zeros(1024, dtype=bool)
+        self._removed = 0
+        # Length normalization of each document, computed on the first search after an add.
+        self._norms = None
+
+    def __len__(self):
+        return self._count - self._removed
+
+    @property
+    def size(self):
+        """
+        int: Number of rows assigned so far, including removed ones; the next document gets this row.
+        """
+        return self._count
+
+    def add(self, texts):
+        """
+        Index documents as the next rows.
+
+        Args:
+            texts (list[str]): The text of each document.
+
+        Returns:
+            range: The rows assigned to the documents.
+        """
+        documents = [(Counter(terms), len(terms)) for terms in map(tokenize, texts)]
+        with self._lock:
+            start = self._count
+            end = start + len(documents)
+            if end > len(self._lengths):
+                capacity = max(end, 2 * len(self._lengths))
+                self._lengths = self._grow(self._lengths, start, capacity)
+                self._deleted = self._grow(self._deleted, start, capacity)
+            for row, (frequencies, length) in enumerate(documents, start):
+                for term, frequency in frequencies.items():
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = self._postings[term] = (array("I"), array("H"))
+                    postings[0].append(row)
+                    postings[1].append(min(frequency, _MAX_TERM_FREQUENCY))
+                self._lengths[row] = length
+                self._total_length += length
+            self._count = end
+            self._norms = None
+        return range(start, end)
+
+    def remove(self, rows):
+        """
+        Remove documents.
+
+        Args:
+            rows (Iterable[int]): The rows of the documents; unknown or already removed rows are ignored.
+
+        Returns:
+            int: The number of documents removed.
+        """
+        with self._lock:
+            rows = np.asarray(list(rows), dtype="int64")
+            rows = np.unique(rows[(rows >= 0) & (rows < self._count)])
+            rows = rows[~self._deleted[rows]]
+            self._deleted[rows] = True
+            self._removed += len(rows)
+            self._total_length -= int(self._lengths[rows].sum(dtype="int64"))
+            self._norms = None
+        return len(rows)
+
+    def search(self, query, k):
+        """
+        Find the documents that best match a query by BM25.
+
+        Args:
+            query (str): The query text.
+            k (int): Maximum number of results.
+
+        Returns:
+            tuple: (rows, scores) as NumPy arrays, best first; documents sharing no term with the query are
+                never returned.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            if not terms or not len(self) or k <= 0:
+                return np.empty(0, dtype="int64"), np.empty(0, dtype="float32")
+            return self._score(terms, k)
+
+    def dump(self, file):
+        """
+        Write the index to a binary file.
+
+        Args:
+            file (BinaryIO): The file to write to.
+        """
+        with self._lock:
+            pickle.dump({
+                "k1": self.k1,
+                "b": self.b,
+                "postings": self._postings,
+                "lengths": self._lengths[:self._count],
+                "deleted": self._deleted[:self._count],
+            }, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, file):
+        """
+        Read an index written by dump.
+
+        Args:
+            file (BinaryIO): The file to read from.
+
+        Returns:
+            LexicalIndex: The restored index.
+        """
+        state = pickle.load(file)
+        index = cls(k1=state["k1"], b=state["b"])
+        index._postings = state["postings"]
+        index._count = len(state["lengths"])
+        capacity = max(index._count, 1024)
+        index._lengths = cls._grow(state["lengths"], index._count, capacity)
+        index._deleted = cls._grow(state["deleted"], index._count, capacity)
+        index._removed = int(state["deleted"].sum())
+        index._total_length = int(state["lengths"][~state["deleted"]].sum(dtype="int64"))
+        return index
+
+    def _score(self, terms, k):
+        # Runs under the lock: the NumPy views below pin the posting arrays, which cannot grow while viewed.
+        if self._norms is None:
+            average_length = max(self._total_length / len(self), 1)
+            self._norms = (self.k1 * (1 - self.b + self.b * self._lengths[:self._count] / average_length)).astype(
+                "float32")
+            # An infinite length zeroes every weight of a removed document.
+            self._norms[self._deleted[:self._count]] = np.inf
+        postings = [(self._idf(len(p[0])), p) for p in map(self._postings.get, terms) if p is not None]
+        if not postings:
+            return np.empty(0, dtype="int64"), np.empty(0, dtype="float32")
+        # Rarest terms first. A term contributes less than idf * (k1 + 1) to any document, so once the k-th
+        # best score so far beats what the remaining terms could add up to, no new document can enter the
+        # top k, and the remaining (common, long) posting lists are only probed for the current candidates.
+        postings.sort(key=lambda pair: pair[0], reverse=True)
+        bounds = np.cumsum([idf * (self.k1 + 1) for idf, _ in reversed(postings)])[::-1]
+
+        candidates = np.empty(0, dtype="int64")
+        scores = np.empty(0, dtype="float64")
+        dense = None
+        for i, (idf, (rows, frequencies)) in enumerate(postings):
+            rows = np.frombuffer(rows, dtype="uint32")
+            frequencies = np.frombuffer(frequencies, dtype="uint16")
+            if dense is not None:
+                # Rows are unique within a posting list, so a fancy-indexed add is exact.
+                dense[rows] += self._weights(idf, rows, frequencies)
+            elif len(candidates) >= k and np.partition(scores, len(scores) - k)[len(scores) - k] > bounds[i]:
+                positions = np.minimum(np.searchsorted(rows, candidates), len(rows) - 1)
+                found = rows[positions] == candidates
+                scores[found] += self._weights(idf, rows[positions[found]], frequencies[positions[found]])
+            elif (len(candidates) + len(rows)) * 8 > self._count:
+                # Too many candidates to keep sorting: accumulate into one score per document instead.
+                dense = np.zeros(self._count)
+                dense[candidates] = scores
+                dense[rows] += self._weights(idf, rows, frequencies)
+            else:
+                weights = self._weights(idf, rows, frequencies)
+                candidates, inverse = np.unique(np.concatenate([candidates, rows]), return_inverse=True)
+                scores = np.bincount(inverse, weights=np.concatenate([scores, weights]))
+        if dense is not None:
+            candidates = np.flatnonzero(dense)
+            scores = dense[candidates]
+        elif self._removed:
+            live = scores > 0
+            candidates, scores = candidates[live], scores[live]
+
+        if len(candidates) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            candidates, scores = candidates[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return candidates[order], scores[order].astype("float32")
+
+    def _idf(self, document_frequency):
+        # Postings of removed documents still count, which only slightly lowers the idf of their terms.
+        documents = max(len(self), document_frequency)
+        return math.log(1 + (documents - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def _weights(self, idf, rows, frequencies):
+        frequencies = frequencies.astype("float32")
+        weights = frequencies * np.float32(idf * (self.k1 + 1))
+        weights /= frequencies + self._norms[rows]
+        return weights
+
+    @staticmethod
+    def _grow(values, used, capacity):
+        grown = np.zeros(capacity, dtype=values.dtype)
+        grown[:used] = values[:used]
+        return grown
@@ -0,0 +1,160 @@
+import hashlib
+import itertools
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+
+def context_fingerprint(chunk_ids, history):
+    """
+    Identify what an answer was generated from, besides the question itself.
+
+    Args:
+        chunk_ids (list[str]): Docstore ids of the retrieved context, in prompt order.
+        history (list[dict]): The conversation history preceding the question.
+
+    Returns:
+        str: Hex digest of the context and history.
+    """
+    return hashlib.sha256(json.dumps([chunk_ids, history], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Semantic cache of chat answers.
+
+    Past questions are kept as normalized embeddings in a small inner-product FAISS index. A new question
+    gets a stored answer when it is at least threshold cosine-similar to a past one and was asked in the
+    same namespace with the same context fingerprint, i.e. the same retrieved chunks and conversation history.
+    Entries expire ttl seconds after they were stored, the least recently used are evicted beyond max_entries,
+    and invalidate() drops those of a namespace, e.g. when its documents change.
+
+    Args:
+        dimension (int): Dimension of the query embeddings.
+        threshold (float): Minimum cosine similarity of a hit.
+        max_entries (int): Maximum number of cached answers.
+        ttl (float): Seconds an answer stays valid.
+        candidates (int): Number of similar past questions checked for a matching fingerprint.
+    """
+
+    def __init__(self, dimension, threshold=0.95, max_entries=1000, ttl=3600, candidates=4):
+        self.dimension = dimension
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.candidates = candidates
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+        self._lock = threading.Lock()
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        # id -> entry; ordered from least to most recently used.
+        self._entries = OrderedDict()
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, query_vector, fingerprint, namespace=""):
+        """
+        Find the answer to a similar question asked in the same namespace with the same context.
+
+        Args:
+            query_vector (np.ndarray): Embedding of the question.
+            fingerprint (str): The context fingerprint of the question.
+            namespace (str): The namespace, i.e. the user, asking.
+
+        Returns:
+            str: The cached answer, or None on a miss.
+        """
+        vector = self._normalize(query_vector)
+        now = time.time()
+        with self._lock:
+            if self._index.ntotal:
+                scores, ids = self._index.search(vector, min(self.candidates, self._index.ntotal))
+                for score, entry_id in zip(scores[0], ids[0].tolist()):
+                    if entry_id == -1 or score < self.threshold:
+                        break
+                    entry = self._entries[entry_id]
+                    if entry["expires_at"] < now:
+                        self._remove([entry_id])
+                    elif entry["fingerprint"] == fingerprint and entry["namespace"] == namespace:
+                        self._entries.move_to_end(entry_id)
+                        self.hits += 1
+                        self.latency_saved += entry["latency"]
+                        return entry["response"]
+            self.misses += 1
+        return None
+
+    def put(self, query_vector, fingerprint, response, latency, namespace=""):
+        """
+        Store an answer.
+
+        Args:
+            query_vector (np.ndarray): Embedding of the question.
+            fingerprint (str): The context fingerprint of the question.
+            response (str): The answer.
+            latency (float): Seconds it took to generate the answer, counted as saved on every hit.
+            namespace (str): The namespace, i.e. the user, the answer was generated for.
+        """
+        vector = self._normalize(query_vector)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(vector, np.array([entry_id], dtype="int64"))
+            self._entries[entry_id] = {
+                "fingerprint": fingerprint,
+                "namespace": namespace,
+                "response": response,
+                "latency": latency,
+                "expires_at": time.time() + self.ttl,
+            }
+            overflow = len(self._entries) - self.max_entries
+            if overflow > 0:
+                self._remove(list(itertools.islice(self._entries, overflow)))
+
+    def invalidate(self, namespace=None):
+        """
+        Drop the cached answers of a namespace.
+
+        Args:
+            namespace (str, optional): The namespace, i.e. the user; every answer is dropped if omitted.
+        """
+        with self._lock:
+            if namespace is None:
+                self._index.reset()
+                self._entries.clear()
+                return
+            entry_ids = [entry_id for entry_id, entry in self._entries.items() if entry["namespace"] == namespace]
+            if entry_ids:
+                self._remove(entry_ids)
+
+    def stats(self):
+        """
+        Report the effectiveness of the cache.
+
+        Returns:
+            dict: Number of entries, hits, misses, hit rate and seconds of generation saved by hits.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "latency_saved_seconds": round(self.latency_saved, 3),
+            }
+
+    def _remove(self, entry_ids):
+        self._index.remove_ids(np.array(entry_ids, dtype="int64"))
+        for entry_id in entry_ids:
+            del self._entries[entry_id]
+
+    def _normalize(self, vector):
+        vector = np.asarray(vector, dtype="float32").reshape(1, self.dimension)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
@@ -0,0 +1,180 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+class Session:
+    """
+    The chat history of one conversation of one user.
+
+    Args:
+        user (str): The user's name, i.e. the subject of their JWT.
+        conversation_id (str): Identifies the conversation among the user's conversations.
+        messages (list[dict], optional): The chat history, oldest first.
+    """
+
+    def __init__(self, user, conversation_id, messages=None):
+        self.user = user
+        self.conversation_id = conversation_id
+        self.messages = messages or []
+
+    @property
+    def key(self):
+        return self.user, self.conversation_id
+
+
+class SessionStore:
+    """
+    Conversation histories keyed by user and conversation id.
+
+    Sessions live in an in-memory LRU of at most max_sessions entries and expire ttl seconds after their
+    last use. Each session keeps at most max_messages messages and max_chars characters of content,
+    dropping its oldest messages first, along with any answer whose question was dropped. When spill_path
+    is set, sessions evicted from memory are written to SQLite and loaded back on their next use instead of
+    being lost.
+
+    Args:
+        max_sessions (int): Maximum number of sessions kept in memory.
+        ttl (float): Seconds of inactivity after which a session is discarded.
+        max_messages (int): Maximum number of messages kept per session, counting both questions and answers.
+        max_chars (int): Maximum total characters of message content kept per session.
+        spill_path (str, optional): Location of the SQLite database for evicted sessions.
+    """
+
+    def __init__(self, max_sessions=10_000, ttl=3600, max_messages=4, max_chars=16_000, spill_path=None):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.max_chars = max_chars
+        self._lock = threading.Lock()
+        # key -> (messages, last used); ordered from least to most recently used.
+        self._sessions = OrderedDict()
+        self._conn = None
+        if spill_path:
+            Path(spill_path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(spill_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    user TEXT NOT NULL,
+                    conversation_id TEXT NOT NULL,
+                    messages TEXT NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (user, conversation_id)
+                )
+                """
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, user, conversation_id):
+        """
+        Get a session, or a new empty one if it does not exist or has expired.
+
+        Args:
+            user (str): The user's name.
+            conversation_id (str): The conversation id.
+
+        Returns:
+            Session: A copy of the session; changes are kept by passing it to save.
+        """
+        key = (user, conversation_id)
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                entry = self._load_spilled(key)
+            if entry is None or entry[1] + self.ttl < now:
+                self._sessions.pop(key, None)
+                return Session(user, conversation_id)
+            self._sessions[key] = (entry[0], now)
+            self._sessions.move_to_end(key)
+            self._evict(now)
+        return Session(user, conversation_id, list(entry[0]))
+
+    def save(self, session):
+        """
+        Store a session, trimming its history to the per-session bounds.
+
+        Args:
+            session (Session): The session to store.
+        """
+        messages = session.messages = self.trim(session.messages)
+        now = time.time()
+        with self._lock:
+            self._sessions[session.key] = (list(messages), now)
+            self._sessions.move_to_end(session.key)
+            self._evict(now)
+
+    def trim(self, messages):
+        """
+        Drop the oldest messages of a history until it is within the per-session bounds.
+
+        Whole exchanges are dropped: the history kept starts with a question, never with the answer to a question
+        that was dropped.
+
+        Args:
+            messages (list[dict]): The chat history, oldest first.
+
+        Returns:
+            list[dict]: The most recent messages that fit.
+        """
+        messages = messages[-self.max_messages:] if self.max_messages else []
+        chars = sum(len(message["content"]) for message in messages)
+        while len(messages) > 1 and (chars > self.max_chars or messages[0]["role"] != "user"):
+            chars -= len(messages.pop(0)["content"])
+        return messages
+
+    def close(self):
+        """
+        Spill the sessions still in memory, if spilling is enabled, and close the database.
+        """
+        with self._lock:
+            if self._conn is not None:
+                self._spill(list(self._sessions.items()))
+                self._sessions.clear()
+                self._conn.close()
+                self._conn = None
+
+    def _evict(self, now):
+        # The least recently used sessions come first, so expired ones are always at the front.
+        evicted = []
+        while self._sessions:
+            key, (messages, last_used) = next(iter(self._sessions.items()))
+            if last_used + self.ttl >= now and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[key]
+            if last_used + self.ttl >= now:
+                evicted.append((key, (messages, last_used)))
+        if evicted and self._conn is not None:
+            self._spill(evicted)
+            self._conn.execute("DELETE FROM sessions WHERE last_used < ?", (now - self.ttl,))
+            self._conn.commit()
+
+    def _spill(self, entries):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO sessions (user, conversation_id, messages, last_used) VALUES (?, ?, ?, ?)",
+            [(user, conversation_id, json.dumps(messages), last_used)
+             for (user, conversation_id), (messages, last_used) in entries],
+        )
+        self._conn.commit()
+
+    def _load_spilled(self, key):
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT messages, last_used FROM sessions WHERE user = ? AND conversation_id = ?", key
+        ).fetchone()
+        if row is None:
+            return None
+        # Back in memory, the session is spilled again if it is evicted again.
+        self._conn.execute("DELETE FROM sessions WHERE user = ? AND conversation_id = ?", key)
+        self._conn.commit()
+        return json.loads(row[0]), row[1]
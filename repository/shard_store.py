@@ -0,0 +1,286 @@
+import asyncio
+import contextlib
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import faiss
+from langchain_community.docstore import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from repository.ann_index import base_index, vector_ids_by_document
+from repository.index_store import IndexStore
+from utils.logger import logger
+
+# Rough cost of a chunk besides its vector: text, metadata, docstore entry, id maps and lexical postings.
+_CHUNK_OVERHEAD_BYTES = 2048
+
+
+def namespace_directory(namespace):
+    """
+    Name the directory of a namespace's snapshots.
+
+    Args:
+        namespace (str): The namespace, e.g. a username.
+
+    Returns:
+        str: A file name made of the namespace's safe characters, for readability, and a digest of the
+            whole namespace, for uniqueness.
+    """
+    readable = re.sub(r"[^A-Za-z0-9_-]", "_", namespace)[:48]
+    return f"{readable}-{hashlib.sha256(namespace.encode('utf-8')).hexdigest()[:16]}"
+
+
+class Shard:
+    """
+    The vector store of one namespace, with everything needed to search and update it.
+
+    Args:
+        namespace (str): The namespace the shard belongs to.
+        vdb (FAISS): Its vector store.
+        lexical_index (LexicalIndex): BM25 index over the same vector ids.
+        index_store (IndexStore): Persistence of the shard; its lock guards the shard's indexes.
+        index_migrator (IndexMigrator, optional): Migrates the shard to the configured ANN index type.
+    """
+
+    def __init__(self, namespace, vdb, lexical_index, index_store, index_migrator=None):
+        self.namespace = namespace
+        self.vdb = vdb
+        self.lexical_index = lexical_index
+        self.index_store = index_store
+        self.index_migrator = index_migrator
+        # doc_id -> vector ids of its chunks.
+        self.vector_ids = vector_ids_by_document(vdb)
+        self.pins = 0
+
+    @contextlib.asynccontextmanager
+    async def writing(self):
+        """
+        Hold the shard for writing, see IndexStore.writing, with its indexes up to date and writable.
+
+        If another process saved the shard since it was loaded, it is loaded again first, so that the
+        changes made in the block are saved on top of the other process's rather than over them.
+
+        Yields:
+            Shard: The shard.
+        """
+        async with self.index_store.writing():
+            if self.index_store.is_stale():
+                await self._reload()
+            self.index_store.make_writable(self.vdb)
+            yield self
+
+    async def refresh(self):
+        """
+        Load the shard again if another process saved it since, so that searches see its changes.
+        """
+        if not self.index_store.is_stale():
+            return
+        async with self.index_store.lock.write():
+            # Another use of the shard may have reloaded it while this one waited for the lock.
+            if self.index_store.is_stale():
+                await self._reload()
+
+    async def _reload(self):
+        # Must be called holding the index lock for writing. The vector store is updated in place, so that
+        # holders of it, e.g. a running migration, notice the index was swapped out.
+        start = time.perf_counter()
+        vdb = await asyncio.to_thread(self.index_store.load, self.vdb.embedding_function)
+        if vdb is None:
+            return
+        self.lexical_index = await asyncio.to_thread(self.index_store.load_lexical, vdb)
+        self.vdb.index = vdb.index
+        self.vdb.docstore = vdb.docstore
+        self.vdb.index_to_docstore_id = vdb.index_to_docstore_id
+        self.vector_ids = vector_ids_by_document(self.vdb)
+        logger.info(f"Reloaded shard {self.namespace!r} with {self.vdb.index.ntotal} vectors saved by another "
+                    f"process in {time.perf_counter() - start:.3f}s")
+
+    @property
+    def is_busy(self):
+        """
+        bool: Whether the shard is in use or being migrated, and so must stay resident.
+        """
+        return self.pins > 0 or (self.index_migrator is not None and self.index_migrator.is_running)
+
+    def memory_usage(self):
+        """
+        Estimate the memory taken by the shard.
+
+        Returns:
+            int: Bytes, from the size of the index's codes plus a fixed overhead per chunk.
+        """
+        index = base_index(self.vdb.index)
+        if isinstance(index, faiss.IndexHNSW):
+            code_size = faiss.downcast_index(index.storage).code_size + 4 * index.hnsw.nb_neighbors(0)
+        else:
+            code_size = index.sa_code_size()
+        return self.vdb.index.ntotal * (code_size + _CHUNK_OVERHEAD_BYTES)
+
+
+class ShardStore:
+    """
+    One vector store per namespace, e.g. per user, each persisted in its own IndexStore directory.
+
+    A shard is loaded on first use, memory-mapping its latest snapshot, so searches only ever scan the
+    namespace's own chunks and namespaces that are never used cost nothing. Resident shards are kept in
+    LRU order; when their estimated memory exceeds memory_budget, the least recently used ones that are
+    idle are flushed to disk and dropped, and loaded again on their next use. The most recently used shard
+    is always kept, even on its own over budget.
+
+    Several processes can share the directory: writes go through Shard.writing, which takes turns with the
+    other processes, and a resident shard is reloaded on use once another process has saved it, so searches
+    see another process's writes as soon as their debounced save completes.
+
+    Args:
+        directory (str): Directory holding one snapshot directory per namespace.
+        embedding_function: Embeddings of every shard's vector store.
+        create_index (callable): Returns the empty index of a new shard.
+        memory_budget (int): Bytes of resident shards beyond which idle ones are evicted.
+        debounce (float): Seconds each shard's IndexStore waits for further writes before saving.
+        create_migrator (callable, optional): Returns the IndexMigrator of a shard, given its IndexStore.
+    """
+
+    def __init__(self, directory, embedding_function, create_index, memory_budget, debounce=2.0,
+                 create_migrator=None):
+        self.directory = Path(directory)
+        self.embedding_function = embedding_function
+        self.create_index = create_index
+        self.memory_budget = memory_budget
+        self.debounce = debounce
+        self.create_migrator = create_migrator
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        # namespace -> Shard; ordered from least to most recently used.
+        self._shards = OrderedDict()
+        # namespace -> task loading its shard, shared by concurrent first uses.
+        self._loading = {}
+
+    @contextlib.asynccontextmanager
+    async def open(self, namespace):
+        """
+        Use a namespace's shard, loading it if it is not resident.
+
+        The shard cannot be evicted until the block exits.
+
+        Args:
+            namespace (str): The namespace.
+
+        Yields:
+            Shard: The namespace's shard.
+        """
+        shard = await self._get(namespace)
+        shard.pins += 1
+        try:
+            await self._evict()
+            yield shard
+        finally:
+            shard.pins -= 1
+            # A shard was in use until it is released, which makes it the most recently used.
+            if self._shards.get(namespace) is shard:
+                self._shards.move_to_end(namespace)
+        await self._evict()
+
+    async def preload(self, namespaces):
+        """
+        Load the shards of namespaces likely to be used soon, e.g. on startup.
+
+        The least likely are loaded first, so that if the shards do not all fit the memory budget, the least
+        recently used evicted to make room are the least likely to be used.
+
+        Args:
+            namespaces (list[str]): The namespaces, most likely to be used first.
+
+        Returns:
+            int: The number of them whose shard is resident.
+        """
+        for namespace in reversed(namespaces):
+            async with self.open(namespace):
+                pass
+        return sum(1 for namespace in namespaces if namespace in self._shards)
+
+    async def flush(self):
+        """
+        Run the scheduled saves of every resident shard immediately, e.g. on shutdown.
+        """
+        for shard in list(self._shards.values()):
+            await shard.index_store.flush(shard.vdb)
+
+    def memory_usage(self):
+        """
+        Returns:
+            int: Estimated bytes taken by the resident shards.
+        """
+        return sum(shard.memory_usage() for shard in self._shards.values())
+
+    def stats(self):
+        """
+        Report how well the resident shards fit the memory budget.
+
+        Returns:
+            dict: Number of resident shards, their vectors, their estimated memory, the budget, and counts of
+                uses served by a resident shard, of loads and of evictions.
+        """
+        return {
+            "resident": len(self._shards),
+            "vectors": sum(shard.vdb.index.ntotal for shard in self._shards.values()),
+            "memory_bytes": self.memory_usage(),
+            "memory_budget_bytes": self.memory_budget,
+            "hits": self.hits,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
+
+    async def _get(self, namespace):
+        shard = self._shards.get(namespace)
+        if shard is not None:
+            self._shards.move_to_end(namespace)
+            self.hits += 1
+            await shard.refresh()
+            return shard
+        task = self._loading.get(namespace)
+        if task is None:
+            task = self._loading[namespace] = asyncio.ensure_future(self._load(namespace))
+            task.add_done_callback(lambda _: self._loading.pop(namespace, None))
+        # A cancelled caller must not cancel the load for the others waiting on it.
+        return await asyncio.shield(task)
+
+    async def _load(self, namespace):
+        start = time.perf_counter()
+        shard = await asyncio.to_thread(self._read, namespace)
+        self._shards[namespace] = shard
+        self.loads += 1
+        logger.info(f"Loaded shard {namespace!r} with {shard.vdb.index.ntotal} vectors in "
+                    f"{time.perf_counter() - start:.3f}s")
+        return shard
+
+    def _read(self, namespace):
+        index_store = IndexStore(self.directory / namespace_directory(namespace), debounce=self.debounce)
+        vdb = index_store.load(self.embedding_function) or FAISS(
+            embedding_function=self.embedding_function,
+            index=self.create_index(),
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={},
+        )
+        lexical_index = index_store.load_lexical(vdb)
+        index_migrator = self.create_migrator(index_store) if self.create_migrator is not None else None
+        return Shard(namespace, vdb, lexical_index, index_store, index_migrator)
+
+    async def _evict(self):
+        if self.memory_usage() <= self.memory_budget:
+            return
+        for shard in list(self._shards.values())[:-1]:
+            if shard.is_busy:
+                continue
+            # Saved before it is dropped, while it is still resident, so a reload never misses a write.
+            await shard.index_store.flush(shard.vdb)
+            if shard.is_busy or shard.index_store.has_pending_save or self._shards.get(shard.namespace) is not shard:
+                continue
+            del self._shards[shard.namespace]
+            self.evictions += 1
+            logger.info(f"Evicted shard {shard.namespace!r} with {shard.vdb.index.ntotal} vectors")
+            if self.memory_usage() <= self.memory_budget:
+                return
@@ -0,0 +1,389 @@
+import abc
+import contextlib
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+class UserStore(abc.ABC):
+    """
+    Where users and their login sessions are kept.
+
+    A login session is identified by its token and records when it was last used, as a POSIX timestamp.
+    UserService works against this interface; InMemoryUserStore serves a single process and tests, and
+    SQLiteUserStore is shared by every worker process using the same database file. Its methods may block,
+    e.g. on a database lock, so UserService calls them in worker threads, except cached_session, which must
+    not block.
+    """
+
+    @abc.abstractmethod
+    def get_password_hash(self, username):
+        """
+        Args:
+            username (str): The username.
+
+        Returns:
+            str: The user's password hash, or None if the user does not exist.
+        """
+
+    @abc.abstractmethod
+    def add_user(self, username, password_hash):
+        """
+        Add a user, unless the username is taken.
+
+        Args:
+            username (str): The username.
+            password_hash (str): The user's password hash.
+
+        Returns:
+            bool: True if the user was added, False if the username already exists.
+        """
+
+    @abc.abstractmethod
+    def set_password_hash(self, username, password_hash, expected=None):
+        """
+        Create a user or replace their password hash.
+
+        Args:
+            username (str): The username.
+            password_hash (str): The new password hash.
+            expected (str, optional): Only replace the hash if it still equals this one.
+
+        Returns:
+            bool: True if the hash was stored.
+        """
+
+    @abc.abstractmethod
+    def add_session(self, token, username, last_seen):
+        """
+        Start a login session.
+
+        Args:
+            token (str): The session's token.
+            username (str): The user it belongs to.
+            last_seen (float): Its start time.
+        """
+
+    @abc.abstractmethod
+    def get_session(self, token, fresh=False):
+        """
+        Args:
+            token (str): The session's token.
+            fresh (bool): Whether to bypass any cache and read the latest state.
+
+        Returns:
+            float: When the session was last used, or None if there is no such session.
+        """
+
+    def cached_session(self, token):
+        """
+        Look a login session up without blocking, e.g. in a cache.
+
+        Args:
+            token (str): The session's token.
+
+        Returns:
+            float: When the session was last used, or None if that is not known without reading get_session.
+        """
+        return None
+
+    @abc.abstractmethod
+    def touch_session(self, token, last_seen):
+        """
+        Record a use of a login session.
+
+        Args:
+            token (str): The session's token.
+            last_seen (float): The time of use.
+        """
+
+    @abc.abstractmethod
+    def delete_session(self, token):
+        """
+        End a login session; unknown tokens are ignored.
+
+        Args:
+            token (str): The session's token.
+        """
+
+    @abc.abstractmethod
+    def sweep_sessions(self, cutoff):
+        """
+        End the login sessions last used before a time.
+
+        Args:
+            cutoff (float): POSIX timestamp.
+
+        Returns:
+            int: The number of sessions ended.
+        """
+
+    @abc.abstractmethod
+    def session_count(self):
+        """
+        Returns:
+            int: The number of login sessions.
+        """
+
+    @abc.abstractmethod
+    def recent_users(self, limit):
+        """
+        Args:
+            limit (int): Maximum number of users.
+
+        Returns:
+            list[str]: The users with login sessions, the most recently seen first.
+        """
+
+    def close(self):
+        pass
+
+
+class InMemoryUserStore(UserStore):
+    """
+    Users and login sessions in dictionaries of the current process; they are lost on restart.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # username -> password hash
+        self.users = {}
+        # token -> (username, last seen); ordered from least to most recently used.
+        self.sessions = {}
+
+    def get_password_hash(self, username):
+        return self.users.get(username)
+
+    def add_user(self, username, password_hash):
+        with self._lock:
+            if username in self.users:
+                return False
+            self.users[username] = password_hash
+        return True
+
+    def set_password_hash(self, username, password_hash, expected=None):
+        with self._lock:
+            if expected is not None and self.users.get(username) != expected:
+                return False
+            self.users[username] = password_hash
+        return True
+
+    def add_session(self, token, username, last_seen):
+        with self._lock:
+            self.sessions[token] = (username, last_seen)
+
+    def get_session(self, token, fresh=False):
+        session = self.sessions.get(token)
+        return session[1] if session is not None else None
+
+    def cached_session(self, token):
+        return self.get_session(token)
+
+    def touch_session(self, token, last_seen):
+        with self._lock:
+            session = self.sessions.pop(token, None)
+            if session is not None:
+                # Re-inserted last, so sessions stay ordered by their last use.
+                self.sessions[token] = (session[0], max(session[1], last_seen))
+
+    def delete_session(self, token):
+        with self._lock:
+            self.sessions.pop(token, None)
+
+    def sweep_sessions(self, cutoff):
+        with self._lock:
+            expired = []
+            # The least recently used sessions come first, so expired ones are always at the front.
+            for token, (_, last_seen) in self.sessions.items():
+                if last_seen >= cutoff:
+                    break
+                expired.append(token)
+            for token in expired:
+                del self.sessions[token]
+        return len(expired)
+
+    def session_count(self):
+        return len(self.sessions)
+
+    def recent_users(self, limit):
+        users = []
+        with self._lock:
+            for username, _ in reversed(self.sessions.values()):
+                if username not in users:
+                    users.append(username)
+                    if len(users) == limit:
+                        break
+        return users
+
+
+class SQLiteUserStore(UserStore):
+    """
+    Users and login sessions in a SQLite database, shared by every worker process that opens it.
+
+    The database runs in WAL mode, so readers never wait for the writer, and is used through a pool of up to
+    pool_size connections, each keeping its statements prepared between calls. Session lookups are served by
+    an in-process LRU of at most cache_size sessions for cache_ttl seconds: a session ended by another
+    process, e.g. by a logout, may be seen as live here until its entry expires, and callers that need the
+    latest state, e.g. before declaring a session expired, pass fresh=True.
+
+    Args:
+        path (str): Location of the SQLite database file.
+        pool_size (int): Maximum number of connections.
+        cache_size (int): Maximum number of sessions cached.
+        cache_ttl (float): Seconds a session is served from the cache before it is read again.
+    """
+
+    def __init__(self, path, pool_size=4, cache_size=10_000, cache_ttl=2.0):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.pool_size = pool_size
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._pool = queue.LifoQueue()
+        self._pool_lock = threading.Lock()
+        self._connections = []
+        # token -> (last seen, time cached); ordered from least to most recently used.
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS users (
+                    username TEXT PRIMARY KEY,
+                    password_hash TEXT NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS login_sessions (
+                    token TEXT PRIMARY KEY,
+                    username TEXT NOT NULL,
+                    last_seen REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS login_sessions_last_seen ON login_sessions (last_seen)")
+
+    def get_password_hash(self, username):
+        with self._connection() as conn:
+            row = conn.execute("SELECT password_hash FROM users WHERE username = ?", (username,)).fetchone()
+        return row[0] if row is not None else None
+
+    def add_user(self, username, password_hash):
+        with self._connection() as conn:
+            cursor = conn.execute("INSERT OR IGNORE INTO users (username, password_hash) VALUES (?, ?)",
+                                  (username, password_hash))
+        return cursor.rowcount > 0
+
+    def set_password_hash(self, username, password_hash, expected=None):
+        with self._connection() as conn:
+            if expected is None:
+                cursor = conn.execute("INSERT OR REPLACE INTO users (username, password_hash) VALUES (?, ?)",
+                                      (username, password_hash))
+            else:
+                cursor = conn.execute("UPDATE users SET password_hash = ? WHERE username = ? AND password_hash = ?",
+                                      (password_hash, username, expected))
+        return cursor.rowcount > 0
+
+    def add_session(self, token, username, last_seen):
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO login_sessions (token, username, last_seen) VALUES (?, ?, ?)",
+                         (token, username, last_seen))
+        self._cache_put(token, last_seen)
+
+    def get_session(self, token, fresh=False):
+        if not fresh:
+            last_seen = self.cached_session(token)
+            if last_seen is not None:
+                return last_seen
+        with self._connection() as conn:
+            row = conn.execute("SELECT last_seen FROM login_sessions WHERE token = ?", (token,)).fetchone()
+        if row is None:
+            with self._cache_lock:
+                self._cache.pop(token, None)
+            return None
+        self._cache_put(token, row[0])
+        return row[0]
+
+    def cached_session(self, token):
+        with self._cache_lock:
+            entry = self._cache.get(token)
+            if entry is not None and time.monotonic() - entry[1] < self.cache_ttl:
+                self._cache.move_to_end(token)
+                return entry[0]
+        return None
+
+    def touch_session(self, token, last_seen):
+        with self._connection() as conn:
+            cursor = conn.execute("UPDATE login_sessions SET last_seen = MAX(last_seen, ?) WHERE token = ?",
+                                  (last_seen, token))
+        if cursor.rowcount:
+            self._cache_put(token, last_seen)
+
+    def delete_session(self, token):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM login_sessions WHERE token = ?", (token,))
+        with self._cache_lock:
+            self._cache.pop(token, None)
+
+    def sweep_sessions(self, cutoff):
+        with self._connection() as conn:
+            cursor = conn.execute("DELETE FROM login_sessions WHERE last_seen < ?", (cutoff,))
+        with self._cache_lock:
+            for token in [token for token, (last_seen, _) in self._cache.items() if last_seen < cutoff]:
+                del self._cache[token]
+        return cursor.rowcount
+
+    def session_count(self):
+        with self._connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM login_sessions").fetchone()[0]
+
+    def recent_users(self, limit):
+        with self._connection() as conn:
+            rows = conn.execute("SELECT username FROM login_sessions GROUP BY username ORDER BY MAX(last_seen) DESC "
+                                "LIMIT ?", (limit,)).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        with self._pool_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+            self._pool = queue.LifoQueue()
+
+    @contextlib.contextmanager
+    def _connection(self):
+        """
+        Borrow a connection from the pool, opening one if fewer than pool_size exist, and commit on success.
+        """
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                conn = self._connect() if len(self._connections) < self.pool_size else None
+            if conn is None:
+                conn = self._pool.get()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._pool.put(conn)
+
+    def _connect(self):
+        # Waits up to timeout seconds for a write lock held by another process.
+        conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, cached_statements=64)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._connections.append(conn)
+        return conn
+
+    def _cache_put(self, token, last_seen):
+        with self._cache_lock:
+            self._cache[token] = (last_seen, time.monotonic())
+            self._cache.move_to_end(token)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
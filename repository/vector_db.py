@@ -1,40 +1,110 @@
-import faiss
+from collections import namedtuple
+
 import numpy as np
 
+from repository.ann_index import create_index, search
+
+SearchResult = namedtuple("SearchResult", ["ids", "scores", "payloads"])
+
 
 class VectorDB:
-    def __init__(self):
-        _DIMENSION = 1536
-        self.index = faiss.IndexFlatL2(_DIMENSION)
+    """
+    FAISS index with a payload per vector and batched add/search.
 
-    async def save_vector(self, vectors):
+    Vectors are expected to be L2-normalized float32, as OpenAI embeddings are, so that the squared L2
+    distances of the index translate directly into cosine similarities. Payloads are kept in a NumPy
+    object array indexed by FAISS id, so that a whole result matrix is resolved with one fancy-indexing
+    operation instead of a Python loop per row.
+
+    Args:
+        index_type (str): One of the ann_index.INDEX_TYPES; IVF types must be trained before adding.
+        dimension (int): Dimension of the vectors.
+        **index_params: nlist, pq_m or hnsw_m for create_index.
+    """
+
+    def __init__(self, index_type="flat", dimension=1536, **index_params):
+        self.dimension = dimension
+        self.index = create_index(index_type, dimension, **index_params)
+        self._payloads = np.empty(1024, dtype=object)
+
+    def __len__(self):
+        return self.index.ntotal
+
+    def add_batch(self, vectors, payloads=None):
         """
-        Saves the vector in the database with the provided key.
+        Add many vectors with one FAISS call.
+
+        A C-contiguous float32 array (or any float32 buffer of n * dimension values) is handed to FAISS
+        without being copied; other inputs are converted first.
 
         Args:
+            vectors (np.ndarray | buffer): L2-normalized vectors, of shape (n, dimension).
+            payloads (Sequence, optional): One payload per vector, e.g. the chunk text or docstore id.
 
+        Returns:
+            np.ndarray: The ids assigned to the vectors.
         """
-        # vectors = np.array(vectors).astype('float32')
-        # faiss.normalize_L2(vectors)
+        vectors = np.ascontiguousarray(np.asarray(vectors, dtype="float32").reshape(-1, self.dimension))
+        if payloads is not None and len(payloads) != len(vectors):
+            raise ValueError(f"Got {len(payloads)} payloads for {len(vectors)} vectors")
+        start = self.index.ntotal
+        end = start + len(vectors)
+        if end > len(self._payloads):
+            grown = np.empty(max(end, 2 * len(self._payloads)), dtype=object)
+            grown[:start] = self._payloads[:start]
+            self._payloads = grown
         self.index.add(vectors)
-        pass
+        if payloads is not None:
+            # Assigning through a slice would let NumPy unpack sequence payloads, so fill an object array first.
+            column = np.empty(len(vectors), dtype=object)
+            column[:] = list(payloads)
+            self._payloads[start:end] = column
+        return np.arange(start, end, dtype="int64")
+
+    def search_batch(self, queries, k, nprobe=None, ef_search=None):
+        """
+        Search many queries with one FAISS call.
+
+        Args:
+            queries (np.ndarray): L2-normalized query vectors, of shape (n, dimension).
+            k (int): Number of results per query.
+            nprobe (int, optional): Number of IVF cells to visit.
+            ef_search (int, optional): Size of the HNSW candidate list.
+
+        Returns:
+            SearchResult: ids (int64), cosine scores (float32) and payloads (object), each of shape (n, k)
+                and ordered best first per row; missing results have id -1, score -inf and payload None.
+        """
+        queries = np.ascontiguousarray(np.asarray(queries, dtype="float32").reshape(-1, self.dimension))
+        distances, ids = search(self.index, queries, k, nprobe, ef_search)
+        missing = ids < 0
+        scores = 1.0 - distances / 2.0
+        scores[missing] = -np.inf
+        payloads = self._payloads[np.where(missing, 0, ids)]
+        payloads[missing] = None
+        return SearchResult(ids, scores, payloads)
+
+    async def save_vector(self, vectors):
+        """
+        Saves vectors in the database.
+
+        Args:
+            vectors (np.ndarray): L2-normalized vectors, of shape (n, dimension).
+        """
+        self.add_batch(vectors)
 
     async def get_similar_data(self, query_vector, threshold=0.2, k=10):
         """
         Searches for matching vectors based on a query vector.
 
         Args:
-            threshold:
-            query (str): Query string.
+            query_vector (np.ndarray): L2-normalized query vector.
+            threshold (float): Minimum cosine similarity of a match.
+            k (int): Maximum number of matches.
 
         Returns:
-            str: Matched documents' content concatenated.
-        """
-        _normalized_vector = np.array(query_vector).astype("float32").reshape(1, -1)
-        # faiss.normalize_L2(_normalized_vector)
-        vector_string = ""
-        distances, indices = self.index.search(_normalized_vector, k)
-        for val in indices[0]:
-            if val != -1 and distances[0][val] > threshold:
-                vector_string += str(self.index.reconstruct(int(val))) + "\n\n"
-        return vector_string
+            list[tuple]: (id, score, payload) of each match, best first.
+        """
+        result = self.search_batch(query_vector, k)
+        keep = result.scores[0] >= threshold
+        return list(zip(result.ids[0][keep].tolist(), result.scores[0][keep].tolist(), result.payloads[0][keep]))
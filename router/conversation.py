@@ -1,36 +1,151 @@
-from fastapi import APIRouter, Body, Depends
+import json
+from typing import Optional
 
-from config import user_service
-from service.conversation_service import ConversationService
-from utils.get_current_user import JWTBearer
+from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+
+from repository.session_store import Session
+from utils.dependencies import get_container
+from utils.get_current_user import CurrentUser
+from utils.logger import logger
 
 conversation_router = APIRouter()
-conversation_service = ConversationService()
+current_user = CurrentUser()
+
+
+async def to_server_sent_events(events):
+    """
+    Encode the events yielded by a ConversationService stream as Server-Sent Events.
+
+    Tokens are sent as plain data messages, the closing metrics as a "metrics" event,
+    followed by a final "[DONE]" message. The response has already started when the stream fails, so
+    a failure is reported as an "error" event with its detail, and ends the stream instead of "[DONE]".
+    """
+    try:
+        async for event in events:
+            if "metrics" in event:
+                yield f"event: metrics\ndata: {json.dumps(event['metrics'])}\n\n"
+            else:
+                yield f"data: {json.dumps(event)}\n\n"
+    except Exception as e:
+        logger.exception("Chat stream failed")
+        detail = e.detail if isinstance(e, HTTPException) else "Failed to generate the response"
+        yield f"event: error\ndata: {json.dumps({'detail': detail})}\n\n"
+        return
+    yield "data: [DONE]\n\n"
 
 
-@conversation_router.post("/chat", dependencies=[Depends(JWTBearer(user_service))])
-async def chat(query: str = Body(default="Your query...")):
+@conversation_router.post("/chat")
+async def chat(query: str = Body(default="Your query..."), conversation_id: str = "default",
+               nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+               username: str = Depends(current_user), container=Depends(get_container)):
     """
     POST endpoint that accepts a query as input and returns a response from the model.
 
     Args:
         query (str): The user's query to the model. Defaults to "Your query...".
+        conversation_id (str): The conversation of the authenticated user to continue. Defaults to "default".
+        nprobe (int, optional): IVF cells to visit for this query's retrieval.
+        ef_search (int, optional): HNSW candidate list size for this query's retrieval.
+        username (str): The authenticated user, from the JWT.
+        container (Container): The application's services.
 
     Returns:
         String: The model's response to the user's query.
     """
-    return await conversation_service.chat(query)
+    session = container.session_store.get(username, conversation_id)
+    return await container.conversation_service.chat(session, query, nprobe, ef_search)
 
 
-@conversation_router.post("/new-chat", dependencies=[Depends(JWTBearer(user_service))])
-async def new_chat(query: str = Body(default="Your query...")):
+@conversation_router.post("/new-chat")
+async def new_chat(query: str = Body(default="Your query..."), conversation_id: str = "default",
+                   username: str = Depends(current_user), container=Depends(get_container)):
     """
     Invalidate the context (currently uploaded documents and chunks) and start a new conversation.
 
     Args:
         query (str): The user's query to the model. Defaults to "Your query...".
+        conversation_id (str): The conversation of the authenticated user to start over. Defaults to "default".
+        username (str): The authenticated user, from the JWT.
+        container (Container): The application's services.
 
     Returns:
         String: The model's response to the user's query.
     """
-    return await conversation_service.new_chat(query)
+    session = Session(username, conversation_id)
+    return await container.conversation_service.new_chat(session, query)
+
+
+@conversation_router.post("/chat/stream")
+async def chat_stream(query: str = Body(default="Your query..."), conversation_id: str = "default",
+                      nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                      username: str = Depends(current_user), container=Depends(get_container)):
+    """
+    POST endpoint that streams the model's response to a query as Server-Sent Events.
+
+    Args:
+        query (str): The user's query to the model. Defaults to "Your query...".
+        conversation_id (str): The conversation of the authenticated user to continue. Defaults to "default".
+        nprobe (int, optional): IVF cells to visit for this query's retrieval.
+        ef_search (int, optional): HNSW candidate list size for this query's retrieval.
+        username (str): The authenticated user, from the JWT.
+        container (Container): The application's services.
+
+    Returns:
+        StreamingResponse: A text/event-stream of tokens, closed by a metrics event, or by an error event if
+            the response fails.
+    """
+    session = container.session_store.get(username, conversation_id)
+    events = container.conversation_service.chat_stream(session, query, nprobe, ef_search)
+    return StreamingResponse(to_server_sent_events(events),
+                             media_type="text/event-stream")
+
+
+@conversation_router.post("/new-chat/stream")
+async def new_chat_stream(query: str = Body(default="Your query..."), conversation_id: str = "default",
+                          username: str = Depends(current_user), container=Depends(get_container)):
+    """
+    Start a new conversation and stream the model's response as Server-Sent Events.
+
+    Args:
+        query (str): The user's query to the model. Defaults to "Your query...".
+        conversation_id (str): The conversation of the authenticated user to start over. Defaults to "default".
+        username (str): The authenticated user, from the JWT.
+        container (Container): The application's services.
+
+    Returns:
+        StreamingResponse: A text/event-stream of tokens, closed by a metrics event.
+    """
+    session = Session(username, conversation_id)
+    return StreamingResponse(to_server_sent_events(container.conversation_service.new_chat_stream(session, query)),
+                             media_type="text/event-stream")
+
+
+@conversation_router.get("/chat/cache-stats")
+async def cache_stats(username: str = Depends(current_user), container=Depends(get_container)):
+    """
+    Report the effectiveness of the semantic response cache.
+
+    Args:
+        username (str): The authenticated user, from the JWT.
+        container (Container): The application's services.
+
+    Returns:
+        dict: Number of cached answers, hits, misses, hit rate and seconds of generation saved.
+    """
+    return container.conversation_service.response_cache.stats()
+
+
+@conversation_router.get("/chat/embedding-stats")
+async def embedding_stats(username: str = Depends(current_user), container=Depends(get_container)):
+    """
+    Report how concurrent query embeddings are being coalesced into batches.
+
+    Args:
+        username (str): The authenticated user, from the JWT.
+        container (Container): The application's services.
+
+    Returns:
+        dict: Number of queries, deduplicated queries and batches, mean batch size and the batch size histogram.
+    """
+    return container.embeddings.stats()
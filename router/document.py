@@ -1,75 +1,180 @@
-import os
-from pathlib import Path
+from typing import Optional
 
-from fastapi import APIRouter, UploadFile, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, Depends, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 
-from config import UPLOAD_DIR
-from config import user_service
-from service.document_service import DocumentService
-from utils.get_current_user import JWTBearer
+from utils.dependencies import get_container
+from utils.file_response import caching_headers, is_not_modified, iter_file_range
+from utils.get_current_user import CurrentUser
+
+TEXT_MEDIA_TYPE = "text/plain; charset=utf-8"
 
 document_router = APIRouter()
-document_service = DocumentService()
+current_user = CurrentUser()
 
 
-@document_router.post("/process-document", dependencies=[Depends(JWTBearer(user_service))])
-async def process_document(file: UploadFile):
+@document_router.post("/process-document", status_code=202)
+async def process_document(file: UploadFile, username: str = Depends(current_user),
+                           container=Depends(get_container)):
     """
-    Process the uploaded document and store it in the local storage
+    Store the uploaded document and queue it for processing into the user's own index shard.
+    Poll /jobs/{job_id} for the progress of the extraction, chunking and embedding.
+
     Args:
         file (UploadFile): The uploaded file object.
+        username (str): The authenticated user, from the JWT.
+        container (Container): The application's services.
+
+    Returns:
+        dict: The queued job, including its job id and document id.
+
+    Raises:
+        HTTPException: 429 if the ingestion queue is full.
+    """
+    return await container.ingestion_service.submit(file, username)
+
+
+@document_router.post("/document/{doc_id}/reindex", status_code=202)
+async def reindex_document(doc_id: str, username: str = Depends(current_user),
+                           container=Depends(get_container)):
+    """
+    Queue a stored document to be chunked and embedded again.
+    Its new chunks replace the old ones atomically when the job finishes; poll /jobs/{job_id} for progress.
+
+    Args:
+        doc_id (str): Document ID.
+        username (str): The authenticated user, from the JWT.
+        container (Container): The application's services.
+
+    Returns:
+        dict: The queued job.
+
+    Raises:
+        HTTPException: 404 if the user has no such document, 429 if the ingestion queue is full.
+    """
+    return await container.ingestion_service.reindex(doc_id, username)
+
+
+@document_router.delete("/document/{doc_id}")
+async def delete_document(doc_id: str, username: str = Depends(current_user),
+                          container=Depends(get_container)):
+    """
+    Delete a document, its chunks and its files.
+
+    Args:
+        doc_id (str): Document ID.
+        username (str): The authenticated user, from the JWT.
+        container (Container): The application's services.
 
     Returns:
-        str: Processed document content.
+        dict: The doc_id and the number of chunks deleted.
+
+    Raises:
+        HTTPException: 404 if the user has no such document.
     """
-    doc_id = await document_service.file_upload(file)
-    return await document_service.process_document_for_rag(doc_id)
+    return await container.document_service.delete_document(doc_id, username)
 
 
-@document_router.get("/get-documents", dependencies=[Depends(JWTBearer(user_service))])
-async def get_documents(offset: int = 0, limit: int = 10):
+@document_router.get("/jobs/{job_id}")
+async def get_job(job_id: str, username: str = Depends(current_user), container=Depends(get_container)):
     """
-    Get all PDF documents (not their chunks) for this chat-session from the local storage.
-    Optionally add offset & limit to paginate the results.
+    Get the status of an ingestion job.
 
     Args:
-        offset (int): Offset value for pagination (default is 0).
-        limit (int): Limit value for pagination (default is 10).
+        job_id (str): Job ID returned by /process-document.
+        username (str): The authenticated user, from the JWT.
+        container (Container): The application's services.
 
     Returns:
-        List: List of documents.
+        dict: The job's status, current stage, page and chunk progress, and per-stage timings.
+    """
+    return await container.ingestion_service.get_job(job_id, username)
+
+
+@document_router.get("/get-documents")
+async def get_documents(limit: int = Query(default=10, ge=1, le=100), cursor: Optional[str] = None,
+                        status: Optional[str] = None, sort: str = "created_at",
+                        order: str = Query(default="desc", pattern="^(asc|desc)$"),
+                        username: str = Depends(current_user), container=Depends(get_container)):
     """
-    # List all files in the upload directory
-    directory = Path(UPLOAD_DIR)
-    files = os.listdir(directory)
-    file_map = document_service.file_to_doc_map
+    Get the user's PDF documents (not their chunks) from the document catalog, one page at a time.
+    Pass the next_cursor of a page as cursor to get the following one.
 
-    processed_files = [file_map[file] for file in files if file in file_map]
+    Args:
+        limit (int): Maximum number of documents per page (default is 10, at most 100).
+        cursor (str, optional): The next_cursor of the previous page; the first page if omitted.
+        status (str, optional): Only list documents in this status: uploaded, processing, indexed or failed.
+        sort (str): Sort by created_at (default), updated_at, filename, size, pages or chunks.
+        order (str): "desc" (default) or "asc".
+        username (str): The authenticated user, from the JWT.
+        container (Container): The application's services.
 
-    # Paginate the results
-    documents = processed_files[offset: offset + limit]
+    Returns:
+        dict: The "documents" of the page, each with its doc_id, filename, size, page and chunk counts, status
+            and timestamps, and the "next_cursor", null after the last page.
 
-    return documents
+    Raises:
+        HTTPException: 400 if the sort column or the cursor is invalid.
+    """
+    return await container.document_service.list_documents(username, status=status, sort=sort,
+                                                           descending=order == "desc", limit=limit, cursor=cursor)
 
 
-@document_router.get("/get-document/{doc_id}", dependencies=[Depends(JWTBearer(user_service))])
-async def get_document(doc_id: str):
+@document_router.get("/get-document/{doc_id}")
+async def get_document(doc_id: str, request: Request, username: str = Depends(current_user),
+                       container=Depends(get_container)):
     """
-    Get a specific document by its ID.
+    Get the extracted text of a specific document of the user by its ID.
+
+    The text is streamed from disk as text/plain. Byte ranges can be requested with a Range header, and the
+    response carries an ETag and Last-Modified so that clients can revalidate with If-None-Match or
+    If-Modified-Since and get a 304.
 
     Args:
         doc_id (str): Document ID.
+        request (Request): The HTTP request, for its Range and conditional headers.
+        username (str): The authenticated user, from the JWT.
+        container (Container): The application's services.
 
     Returns:
-        str: File content if the document exists, else raises HTTPException.
+        FileResponse: The text, the requested ranges of it, or 304 if the client's copy is current.
+
+    Raises:
+        HTTPException: 404 if the user has no such document or it has not been extracted yet.
     """
-    # Check if the document exists
-    directory = Path(UPLOAD_DIR)
-    if not os.path.exists(os.path.join(directory, f"{doc_id}.pdf")):
-        raise HTTPException(status_code=404, detail="Document not found")
+    path, stat_result = await container.document_service.get_text(doc_id, username)
+    headers = caching_headers(stat_result)
+    if is_not_modified(request.headers, stat_result, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=TEXT_MEDIA_TYPE, headers=headers, stat_result=stat_result)
+
+
+@document_router.get("/get-document/{doc_id}/pages/{page}")
+async def get_document_page(doc_id: str, page: int, request: Request, username: str = Depends(current_user),
+                            container=Depends(get_container)):
+    """
+    Get the extracted text of one page of a document of the user.
+
+    The page is located from the byte offsets recorded at extraction and streamed from disk, with an ETag and
+    Last-Modified like /get-document.
 
-    # Read the file content
-    with open(os.path.join(UPLOAD_DIR, f"{doc_id}.pdf"), "r") as file:
-        file_content = file.read()
+    Args:
+        doc_id (str): Document ID.
+        page (int): Page number, starting at 1.
+        request (Request): The HTTP request, for its conditional headers.
+        username (str): The authenticated user, from the JWT.
+        container (Container): The application's services.
 
-    return file_content
+    Returns:
+        StreamingResponse: The text of the page, or 304 if the client's copy is current.
+
+    Raises:
+        HTTPException: 404 if the user has no such document or page, or the document must be re-indexed to
+            record its page offsets.
+    """
+    path, start, end, stat_result = await container.document_service.get_page(doc_id, username, page)
+    headers = caching_headers(stat_result, variant=f"-p{page}")
+    if is_not_modified(request.headers, stat_result, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    headers["Content-Length"] = str(end - start)
+    return StreamingResponse(iter_file_range(path, start, end), media_type=TEXT_MEDIA_TYPE, headers=headers)
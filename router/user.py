@@ -1,13 +1,13 @@
-from fastapi import APIRouter, Body, Depends, Query, Request
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request
 
-from config import user_service
+from utils.dependencies import get_container
 from utils.get_current_user import JWTBearer
 
 user_router = APIRouter()
 
 
 @user_router.post("/login")
-async def login(username: str = Body(...), password: str = Body(...)):
+async def login(username: str = Body(...), password: str = Body(...), container=Depends(get_container)):
     """
     User login endpoint
 
@@ -16,15 +16,16 @@ async def login(username: str = Body(...), password: str = Body(...)):
     Args:
         username (str): The username of the user.
         password (str): The password of the user.
+        container (Container): The application's services.
 
     Returns:
         dict: A dictionary containing the user's authentication token.
     """
-    return user_service.login(username, password)
+    return await container.user_service.login(username, password)
 
 
 @user_router.post("/register")
-async def register(username: str = Body(...), password: str = Body(...)):
+async def register(username: str = Body(...), password: str = Body(...), container=Depends(get_container)):
     """
     User registration endpoint
 
@@ -33,15 +34,16 @@ async def register(username: str = Body(...), password: str = Body(...)):
     Args:
         username (str): The username of the user.
         password (str): The password of the user.
+        container (Container): The application's services.
 
     Returns:
         dict: A dictionary containing the success message.
     """
-    return user_service.register(username, password)
+    return await container.user_service.register(username, password)
 
 
-@user_router.post("/logout", dependencies=[Depends(JWTBearer(user_service))])
-async def logout(request: Request):
+@user_router.post("/logout", dependencies=[Depends(JWTBearer())])
+async def logout(request: Request, container=Depends(get_container)):
     """
     User logout endpoint
 
@@ -49,42 +51,53 @@ async def logout(request: Request):
 
     Args:
         request (Request): The HTTP request object.
+        container (Container): The application's services.
 
     Returns:
         dict: A dictionary containing the success message.
     """
-    token = request.headers["authorization"]
-    return user_service.logout(token)
+    return await container.user_service.logout(request.state.token)
 
 
-@user_router.get("/user", dependencies=[Depends(JWTBearer(user_service))])
-async def get_user_details(username: str = Query(default=None)):
+@user_router.get("/user", dependencies=[Depends(JWTBearer())])
+async def get_user_details(request: Request, username: str = Query(default=None), container=Depends(get_container)):
     """
     User get endpoint
 
     Retrieve details of the specified user.
 
     Args:
-        username (str, optional): The username of the user to retrieve details for.
+        request (Request): The HTTP request object.
+        username (str, optional): The username of the user to retrieve details for; the authenticated user
+            by default.
+        container (Container): The application's services.
 
     Returns:
         dict: A dictionary containing the user details.
     """
-    return user_service.get_user_details(username)
+    return await container.user_service.get_user_details(username or request.state.user)
 
 
-@user_router.post("/user", dependencies=[Depends(JWTBearer(user_service))])
-async def set_user_details(username: str = Body(...), password: str = Body(...)):
+@user_router.post("/user", dependencies=[Depends(JWTBearer())])
+async def set_user_details(request: Request, username: str = Body(...), password: str = Body(...),
+                           container=Depends(get_container)):
     """
     User create/update endpoint
 
     Creates or updates details of the specified user.
 
     Args:
+        request (Request): The HTTP request object.
         username (str): The username of the user.
         password (str): The password of the user.
+        container (Container): The application's services.
 
     Returns:
         dict: A dictionary containing the success message.
+
+    Raises:
+        HTTPException: 403 if the user is not the authenticated user.
     """
-    return user_service.set_user_details(username, password)
+    if username != request.state.user:
+        raise HTTPException(status_code=403, detail="Cannot change the details of another user")
+    return await container.user_service.set_user_details(username, password)
@@ -0,0 +1,260 @@
+import re
+from collections import namedtuple
+
+from langchain_core.documents import Document
+
+from utils.tokenizer import get_encoding
+
+# A sentence ends at ".", "!" or "?" followed by whitespace; a blank line ends a paragraph.
+_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+_WORD = re.compile(r"\s*\S+")
+
+# A piece of a page that is never split further unless it alone exceeds the chunk size.
+# start and end are character offsets into the extracted text of the whole document.
+_Segment = namedtuple("_Segment", ["start", "end", "page", "tokens", "paragraph_start"])
+
+
+class TextChunker:
+    """
+    Token-aware chunker that keeps paragraphs and sentences together.
+
+    Pages are cut into sentences, which are packed into chunks of at most chunk_size tokens. A chunk
+    preferably ends at a paragraph (or page) boundary as long as it stays at least half full, and each
+    chunk starts with up to chunk_overlap tokens of whole sentences from the end of the previous one.
+    Sentences longer than a chunk are split between words, and words longer than a chunk between characters.
+
+    Args:
+        chunk_size (int): Maximum number of tokens per chunk.
+        chunk_overlap (int): Maximum number of tokens repeated from the previous chunk.
+        model (str): Model whose tokenizer measures the chunks.
+        encoding (tiktoken.Encoding, optional): Tokenizer override; defaults to the model's encoding,
+            loaded on first use.
+    """
+
+    def __init__(self, chunk_size=256, chunk_overlap=32, model="text-embedding-ada-002", encoding=None):
+        if chunk_size < 2 or not 0 <= chunk_overlap < chunk_size:
+            raise ValueError("chunk_size must be at least 2 and chunk_overlap between 0 and chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.model = model
+        self._encoding = encoding
+
+    @property
+    def encoding(self):
+        if self._encoding is None:
+            self._encoding = get_encoding(self.model)
+        return self._encoding
+
+    def stream(self, doc_id):
+        """
+        Start chunking a document whose pages arrive one at a time.
+
+        Args:
+            doc_id (str): The unique identifier (UUID) of the document, stored in each chunk's metadata.
+
+        Returns:
+            ChunkStream: Accepts the pages in order and returns chunks as they are completed.
+        """
+        return ChunkStream(self, doc_id)
+
+    def split_pages(self, pages, doc_id):
+        """
+        Chunk a document in a single pass over its pages.
+
+        Args:
+            pages (Iterable[str]): The text of each page, in order.
+            doc_id (str): The unique identifier (UUID) of the document.
+
+        Yields:
+            Document: The chunks, with doc_id, page, chunk, start_index and end_index metadata.
+        """
+        stream = self.stream(doc_id)
+        for page in pages:
+            yield from stream.add_page(page)
+        yield from stream.finish()
+
+    def segments(self, text, offset, page):
+        """
+        Cut the text of a page into sentences that fit in a chunk.
+
+        Args:
+            text (str): The text of the page.
+            offset (int): Character offset of the page in the document.
+            page (int): The page number, starting at 1.
+
+        Returns:
+            list[_Segment]: The non-blank sentences of the page, in order.
+        """
+        pieces = []
+        start, paragraph_start = 0, True
+        for match in _BOUNDARY.finditer(text):
+            pieces.append((start, match.start(), paragraph_start))
+            start, paragraph_start = match.end(), match.group().count("\n") >= 2
+        pieces.append((start, len(text), paragraph_start))
+        pieces = [(start + len(piece) - len(piece.lstrip()), start + len(piece.rstrip()), paragraph_start)
+                  for start, end, paragraph_start in pieces if (piece := text[start:end]).strip()]
+
+        # Each segment is counted one token more than its text, for the whitespace joining it to the previous one.
+        encoded = self.encoding.encode_ordinary_batch([text[start:end] for start, end, _ in pieces])
+        segments = []
+        for (start, end, paragraph_start), tokens in zip(pieces, encoded):
+            if len(tokens) < self.chunk_size:
+                segments.append(_Segment(offset + start, offset + end, page, len(tokens) + 1, paragraph_start))
+            else:
+                for i, (part_start, part_end, part_tokens) in enumerate(self._split_words(text, start, end)):
+                    segments.append(_Segment(offset + part_start, offset + part_end, page, part_tokens + 1,
+                                             paragraph_start and i == 0))
+        return segments
+
+    def _split_words(self, text, start, end):
+        limit = self.chunk_size - 1
+        words = [(start + match.start(), start + match.end()) for match in _WORD.finditer(text[start:end])]
+        counts = [len(tokens) for tokens in self.encoding.encode_ordinary_batch([text[s:e] for s, e in words])]
+        parts = []
+        part_start, part_end, part_tokens = None, None, 0
+        for (word_start, word_end), count in zip(words, counts):
+            if count > limit:
+                if part_start is not None:
+                    parts.append((part_start, part_end, part_tokens))
+                    part_start, part_tokens = None, 0
+                parts.extend(self._split_characters(text, word_start, word_end))
+                continue
+            if part_start is not None and part_tokens + count > limit:
+                parts.append((part_start, part_end, part_tokens))
+                part_start, part_tokens = None, 0
+            if part_start is None:
+                part_start = word_start
+            part_end, part_tokens = word_end, part_tokens + count
+        if part_start is not None:
+            parts.append((part_start, part_end, part_tokens))
+        return parts
+
+    def _split_characters(self, text, start, end):
+        limit = self.chunk_size - 1
+        parts = []
+        while start < end:
+            length = end - start
+            while True:
+                count = len(self.encoding.encode_ordinary(text[start:start + length]))
+                if count <= limit or length == 1:
+                    break
+                length = max(1, length * limit // count)
+            parts.append((start, start + length, count))
+            start += length
+        return parts
+
+
+class ChunkStream:
+    """
+    Chunking state of one document, created by TextChunker.stream.
+
+    Only the text of the chunk being built is kept, so memory stays flat however long the document is.
+    Character offsets refer to the concatenation of the pages, i.e. the extracted text of the document.
+    """
+
+    def __init__(self, chunker, doc_id):
+        self.chunker = chunker
+        self.doc_id = doc_id
+        self.chunks = 0
+        self._pages = 0
+        self._offset = 0
+        self._buffer = ""
+        self._buffer_start = 0
+        self._window = []
+        self._tokens = 0
+        # Number of segments at the start of the window that were already emitted, as overlap.
+        self._carried = 0
+
+    def add_page(self, text):
+        """
+        Add the next page of the document.
+
+        Args:
+            text (str): The text of the page.
+
+        Returns:
+            list[Document]: The chunks completed by this page.
+        """
+        self._pages += 1
+        segments = self.chunker.segments(text, self._offset, self._pages)
+        self._buffer += text
+        self._offset += len(text)
+
+        chunks = []
+        for segment in segments:
+            chunks.extend(self._add(segment))
+        self._trim()
+        return chunks
+
+    def finish(self):
+        """
+        End the document.
+
+        Returns:
+            list[Document]: The last chunk, if any text remains that was not emitted yet.
+        """
+        chunks = []
+        if len(self._window) > self._carried:
+            chunks.append(self._chunk(self._window))
+        self._window, self._tokens, self._carried = [], 0, 0
+        self._buffer = ""
+        return chunks
+
+    def _add(self, segment):
+        chunks = []
+        while self._window and self._tokens + segment.tokens > self.chunker.chunk_size:
+            if self._carried == len(self._window):
+                # Nothing new to emit yet: make room by dropping overlap instead.
+                self._tokens -= self._window.pop(0).tokens
+                self._carried -= 1
+                continue
+            cut = self._cut()
+            chunks.append(self._chunk(self._window[:cut]))
+            overlap = self._overlap(self._window[:cut])
+            self._window = overlap + self._window[cut:]
+            self._tokens = sum(s.tokens for s in self._window)
+            self._carried = len(overlap)
+        self._window.append(segment)
+        self._tokens += segment.tokens
+        return chunks
+
+    def _cut(self):
+        # End the chunk at the last paragraph boundary if that keeps it at least half full.
+        tokens = self._tokens
+        for i in range(len(self._window) - 1, self._carried, -1):
+            tokens -= self._window[i].tokens
+            if tokens < self.chunker.chunk_size // 2:
+                break
+            if self._window[i].paragraph_start:
+                return i
+        return len(self._window)
+
+    def _overlap(self, segments):
+        overlap, tokens = [], 0
+        for segment in reversed(segments[1:]):
+            if tokens + segment.tokens > self.chunker.chunk_overlap:
+                break
+            overlap.insert(0, segment)
+            tokens += segment.tokens
+        return overlap
+
+    def _chunk(self, segments):
+        start, end = segments[0].start, segments[-1].end
+        metadata = {
+            "doc_id": self.doc_id,
+            "page": segments[0].page,
+            "chunk": self.chunks,
+            "start_index": start,
+            "end_index": end,
+        }
+        if segments[-1].page != segments[0].page:
+            metadata["end_page"] = segments[-1].page
+        self.chunks += 1
+        text = self._buffer[start - self._buffer_start:end - self._buffer_start]
+        return Document(page_content=text, metadata=metadata)
+
+    def _trim(self):
+        # Text before the window is never needed again.
+        start = self._window[0].start if self._window else self._offset
+        self._buffer = self._buffer[start - self._buffer_start:]
+        self._buffer_start = start
@@ -0,0 +1,225 @@
+import asyncio
+import copy
+
+import numpy as np
+
+from repository.ann_index import similarity_search_with_vectors
+from utils.locks import ReadWriteLock
+from utils.tokenizer import get_encoding
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Merge several rankings of the same items by reciprocal rank fusion.
+
+    Each item scores the sum of 1 / (k + rank) over the rankings it appears in, with ranks starting at 1,
+    so items ranked well by several retrievers rise to the top without their raw scores being compared.
+
+    Args:
+        rankings (list[list]): The rankings, each a list of items, best first.
+        k (int): Damping constant; larger values flatten the difference between top and lower ranks.
+
+    Returns:
+        list[tuple]: (item, score) pairs, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
+
+
+def maximal_marginal_relevance(query_vector, vectors, k, lambda_mult=0.5, relevance=None):
+    """
+    Pick results that are relevant to the query but not redundant with each other.
+
+    Greedily selects the vector maximizing lambda_mult * sim(query) - (1 - lambda_mult) * max sim(selected),
+    using cosine similarity. All similarities are computed up front with two matrix products, and each
+    step only updates the running maximum similarity to the selected set.
+
+    Args:
+        query_vector (np.ndarray): The query embedding, of shape (dimension,).
+        vectors (np.ndarray): Candidate embeddings, of shape (n, dimension).
+        k (int): Number of results to select.
+        lambda_mult (float): 1 ranks purely by relevance, 0 purely by diversity.
+        relevance (np.ndarray, optional): Relevance of each candidate, in [0, 1]; defaults to the cosine
+            similarity to the query.
+
+    Returns:
+        list[int]: Indices of the selected candidates, in selection order.
+    """
+    if len(vectors) == 0 or k <= 0:
+        return []
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    if relevance is None:
+        query_vector = query_vector / max(np.linalg.norm(query_vector), 1e-12)
+        relevance = vectors @ query_vector
+    similarity = vectors @ vectors.T
+
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()
+    available = np.ones(len(vectors), dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < min(k, len(vectors)):
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return selected
+
+
+class ContextBuilder:
+    """
+    Assembles the retrieved context of a chat prompt within a token budget.
+
+    Fetches the top results of the query with their stored vectors, optionally fuses them with the BM25
+    matches of a lexical index by reciprocal rank fusion, so that exact identifiers and names are found
+    even when their embeddings are not close, optionally re-ranks them by maximal marginal relevance, and
+    then packs chunks in rank order, skipping any that would overflow the budget, so that the size of the
+    prompt does not depend on what happens to be retrieved.
+
+    Args:
+        vdb (FAISS, optional): The vector store; see bind for building contexts from several stores.
+        k (int): Maximum number of chunks in the context.
+        fetch_k (int): Number of candidates fetched for MMR re-ranking.
+        token_budget (int): Maximum number of tokens of context.
+        mmr (bool): Whether to re-rank the candidates by maximal marginal relevance.
+        mmr_lambda (float): Relevance/diversity trade-off of MMR.
+        model (str): The chat model whose tokenizer measures the budget.
+        encoding (tiktoken.Encoding, optional): Tokenizer override; defaults to the model's encoding,
+            loaded on first use.
+        lexical_index (LexicalIndex, optional): BM25 index over the same rows as the vector store; retrieval
+            is purely dense if None.
+        rrf_k (int): Damping constant of the reciprocal rank fusion.
+        lock (ReadWriteLock, optional): Lock of the stores, held for reading while they are searched and their
+            vectors reconstructed; a lock of the builder's own if None.
+    """
+
+    # Chunks are joined by a blank line, which costs about one token.
+    SEPARATOR = "\n\n"
+
+    def __init__(self, vdb=None, k=8, fetch_k=32, token_budget=1500, mmr=False, mmr_lambda=0.5, model="gpt-3.5-turbo",
+                 encoding=None, lexical_index=None, rrf_k=60, lock=None):
+        self.vdb = vdb
+        self.k = k
+        self.fetch_k = max(fetch_k, k)
+        self.token_budget = token_budget
+        self.mmr = mmr
+        self.mmr_lambda = mmr_lambda
+        self.model = model
+        self._encoding = encoding
+        self.lexical_index = lexical_index
+        self.rrf_k = rrf_k
+        self.lock = lock or ReadWriteLock()
+
+    @property
+    def encoding(self):
+        if self._encoding is None:
+            self._encoding = get_encoding(self.model)
+        return self._encoding
+
+    def bind(self, vdb, lexical_index=None, lock=None):
+        """
+        Get a builder with the same settings that retrieves from another store, e.g. a user's shard.
+
+        Args:
+            vdb (FAISS): The vector store.
+            lexical_index (LexicalIndex, optional): BM25 index over the same rows as the vector store.
+            lock (ReadWriteLock, optional): Lock of the stores, e.g. the shard's index lock.
+
+        Returns:
+            ContextBuilder: The bound builder; it shares this one's tokenizer.
+        """
+        builder = copy.copy(self)
+        builder.vdb = vdb
+        builder.lexical_index = lexical_index
+        builder.lock = lock or ReadWriteLock()
+        return builder
+
+    async def build(self, query, nprobe=None, ef_search=None):
+        """
+        Retrieve and pack the context for a query.
+
+        Args:
+            query (str): The user's query.
+            nprobe (int, optional): IVF cells to visit for this query's retrieval.
+            ef_search (int, optional): HNSW candidate list size for this query's retrieval.
+
+        Returns:
+            dict: The context "text", its "tokens", the chosen "chunks" as dicts of docstore "id",
+                cosine similarity "score" and "tokens", in the order they appear in the text, and the
+                "query_vector" the chunks were retrieved with.
+        """
+        k = self.fetch_k if self.mmr or self.lexical_index is not None else self.k
+        dense = similarity_search_with_vectors(self.vdb, query, k=k, nprobe=nprobe, ef_search=ef_search,
+                                               lock=self.lock)
+        relevance = None
+        if self.lexical_index is None:
+            query_vector, hits, vectors = await dense
+        else:
+            (query_vector, hits, vectors), (rows, _) = await asyncio.gather(dense, self._lexical_search(query, k))
+            async with self.lock.read():
+                hits, vectors, relevance = self._fuse(query_vector, hits, vectors, rows, k)
+        if not hits:
+            return {"text": "", "tokens": 0, "chunks": [], "query_vector": query_vector}
+
+        norms = np.maximum(np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector), 1e-12)
+        scores = (vectors @ query_vector) / norms
+        if self.mmr:
+            order = maximal_marginal_relevance(query_vector, vectors, self.k, self.mmr_lambda, relevance)
+        else:
+            order = range(min(len(hits), self.k))
+
+        texts = [hits[i][1].page_content for i in order]
+        counts = [len(tokens) for tokens in self.encoding.encode_ordinary_batch(texts)]
+        chosen, used = [], 0
+        for i, text, count in zip(order, texts, counts):
+            cost = count + (1 if chosen else 0)
+            if used + cost > self.token_budget:
+                continue
+            chosen.append((i, text, count))
+            used += cost
+
+        return {
+            "text": self.SEPARATOR.join(text for _, text, _ in chosen),
+            "tokens": used,
+            "chunks": [{"id": hits[i][0], "score": round(float(scores[i]), 4), "tokens": count}
+                       for i, _, count in chosen],
+            "query_vector": query_vector,
+        }
+
+    async def _lexical_search(self, query, k):
+        async with self.lock.read():
+            return await asyncio.to_thread(self.lexical_index.search, query, k)
+
+    def _fuse(self, query_vector, hits, vectors, rows, k):
+        # Lexical rows are FAISS rows; those the dense search missed are fetched from the store, so this must be
+        # called holding the lock for reading.
+        dense_ids = [docstore_id for docstore_id, _, _ in hits]
+        row_of = {}
+        for row in rows.tolist():
+            docstore_id = self.vdb.index_to_docstore_id.get(row)
+            if docstore_id is not None:
+                row_of[docstore_id] = row
+        fused = reciprocal_rank_fusion([dense_ids, list(row_of)], k=self.rrf_k)[:k]
+
+        position = {docstore_id: i for i, docstore_id in enumerate(dense_ids)}
+        missing = [docstore_id for docstore_id, _ in fused if docstore_id not in position]
+        extra_vectors = self.vdb.index.reconstruct_batch(np.array([row_of[i] for i in missing], dtype="int64")) \
+            if missing else np.empty((0, len(query_vector)), dtype="float32")
+        extra = {docstore_id: j for j, docstore_id in enumerate(missing)}
+
+        fused_hits, fused_vectors = [], []
+        for docstore_id, _ in fused:
+            if docstore_id in position:
+                fused_hits.append(hits[position[docstore_id]])
+                fused_vectors.append(vectors[position[docstore_id]])
+            else:
+                vector = extra_vectors[extra[docstore_id]]
+                distance = float(np.sum((vector - query_vector) ** 2))
+                fused_hits.append((docstore_id, self.vdb.docstore.search(docstore_id), distance))
+                fused_vectors.append(vector)
+        scores = np.array([score for _, score in fused])
+        relevance = scores / scores.max() if len(scores) else scores
+        return fused_hits, np.array(fused_vectors).reshape(len(fused_hits), len(query_vector)), relevance
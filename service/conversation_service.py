@@ -1,12 +1,40 @@
-from client.openai_client import OpenAIClient
-from config import API_KEY, faiss, initialize_faiss
+import time
+
+from config import CONTEXT_FETCH_K, CONTEXT_MMR, CONTEXT_MMR_LAMBDA, CONTEXT_TOKEN_BUDGET, CONTEXT_TOP_K, HYBRID_RRF_K, \
+    HYBRID_SEARCH, INDEX_EF_SEARCH, INDEX_NPROBE
+from repository.response_cache import context_fingerprint
+from repository.session_store import Session
+from service.context_builder import ContextBuilder
 from utils.logger import logger
+from utils.metrics import TOKENS, stage_timer
 
 
 class ConversationService:
-    def __init__(self):
-        self.vdb = faiss
-        self.open_ai_client = OpenAIClient(API_KEY)
+    def __init__(self, session_store, response_cache, shards, open_ai_client):
+        """
+        Initializes the ConversationService.
+
+        The service keeps no conversation state of its own: each call works on the session it is given
+        and stores the updated history in the session store. That store keeps sessions in the memory of
+        its process and only writes them to SQLite once they are evicted, so with several workers the
+        requests of a conversation must be routed to the same worker to keep its history.
+        Answers to chat questions are cached, and reused for similar questions asked with the same
+        retrieved context and history. Context is only retrieved from the shard of the session's user.
+
+        Args:
+            session_store (SessionStore): Where conversation histories are kept.
+            response_cache (ResponseCache): Semantic cache of chat answers.
+            shards (ShardStore): The per-user vector stores.
+            open_ai_client (OpenAIClient): The chat model, shared with the rest of the application.
+        """
+        self.session_store = session_store
+        self.response_cache = response_cache
+        self.shards = shards
+        self.open_ai_client = open_ai_client
+        self.context_builder = ContextBuilder(k=CONTEXT_TOP_K, fetch_k=CONTEXT_FETCH_K,
+                                              token_budget=CONTEXT_TOKEN_BUDGET, mmr=CONTEXT_MMR,
+                                              mmr_lambda=CONTEXT_MMR_LAMBDA, model=self.open_ai_client.MODEL,
+                                              rrf_k=HYBRID_RRF_K)
         self.default_message = {
             "role": "system",
             "content": "You are a RAG application which receives a set of texts similar to user prompt, "
@@ -14,43 +42,123 @@ class ConversationService:
                        "as well. "
         }
 
-        self.context = ""
-        self.max_history = 2
-        self.prompt_list = []
+    async def chat(self, session: Session, query: str, nprobe: int = None, ef_search: int = None):
+        messages, context = await self._get_chat_messages(session, query, nprobe, ef_search)
+        logger.debug("chat messages: %s", messages)
+        llm_response = self.response_cache.lookup(context["query_vector"], context["fingerprint"], session.user)
+        if llm_response is None:
+            start = time.perf_counter()
+            llm_response = await self.open_ai_client.get_chat_response(messages)
+            self.response_cache.put(context["query_vector"], context["fingerprint"], llm_response,
+                                    time.perf_counter() - start, session.user)
+        else:
+            logger.info("chat answered from the response cache")
+        self._save_response(session, llm_response)
+        return llm_response
 
-    async def chat(self, query: str):
+    async def chat_stream(self, session: Session, query: str, nprobe: int = None, ef_search: int = None):
+        """
+        Streaming variant of chat.
 
-        prompt = self.open_ai_client.get_prompt(query)
-        self.prompt_list.append(prompt)
-        if len(self.prompt_list) > self.max_history:
-            self.prompt_list.pop(0)
+        Yields {"token": str} events as the model produces them, followed by a single
+        {"metrics": dict} event with the time-to-first-token and throughput of the response, and the
+        token count and chunk ids/scores of the retrieved context. A cached answer is sent as a single token.
+        """
+        messages, context = await self._get_chat_messages(session, query, nprobe, ef_search)
+        logger.debug("chat messages: %s", messages)
+        cached_response = self.response_cache.lookup(context["query_vector"], context["fingerprint"], session.user)
+        async for event in self._stream_chat_response(session, messages, context, cached_response):
+            yield event
 
-        similar_docs = self.vdb.similarity_search(query)
+    async def _get_chat_messages(self, session: Session, query: str, nprobe: int = None, ef_search: int = None):
+        prompt = self.open_ai_client.get_prompt(query)
+        session.messages = self.session_store.trim(session.messages + [prompt])
 
-        if len(similar_docs) > 0:
-            context = similar_docs[0].page_content
-        else:
-            context = ""
+        with stage_timer("context_build"):
+            async with self.shards.open(session.user) as shard:
+                context_builder = self.context_builder.bind(shard.vdb,
+                                                            shard.lexical_index if HYBRID_SEARCH else None,
+                                                            lock=shard.index_store.lock)
+                context = await context_builder.build(query,
+                                                      nprobe=nprobe or INDEX_NPROBE,
+                                                      ef_search=ef_search or INDEX_EF_SEARCH)
+        TOKENS.inc(context["tokens"], kind="context")
+        logger.info("context: %s tokens from chunks %s", context["tokens"], context["chunks"])
+        context["fingerprint"] = context_fingerprint([chunk["id"] for chunk in context["chunks"]],
+                                                     session.messages[:-1])
 
-        context_prompt = self.open_ai_client.get_prompt_for_context(context)
+        context_prompt = self.open_ai_client.get_prompt_for_context(context["text"])
 
         messages = [self.default_message, context_prompt]
-        messages = messages + self.prompt_list
-        logger.info(messages)
+        messages = messages + session.messages
+        return messages, context
+
+    async def new_chat(self, session: Session, query: str):
+        messages = self._get_new_chat_messages(session, query)
+        logger.debug("chat messages: %s", messages)
         llm_response = await self.open_ai_client.get_chat_response(messages)
+        self._save_response(session, llm_response)
         return llm_response
 
-    async def new_chat(self, query: str):
-        self.prompt_list = []
-        self.context = ""
-        # initialize_faiss() not to be done, Just for a new chat there will be no message context.
-        # self.vdb = faiss
+    async def new_chat_stream(self, session: Session, query: str):
+        """
+        Streaming variant of new_chat. Yields the same events as chat_stream.
+        """
+        messages = self._get_new_chat_messages(session, query)
+        logger.debug("chat messages: %s", messages)
+        async for event in self._stream_chat_response(session, messages):
+            yield event
 
+    def _get_new_chat_messages(self, session: Session, query: str):
+        # Just for a new chat there will be no message context.
         prompt = self.open_ai_client.get_prompt(query)
-        self.prompt_list.append(prompt)
+        session.messages = [prompt]
 
         messages = [self.default_message]
-        messages = messages + self.prompt_list
-        logger.info(messages)
-        llm_response = await self.open_ai_client.get_chat_response(messages)
-        return llm_response
+        messages = messages + session.messages
+        return messages
+
+    def _save_response(self, session: Session, response: str):
+        # The response becomes the assistant's history entry for the next turn of the conversation.
+        session.messages.append(self.open_ai_client.get_prompt_for_response(response))
+        self.session_store.save(session)
+
+    async def _stream_chat_response(self, session: Session, messages, context=None, cached_response=None):
+        start = time.perf_counter()
+        first_token_at = None
+        chunks = []
+        if cached_response is not None:
+            tokens = self._replay(cached_response)
+        else:
+            tokens = self.open_ai_client.stream_chat_response(messages)
+        async for token in tokens:
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            chunks.append(token)
+            yield {"token": token}
+        end = time.perf_counter()
+
+        # The streamed chunks become the assistant's history entry, same as a full completion would.
+        self._save_response(session, "".join(chunks))
+        if context is not None and cached_response is None:
+            self.response_cache.put(context["query_vector"], context["fingerprint"], "".join(chunks), end - start,
+                                    session.user)
+
+        # Each streamed delta carries roughly one token, so the chunk count is used as the token count.
+        generation_time = end - first_token_at if first_token_at is not None else 0.0
+        metrics = {
+            "time_to_first_token_ms": round((first_token_at - start) * 1000, 2) if first_token_at else None,
+            "total_time_ms": round((end - start) * 1000, 2),
+            "completion_tokens": len(chunks),
+            "tokens_per_sec": round(len(chunks) / generation_time, 2) if generation_time > 0 else None,
+            "cached": cached_response is not None,
+        }
+        if context is not None:
+            metrics["context_tokens"] = context["tokens"]
+            metrics["context_chunks"] = context["chunks"]
+        logger.info(f"chat stream metrics: {metrics}")
+        yield {"metrics": metrics}
+
+    @staticmethod
+    async def _replay(response):
+        yield response
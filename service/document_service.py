@@ -1,82 +1,422 @@
+import asyncio
+import contextlib
 import os
+import sys
+import tempfile
+import time
 import uuid
+from array import array
+from collections import deque
 from pathlib import Path
 
-from PyPDF2 import PdfReader
-from fastapi import UploadFile
-from langchain_community.document_loaders import TextLoader
-from langchain_text_splitters import CharacterTextSplitter
+from fastapi import HTTPException, UploadFile
 
-from client.openai_client import OpenAIClient
-from config import API_KEY, faiss, UPLOAD_DIR
+from config import CHUNK_OVERLAP, CHUNK_SIZE, EMBEDDING_MODEL, UPLOAD_DIR
+from repository.ann_index import add_documents, forget_documents, known_ids, remove_ids
+from service.chunker import TextChunker
+from service.pdf_extraction import count_pages, extract_pages
+from utils.logger import logger
+from utils.metrics import STAGE_SECONDS, TOKENS, stage_timer
+
+# Size of the pieces an upload is copied in.
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 
 class DocumentService:
-    def __init__(self):
+    def __init__(self, shards, embeddings, response_cache, catalog):
         """
         Initializes the DocumentService.
 
-        Initializes vector database (vdb), OpenAI client, and file-to-document mapping.
+        Args:
+            shards (ShardStore): The per-namespace vector store shards.
+            embeddings: Embeds the chunks of processed documents.
+            response_cache (ResponseCache): Cached answers, invalidated per namespace when its documents change.
+            catalog (DocumentCatalog): The catalog of uploaded documents.
         """
-        self.vdb = faiss
-        self.open_ai_client = OpenAIClient(API_KEY)
-        self.file_to_doc_map = {}
+        self.shards = shards
+        self.embeddings = embeddings
+        self.response_cache = response_cache
+        self.chunker = TextChunker(CHUNK_SIZE, CHUNK_OVERLAP, model=EMBEDDING_MODEL)
+        self.catalog = catalog
 
-    async def file_upload(self, file: UploadFile):
+    async def save_upload(self, file: UploadFile, doc_id=None, namespace=""):
         """
-        Uploads a file and processes its contents.
+        Stores an uploaded PDF as-is so that it can be processed later, even after a restart, and records it
+        in the catalog.
 
-        Uploads the provided file, extracts text content from the PDF, and saves it to disk.
+        The upload is copied in fixed-size chunks to a temporary file private to this request and then
+        renamed into place, so the whole file is never held in memory and concurrent uploads never share a path.
 
         Args:
             file (UploadFile): The file to upload.
+            doc_id (str, optional): The identifier to store it under; a new UUID if None.
+            namespace (str): The namespace, i.e. the user, the document belongs to.
 
         Returns:
             str: The unique identifier (UUID) of the uploaded document.
+        """
+        doc_id = doc_id or str(uuid.uuid4())
+        directory = Path(UPLOAD_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    await asyncio.to_thread(f.write, chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, self.source_path(doc_id))
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+        await asyncio.to_thread(self.catalog.add, doc_id, namespace, file.filename, size)
+        return doc_id
+
+    async def get_document(self, doc_id, namespace):
+        """
+        Gets the catalog entry of a document of a namespace.
+
+        Args:
+            doc_id (str): The unique identifier (UUID) of the document.
+            namespace (str): The namespace, i.e. the user.
+
+        Returns:
+            dict: The document's owner, filename, size, page and chunk counts, status and timestamps.
 
         Raises:
-            Exception: If there's an error during file processing.
+            HTTPException: 404 if the document does not exist or belongs to another namespace.
         """
-        doc_id = str(uuid.uuid4())
-        contents = file.file.read()
-        filename = file.filename
-        with open("temp.pdf", "wb") as f:
-            f.write(contents)
+        document = await asyncio.to_thread(self.catalog.get, doc_id)
+        if document is None or document["owner"] != namespace:
+            raise HTTPException(status_code=404, detail="Document not found")
+        return document
 
-        pdf_reader = PdfReader("temp.pdf")
-        text = ""
-        for page in range(len(pdf_reader.pages)):
-            text += pdf_reader.pages[page].extract_text()
+    async def list_documents(self, namespace, status=None, sort="created_at", descending=True, limit=10, cursor=None):
+        """
+        Lists the documents of a namespace from the catalog, one page at a time.
 
-        directory = Path(UPLOAD_DIR)
-        directory.mkdir(parents=True, exist_ok=True)
+        Args:
+            namespace (str): The namespace, i.e. the user.
+            status (str, optional): Only list documents in this status.
+            sort (str): The catalog column to sort by.
+            descending (bool): Whether to list the largest values first.
+            limit (int): Maximum number of documents in the page.
+            cursor (str, optional): The next_cursor of the previous page.
 
-        with open(directory / f"{doc_id}.pdf", 'w') as f:
-            f.write(text)
-            self.file_to_doc_map[f"{doc_id}.pdf"] = filename
-        return doc_id
+        Returns:
+            dict: The "documents" of the page and the "next_cursor" of the next one, None after the last page.
+
+        Raises:
+            HTTPException: 400 if the sort column or the cursor is invalid.
+        """
+        try:
+            return await asyncio.to_thread(self.catalog.list, namespace, status=status, sort=sort,
+                                           descending=descending, limit=limit, cursor=cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    async def iter_pages(self, doc_id, executor=None, progress=None, pages_per_task=16, prefetch=None):
+        """
+        Extracts the text of an uploaded PDF, yielding it page by page in order.
+
+        Pages are extracted in ranges, each range as a separate task on the executor, so a process pool
+        spreads the CPU-bound parsing across cores without blocking the event loop. At most prefetch
+        ranges are in flight or waiting to be consumed, which keeps memory flat however long the PDF is.
+
+        Args:
+            doc_id (str): The unique identifier (UUID) of the document.
+            executor (Executor, optional): Executor for the extraction tasks; the default thread pool if None.
+            progress (callable, optional): Called with pages_total and then pages_done as ranges are consumed.
+            pages_per_task (int): Number of pages extracted per task.
+            prefetch (int, optional): Maximum number of ranges extracted ahead; twice the CPU count if None.
 
-    async def process_document_for_rag(self, doc_id):
+        Yields:
+            str: The text of each page.
+        """
+        loop = asyncio.get_running_loop()
+        path = self.source_path(doc_id)
+        pages_total = await loop.run_in_executor(executor, count_pages, path)
+        if progress:
+            progress(pages_total=pages_total, pages_done=0)
+
+        ranges = deque((start, min(start + pages_per_task, pages_total))
+                       for start in range(0, pages_total, pages_per_task))
+        prefetch = prefetch or 2 * (os.cpu_count() or 1)
+        pending = deque()
+        pages_done = 0
+        try:
+            while ranges or pending:
+                while ranges and len(pending) < prefetch:
+                    pending.append(loop.run_in_executor(executor, extract_pages, path, *ranges.popleft()))
+                pages = await pending.popleft()
+                for page in pages:
+                    yield page
+                pages_done += len(pages)
+                if progress:
+                    progress(pages_done=pages_done)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    def _remove_chunks(shard, doc_id):
+        # Must be called holding the shard's index lock for writing.
+        remove_ids(shard.vdb.index, known_ids(shard.vdb, shard.vector_ids.get(doc_id, [])))
+        return DocumentService._forget_chunks(shard, doc_id)
+
+    @staticmethod
+    def _forget_chunks(shard, doc_id):
+        # Must be called holding the shard's index lock for writing, once the chunks' vectors are removed.
+        ids = shard.vector_ids.pop(doc_id, [])
+        shard.lexical_index.remove(ids)
+        return forget_documents(shard.vdb, ids)
+
+    @classmethod
+    def _remove_files(cls, doc_id):
+        for path in (cls.source_path(doc_id), cls.text_path(doc_id), cls.page_offsets_path(doc_id)):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+    @staticmethod
+    def source_path(doc_id):
+        return os.path.join(UPLOAD_DIR, f"{doc_id}.source.pdf")
+
+    @staticmethod
+    def text_path(doc_id):
+        return os.path.join(UPLOAD_DIR, f"{doc_id}.pdf")
+
+    @staticmethod
+    def page_offsets_path(doc_id):
+        return os.path.join(UPLOAD_DIR, f"{doc_id}.pages")
+
+    async def get_text(self, doc_id, namespace):
+        """
+        Locates the extracted text of a document of a namespace.
+
+        Args:
+            doc_id (str): The unique identifier (UUID) of the document.
+            namespace (str): The namespace, i.e. the user.
+
+        Returns:
+            tuple: The path of the UTF-8 text file and its os.stat_result.
+
+        Raises:
+            HTTPException: 404 if the document does not exist in the namespace or has not been extracted yet.
+        """
+        await self.get_document(doc_id, namespace)
+        path = self.text_path(doc_id)
+        try:
+            return path, await asyncio.to_thread(os.stat, path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Document not found")
+
+    async def get_page(self, doc_id, namespace, page):
+        """
+        Locates the text of one page of a document of a namespace.
+
+        Only two offsets are read from the page offsets file, so this costs the same for any page of any
+        document.
+
+        Args:
+            doc_id (str): The unique identifier (UUID) of the document.
+            namespace (str): The namespace, i.e. the user.
+            page (int): The page number, starting at 1.
+
+        Returns:
+            tuple: The path of the UTF-8 text file, the start and end byte offsets of the page in it, and
+                the file's os.stat_result.
+
+        Raises:
+            HTTPException: 404 if the document or the page does not exist, or the document was extracted
+                before page offsets were recorded and must be re-indexed first.
+        """
+        path, stat_result = await self.get_text(doc_id, namespace)
+        offsets = await asyncio.to_thread(self._read_page_offsets, doc_id, page)
+        if offsets is None:
+            raise HTTPException(status_code=404, detail="Page not found")
+        return path, offsets[0], offsets[1], stat_result
+
+    def _read_page_offsets(self, doc_id, page):
+        if page < 1:
+            return None
+        offsets = array("Q")
+        try:
+            with open(self.page_offsets_path(doc_id), "rb") as f:
+                f.seek((page - 1) * offsets.itemsize)
+                offsets.frombytes(f.read(2 * offsets.itemsize))
+        except FileNotFoundError:
+            return None
+        if len(offsets) < 2:
+            return None
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        return offsets[0], offsets[1]
+
+    def _write_page_offsets(self, doc_id, offsets):
+        offsets = array("Q", offsets)
+        # Stored little-endian, so the file means the same on any machine.
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        tmp_path = f"{self.page_offsets_path(doc_id)}.{uuid.uuid4().hex}.part"
+        with open(tmp_path, "wb") as f:
+            offsets.tofile(f)
+        os.replace(tmp_path, self.page_offsets_path(doc_id))
+
+    async def process_document_for_rag(self, doc_id, namespace="", executor=None, progress=None, pages_per_task=16):
         """
         Processes a document for RAG (Retrieval-Augmented Generation) model.
 
         Processes the document identified by the provided document ID for RAG model.
-        Loads the document, splits it into chunks, and adds them to the vector database.
+        Streams the pages of the uploaded PDF into the token-aware chunker as they are extracted, writing the
+        extracted text to disk along the way, and adds the resulting chunks to the namespace's shard. Each chunk's
+        metadata holds the doc_id, its page and its character offsets in the extracted text.
+        Chunks already in the embedding cache are not re-embedded. Embedding happens without holding the
+        index lock; only the index add, to FAISS and to the BM25 lexical index, holds it for writing, waiting
+        for searches and snapshot saves in progress, and a (debounced) save is scheduled afterwards. Processing
+        a document that is already indexed, e.g. to re-chunk or re-embed it, swaps its new chunks in for the old
+        ones atomically. Once enough
+        vectors have arrived, a background migration to the configured ANN index type is started. The document's
+        catalog entry goes through the "processing" status to "indexed", with its page and chunk counts, or
+        "failed".
 
         Args:
             doc_id (str): The unique identifier (UUID) of the document.
+            namespace (str): The namespace, i.e. the user, whose shard the chunks are added to.
+            executor (Executor, optional): Executor for page extraction; the default thread pool if None.
+            progress (callable, optional): Called with the current stage ("extracting", "embedding", "indexing"),
+                page progress while extracting, and chunks_total and then chunks_done while embedding.
+            pages_per_task (int): Number of pages extracted per task.
 
         Returns:
             str: A success message indicating the processing status of the document.
 
         Raises:
+            HTTPException: 404 if the document is not in the namespace's catalog, or is deleted before its chunks
+                are added.
             Exception: If there's an error during document processing.
         """
-        filename = self.file_to_doc_map[f"{doc_id}.pdf"]
-        loader = TextLoader(file_path=(os.path.join(UPLOAD_DIR, f"{doc_id}.pdf")))
-        documents = loader.load()
-        text_splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=0)
-        docs = text_splitter.split_documents(documents)
-        self.vdb.add_documents(docs)
+        filename = (await self.get_document(doc_id, namespace))["filename"]
+        await asyncio.to_thread(self.catalog.update, doc_id, status="processing", error=None)
+        try:
+            pages, chunks = await self._index_document(doc_id, namespace, executor, progress, pages_per_task)
+        except Exception as e:
+            await asyncio.to_thread(self.catalog.update, doc_id, status="failed", error=str(e) or type(e).__name__)
+            raise
+        await asyncio.to_thread(self.catalog.update, doc_id, status="indexed", pages=pages, chunks=chunks,
+                                indexed_at=time.time())
 
         return f'Document processed successfully with docId: {doc_id} and filename: {filename}'
+
+    async def _index_document(self, doc_id, namespace, executor, progress, pages_per_task):
+        if progress:
+            progress(stage="extracting")
+        chunks = self.chunker.stream(doc_id)
+        docs = []
+        pages = 0
+        # Byte offset of the start of each page in the text file, followed by the file's size.
+        page_offsets = [0]
+        # Written aside and renamed into place, so that readers of a re-indexed document never see half of it. The
+        # name is unique, so that concurrent re-indexes of the document do not write into the same file.
+        tmp_path = f"{self.text_path(doc_id)}.{uuid.uuid4().hex}.part"
+        # Pages are extracted ahead while earlier ones are chunked, so extraction is timed as the wait for pages.
+        extract_seconds, chunk_seconds = 0.0, 0.0
+        try:
+            with open(tmp_path, "w", encoding="utf-8", newline="") as text_file:
+                mark = time.perf_counter()
+                async for page in self.iter_pages(doc_id, executor=executor, progress=progress,
+                                                  pages_per_task=pages_per_task):
+                    extracted = time.perf_counter()
+                    extract_seconds += extracted - mark
+                    text_file.write(page)
+                    pages += 1
+                    page_offsets.append(page_offsets[-1] + len(page.encode("utf-8")))
+                    docs.extend(await asyncio.to_thread(chunks.add_page, page))
+                    mark = time.perf_counter()
+                    chunk_seconds += mark - extracted
+            docs.extend(chunks.finish())
+            STAGE_SECONDS.observe(extract_seconds, stage="pdf_extract")
+            STAGE_SECONDS.observe(chunk_seconds + time.perf_counter() - mark, stage="chunk")
+            self._write_page_offsets(doc_id, page_offsets)
+            os.replace(tmp_path, self.text_path(doc_id))
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+        texts = [doc.page_content for doc in docs]
+        metadatas = [doc.metadata for doc in docs]
+        if progress:
+            progress(stage="embedding", chunks_total=len(texts), chunks_done=0)
+        start = time.perf_counter()
+        vectors, embed_stats = await self.embeddings.aembed_documents_with_stats(
+            texts, progress=(lambda done: progress(chunks_done=done)) if progress else None)
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage="embed")
+        TOKENS.inc(embed_stats.get("tokens", 0), kind="embedding")
+        logger.info(f"Document {doc_id}: embedded {len(texts)} chunks in {elapsed:.3f}s "
+                    f"({len(texts) / elapsed if elapsed > 0 else 0:.1f} chunks/sec), "
+                    f"{embed_stats['cache_hits']} served from the embedding cache, "
+                    f"{embed_stats.get('tokens_per_sec') or 0} tokens/sec for the rest")
+        if progress:
+            progress(stage="indexing")
+        async with self.shards.open(namespace) as shard:
+            with stage_timer("index_add"):
+                async with shard.writing():
+                    # Deletes drop the catalog entry while holding this lock, so a document deleted while it was
+                    # being extracted or embedded is caught here, before any of its chunks become searchable.
+                    if await asyncio.to_thread(self.catalog.get, doc_id) is None:
+                        self._remove_files(doc_id)
+                        raise HTTPException(status_code=404, detail="Document was deleted while it was being processed")
+                    # The lexical rows of the new chunks become their vector ids, which keeps both indexes aligned.
+                    ids = await asyncio.to_thread(shard.lexical_index.add, texts)
+                    # Re-indexing a document swaps its new chunks in for the old ones without yielding in
+                    # between, so searches see either version but never both or neither.
+                    replaced = self._remove_chunks(shard, doc_id)
+                    add_documents(shard.vdb, ids, texts, vectors, metadatas)
+                    shard.vector_ids[doc_id] = list(ids)
+                    shard.index_store.schedule_save(shard.vdb)
+            if shard.index_migrator is not None:
+                shard.index_migrator.maybe_migrate(shard.vdb)
+        if replaced:
+            logger.info(f"Document {doc_id}: replaced {replaced} chunks with {len(ids)}")
+        # Cached answers of the namespace were generated without this document.
+        self.response_cache.invalidate(namespace)
+        return pages, len(texts)
+
+    async def delete_document(self, doc_id, namespace=""):
+        """
+        Deletes a document: its chunks from the namespace's vector store and lexical index, and its files.
+
+        Only the document's own vectors are removed, by id; the rest of the index is neither rebuilt nor
+        re-embedded. A job still processing the document fails instead of adding its chunks.
+
+        Args:
+            doc_id (str): The unique identifier (UUID) of the document.
+            namespace (str): The namespace, i.e. the user, the document belongs to.
+
+        Returns:
+            dict: The doc_id and the number of chunks deleted.
+
+        Raises:
+            HTTPException: 404 if the document does not exist in the namespace.
+        """
+        await self.get_document(doc_id, namespace)
+        async with self.shards.open(namespace) as shard:
+            async with shard.writing():
+                # Compacting the codes of a large index takes a while, so it runs in a worker thread, with searches
+                # held off by the lock; the id maps and docstore, read on the event loop, are only changed there.
+                ids = known_ids(shard.vdb, shard.vector_ids.get(doc_id, []))
+                await asyncio.to_thread(remove_ids, shard.vdb.index, ids)
+                removed = self._forget_chunks(shard, doc_id)
+                # Dropped under the lock, so that an ingest of the document that is still running sees it gone
+                # before adding its chunks.
+                await asyncio.to_thread(self.catalog.delete, doc_id)
+                if removed:
+                    shard.index_store.schedule_save(shard.vdb)
+        self._remove_files(doc_id)
+        if removed:
+            # Cached answers of the namespace may quote the deleted document.
+            self.response_cache.invalidate(namespace)
+        logger.info(f"Document {doc_id}: deleted {removed} chunks")
+        return {"doc_id": doc_id, "chunks_deleted": removed}
@@ -0,0 +1,240 @@
+import asyncio
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException, UploadFile
+
+from utils.logger import logger
+
+
+class IngestionService:
+    def __init__(self, document_service, job_store, max_queue_depth=100, workers=2, process_workers=None,
+                 pages_per_task=16, heartbeat_interval=10.0, stale_after=60.0):
+        """
+        Initializes the IngestionService.
+
+        Runs document ingestion as background jobs: uploads are stored and queued, and a pool of async
+        workers streams the pages extracted on a process pool into chunking, then embeds and indexes them.
+        Job state lives in the job store, so queued and interrupted jobs are resumed after a restart, and
+        the jobs of a worker process that stopped are taken over by the others once their heartbeat is stale.
+
+        Args:
+            document_service (DocumentService): Service doing the actual upload, extraction and indexing.
+            job_store (JobStore): Durable job state.
+            max_queue_depth (int): Maximum number of waiting jobs before submissions are rejected.
+            workers (int): Number of jobs processed concurrently.
+            process_workers (int, optional): Size of the extraction process pool; defaults to the CPU count.
+            pages_per_task (int): Number of pages per extraction task.
+            heartbeat_interval (float): Seconds between heartbeats on the jobs this process owns, and between
+                checks for jobs to take over.
+            stale_after (float): Seconds without a heartbeat after which a job's owner is deemed stopped.
+        """
+        self.document_service = document_service
+        self.job_store = job_store
+        self.max_queue_depth = max_queue_depth
+        self.workers = workers
+        self.process_workers = process_workers
+        self.pages_per_task = pages_per_task
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.queue = asyncio.Queue()
+        self.process_pool = None
+        self._worker_tasks = []
+        self._heartbeat_task = None
+
+    async def submit(self, file: UploadFile, namespace=""):
+        """
+        Stores an upload and queues it for ingestion.
+
+        Args:
+            file (UploadFile): The uploaded PDF.
+            namespace (str): The namespace, i.e. the user, whose shard the document is indexed into.
+
+        Returns:
+            dict: The queued job.
+
+        Raises:
+            HTTPException: 429 if the ingestion queue is full.
+        """
+        # The job is created before the upload is stored so that it counts towards the queue depth at once.
+        job = await asyncio.to_thread(self.job_store.create, str(uuid.uuid4()), file.filename, namespace,
+                                      max_pending=self.max_queue_depth)
+        if job is None:
+            raise self._queue_full()
+        try:
+            await self.document_service.save_upload(file, doc_id=job["doc_id"], namespace=namespace)
+        except Exception as e:
+            await asyncio.to_thread(self.job_store.update, job["id"], status="failed", error=str(e),
+                                    finished_at=time.time())
+            raise
+        return await self._enqueue(job["id"])
+
+    async def reindex(self, doc_id, namespace=""):
+        """
+        Queues a stored document for processing again, e.g. after the chunking or embedding settings changed.
+
+        The new chunks replace the old ones atomically once they are embedded; until then searches keep
+        using the old ones.
+
+        Args:
+            doc_id (str): The unique identifier (UUID) of the document.
+            namespace (str): The namespace, i.e. the user, the document belongs to.
+
+        Returns:
+            dict: The queued job.
+
+        Raises:
+            HTTPException: 404 if the document's upload is not stored or belongs to another namespace, 429 if
+                the ingestion queue is full.
+        """
+        document = await self.document_service.get_document(doc_id, namespace)
+        if not os.path.exists(self.document_service.source_path(doc_id)):
+            raise HTTPException(status_code=404, detail="Document not found")
+        job = await asyncio.to_thread(self.job_store.create, doc_id, document["filename"], namespace,
+                                      max_pending=self.max_queue_depth)
+        if job is None:
+            raise self._queue_full()
+        return await self._enqueue(job["id"])
+
+    async def get_job(self, job_id, namespace=""):
+        """
+        Get the status, progress and timings of a job.
+
+        Args:
+            job_id (str): The job id.
+            namespace (str): The namespace, i.e. the user, asking.
+
+        Returns:
+            dict: The job.
+
+        Raises:
+            HTTPException: 404 if the job does not exist in the namespace.
+        """
+        job = await asyncio.to_thread(self.job_store.get, job_id)
+        if job is None or job["namespace"] != namespace:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job
+
+    def start(self):
+        """
+        Re-queues jobs left over by stopped processes and starts the workers and the heartbeat.
+        """
+        self.process_pool = ProcessPoolExecutor(max_workers=self.process_workers)
+        self._requeue(self.job_store.recover(self.stale_after))
+        self._worker_tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+        self._heartbeat_task = asyncio.ensure_future(self._keep_alive())
+
+    async def stop(self):
+        """
+        Stops the workers. Jobs they were running stay "running" and are re-queued by the next process to start
+        or by another worker, once their heartbeat is stale.
+        """
+        tasks = self._worker_tasks + ([self._heartbeat_task] if self._heartbeat_task is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._heartbeat_task = None
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
+            self.process_pool = None
+
+    @staticmethod
+    def _queue_full():
+        return HTTPException(status_code=429, detail="Ingestion queue is full, please retry later",
+                             headers={"Retry-After": "10"})
+
+    async def _enqueue(self, job_id):
+        await asyncio.to_thread(self.job_store.update, job_id, status="queued")
+        self.queue.put_nowait(job_id)
+        return await asyncio.to_thread(self.job_store.get, job_id)
+
+    def _requeue(self, job_ids):
+        if job_ids:
+            logger.info(f"Took over {len(job_ids)} ingestion jobs of stopped workers")
+        for job_id in job_ids:
+            self.queue.put_nowait(job_id)
+
+    async def _keep_alive(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await asyncio.to_thread(self.job_store.heartbeat)
+                self._requeue(await asyncio.to_thread(self.job_store.recover, self.stale_after))
+            except Exception:
+                logger.exception("Ingestion job heartbeat failed")
+
+    async def _work(self):
+        while True:
+            job_id = await self.queue.get()
+            job = await asyncio.to_thread(self.job_store.claim, job_id)
+            if job is not None:
+                await self.run_job(job)
+
+    async def run_job(self, job):
+        """
+        Runs one ingestion job, recording each stage's duration and the job's progress.
+
+        Args:
+            job (dict): A claimed job.
+        """
+        job_id, doc_id = job["id"], job["doc_id"]
+        timings = {}
+        current = {"stage": None, "started_at": None}
+        writes = _JobWrites(self.job_store, job_id)
+
+        def progress(**fields):
+            # A stage change closes the timing of the previous stage.
+            if "stage" in fields and fields["stage"] != current["stage"]:
+                now = time.perf_counter()
+                if current["stage"] is not None:
+                    timings[current["stage"]] = round(now - current["started_at"], 3)
+                current.update(stage=fields["stage"], started_at=now)
+                fields["timings"] = dict(timings)
+            writes.update(**fields)
+
+        try:
+            result = await self.document_service.process_document_for_rag(
+                doc_id, job["namespace"], executor=self.process_pool, progress=progress, pages_per_task=self.pages_per_task)
+            progress(status="done", stage=None, result=result, finished_at=time.time())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"Ingestion job {job_id} failed")
+            progress(status="failed", stage=None, error=str(e), finished_at=time.time())
+        await writes.flush()
+
+
+class _JobWrites:
+    """
+    Writes a job's progress to the job store off the event loop. Updates made while a write is in flight are merged
+    into the next one, so a burst of page or chunk progress costs a single write.
+    """
+
+    def __init__(self, job_store, job_id):
+        self.job_store = job_store
+        self.job_id = job_id
+        self._pending = {}
+        self._task = None
+
+    def update(self, **fields):
+        self._pending.update(fields)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._write())
+
+    async def _write(self):
+        while self._pending:
+            fields, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self.job_store.update, self.job_id, **fields)
+            except Exception:
+                logger.exception(f"Failed to record the progress of ingestion job {self.job_id}")
+
+    async def flush(self):
+        """
+        Waits until every update made so far is written.
+        """
+        if self._task is not None:
+            await self._task
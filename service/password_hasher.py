@@ -0,0 +1,161 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+_PREFIX = "$scrypt$"
+_KEY_LENGTH = 32
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords with scrypt, off the event loop.
+
+    scrypt is deliberately slow and memory-hard, so each hash runs in a bounded pool of threads, which it
+    does not hold the GIL in, and concurrent logins spread over the cores while the event loop keeps
+    serving other requests. At most max_pending hashes may be queued or running; beyond that callers are
+    turned away with a 429 rather than queued for ever.
+
+    Hashes are stored as "$scrypt$ln=<log2 n>,r=<r>,p=<p>$<salt>$<key>", so that the cost parameters
+    travel with each hash: hashes made with other parameters, or passwords stored in plain text before
+    hashing was introduced, still verify, and needs_rehash tells when to replace them.
+
+    Args:
+        n (int): CPU/memory cost, a power of 2; each hash takes about 128 * n * r bytes.
+        r (int): Block size.
+        p (int): Parallelization.
+        workers (int): Threads hashing at once. With 0, hashes run inline on the calling thread.
+        max_pending (int): Maximum number of hashes queued or running.
+    """
+
+    def __init__(self, n=2 ** 15, r=8, p=1, workers=2, max_pending=256):
+        if n < 2 or n & (n - 1):
+            raise ValueError("n must be a power of 2 greater than 1")
+        self.n = n
+        self.r = r
+        self.p = p
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password") if workers else None
+        # Verified against when a user does not exist, so that unknown users take as long as known ones. Made
+        # by the first such verification, in the pool, rather than here on the event loop.
+        self._dummy_hash = None
+
+    async def hash(self, password):
+        """
+        Hash a password with the current parameters and a random salt.
+
+        Args:
+            password (str): The password.
+
+        Returns:
+            str: The encoded hash.
+
+        Raises:
+            HTTPException: 429 if too many hashes are pending.
+        """
+        return await self._run(self._hash, password)
+
+    async def verify(self, password, stored):
+        """
+        Check a password against a stored hash, in time independent of where they differ.
+
+        Args:
+            password (str): The password given.
+            stored (str, optional): The stored hash or legacy plain-text password; None if the user does
+                not exist, which never verifies but costs as much as a hash.
+
+        Returns:
+            bool: Whether the password matches.
+
+        Raises:
+            HTTPException: 429 if too many hashes are pending.
+        """
+        if stored is None:
+            return await self._run(self._verify_unknown, password)
+        return await self._run(self._verify, password, stored)
+
+    def needs_rehash(self, stored):
+        """
+        Args:
+            stored (str): A stored hash or legacy plain-text password.
+
+        Returns:
+            bool: Whether it should be replaced by a hash with the current parameters.
+        """
+        try:
+            parsed = self._parse(stored)
+        except ValueError:
+            return True
+        return parsed is None or parsed[:3] != (self.n, self.r, self.p)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, function, *args):
+        if self.pending >= self.max_pending:
+            raise HTTPException(status_code=429, detail="Too many concurrent logins, please retry later",
+                                headers={"Retry-After": "1"})
+        self.pending += 1
+        try:
+            if self._executor is None:
+                return function(*args)
+            return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+        finally:
+            self.pending -= 1
+
+    def _hash(self, password):
+        salt = os.urandom(16)
+        key = self._derive(password, salt, self.n, self.r, self.p)
+        return f"{_PREFIX}ln={self.n.bit_length() - 1},r={self.r},p={self.p}${_b64encode(salt)}${_b64encode(key)}"
+
+    def _verify_unknown(self, password):
+        if self._dummy_hash is None:
+            self._dummy_hash = self._hash(os.urandom(16).hex())
+        self._verify(password, self._dummy_hash)
+        return False
+
+    def _verify(self, password, stored):
+        try:
+            parsed = self._parse(stored)
+        except ValueError:
+            return False
+        if parsed is None:
+            # A legacy plain-text password.
+            return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+        n, r, p, salt, key = parsed
+        return hmac.compare_digest(self._derive(password, salt, n, r, p), key)
+
+    @staticmethod
+    def _derive(password, salt, n, r, p):
+        return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p, dklen=_KEY_LENGTH,
+                              maxmem=128 * r * (n + p + 2) + 2 ** 20)
+
+    @staticmethod
+    def _parse(stored):
+        if not stored.startswith(_PREFIX):
+            return None
+        try:
+            parameters, salt, key = stored[len(_PREFIX):].split("$")
+            values = dict(item.split("=") for item in parameters.split(","))
+            n, r, p, salt, key = (2 ** int(values["ln"]), int(values["r"]), int(values["p"]), _b64decode(salt),
+                                  _b64decode(key))
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Malformed scrypt hash: {e}") from None
+        if len(key) != _KEY_LENGTH:
+            raise ValueError(f"Malformed scrypt hash: key of {len(key)} bytes")
+        return n, r, p, salt, key
@@ -0,0 +1,57 @@
+from PyPDF2 import PdfReader
+
+try:
+    import pymupdf
+except ImportError:  # PyMuPDF < 1.24 only ships the legacy module name
+    try:
+        import fitz as pymupdf
+    except ImportError:
+        pymupdf = None
+
+# These functions run inside worker processes, so this module must stay cheap to import:
+# no config, clients or vector store.
+
+
+def count_pages(path):
+    """
+    Count the pages of a PDF.
+
+    Uses PyMuPDF when it is installed and can open the file, PyPDF2 otherwise.
+
+    Args:
+        path (str): Path of the PDF file.
+
+    Returns:
+        int: The number of pages.
+    """
+    if pymupdf is not None:
+        try:
+            with pymupdf.open(path) as document:
+                return document.page_count
+        except Exception:
+            pass
+    return len(PdfReader(path).pages)
+
+
+def extract_pages(path, start, end):
+    """
+    Extract the text of a range of pages.
+
+    Uses PyMuPDF when it is installed and can read the file, PyPDF2 otherwise.
+
+    Args:
+        path (str): Path of the PDF file.
+        start (int): First page, inclusive.
+        end (int): Last page, exclusive.
+
+    Returns:
+        list[str]: The text of each page in the range.
+    """
+    if pymupdf is not None:
+        try:
+            with pymupdf.open(path) as document:
+                return [document[page].get_text() for page in range(start, end)]
+        except Exception:
+            pass
+    pdf_reader = PdfReader(path)
+    return [pdf_reader.pages[page].extract_text() for page in range(start, end)]
@@ -1,30 +1,57 @@
+import asyncio
 import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 
 import jwt
 from fastapi import HTTPException
 
+from repository.user_store import InMemoryUserStore, UserStore
+from service.password_hasher import PasswordHasher
+from utils.logger import logger
+
 
 class UserService:
-    def __init__(self):
+    def __init__(self, claims_cache_size: int = 10_000, password_hasher: Optional[PasswordHasher] = None,
+                 store: Optional[UserStore] = None, touch_interval: float = 60):
         """
         Initializes the UserService.
 
         Initializes user database, session storage, expiration time for tokens,
         secret key for token generation, and algorithm for token encoding.
+
+        Users and login sessions are kept in the store, which several worker processes may share; its
+        calls run in worker threads, so that a store waiting on a lock does not hold up the event loop.
+        Passwords are stored as scrypt hashes, computed off the event loop by the password hasher.
+        A session expires after expiry_time minutes without a request; its last use is written to the store
+        at most once per touch_interval seconds, so most requests only read it. The claims of verified tokens
+        are cached until the tokens expire, so the signature of a token is checked once and not on every
+        request.
+
+        Args:
+            claims_cache_size (int): Maximum number of tokens whose claims are cached.
+            password_hasher (PasswordHasher, optional): Hashes and verifies passwords.
+            store (UserStore, optional): Users and login sessions; kept in memory by default.
+            touch_interval (float): Seconds between writes of a session's last use.
         """
-        self.users_db = {}
-        self.sessions = {}
+        self.store = store or InMemoryUserStore()
+        self.touch_interval = touch_interval
         self.expiry_time = 15
         self.secret_key = "secret"
         self.algo = 'HS256'
+        self.claims_cache_size = claims_cache_size
+        # token -> (claims, expiry as a POSIX timestamp); ordered from least to most recently used.
+        self._claims = OrderedDict()
+        self._sweeper_task = None
+        self.password_hasher = password_hasher or PasswordHasher()
 
-    def login(self, username: str, password: str):
+    async def login(self, username: str, password: str):
         """
         User login.
 
-        Authenticates a user based on provided username and password.
+        Authenticates a user based on provided username and password. A password hash made with other
+        parameters than the current ones, or a password stored in plain text, is replaced by a new hash.
 
         Args:
             username (str): The username of the user.
@@ -34,16 +61,20 @@ class UserService:
             dict: A dictionary containing the success message and authentication token.
 
         Raises:
-            HTTPException: If the username or password is invalid.
+            HTTPException: 401 if the username or password is invalid, 429 if too many logins are pending.
         """
-        if username in self.users_db and self.users_db[username] == password:
-            token = self.create_token(username)
-            self.sessions[token] = datetime.utcnow()
-            return {"message": "Login successful", "token": token}
-        else:
+        stored = await asyncio.to_thread(self.store.get_password_hash, username)
+        if not await self.password_hasher.verify(password, stored):
             raise HTTPException(status_code=401, detail="Invalid username or password")
-
-    def register(self, username: str, password: str):
+        if self.password_hasher.needs_rehash(stored):
+            # Unless the password was changed meanwhile.
+            await asyncio.to_thread(self.store.set_password_hash, username, await self.password_hasher.hash(password),
+                                    expected=stored)
+        token = self.create_token(username)
+        await asyncio.to_thread(self.store.add_session, token, username, time.time())
+        return {"message": "Login successful", "token": token}
+
+    async def register(self, username: str, password: str):
         """
         User registration.
 
@@ -59,12 +90,14 @@ class UserService:
         Raises:
             HTTPException: If the username already exists.
         """
-        if username in self.users_db:
+        if await asyncio.to_thread(self.store.get_password_hash, username) is not None:
+            raise HTTPException(status_code=400, detail="Username already exists")
+        # Another registration may take the name while hashing, which add_user detects.
+        if not await asyncio.to_thread(self.store.add_user, username, await self.password_hasher.hash(password)):
             raise HTTPException(status_code=400, detail="Username already exists")
-        self.users_db[username] = password
         return {"message": "Registration successful"}
 
-    def logout(self, token: str):
+    async def logout(self, token: str):
         """
         User logout.
 
@@ -76,11 +109,10 @@ class UserService:
         Returns:
             dict: A dictionary containing the success message.
         """
-        if token in self.sessions:
-            del self.sessions[token]
+        await self._end_session(token)
         return {"message": "Logout successful"}
 
-    def get_user_details(self, username: str):
+    async def get_user_details(self, username: str):
         """
         Get user details.
 
@@ -90,17 +122,17 @@ class UserService:
             username (str): The username of the user to retrieve details for.
 
         Returns:
-            dict: A dictionary containing the user details.
+            dict: A dictionary containing the user details. The password hash is never returned.
 
         Raises:
             HTTPException: If the user is not found.
         """
-        if username in self.users_db:
-            return {"username": username, "password": self.users_db[username]}
+        if await asyncio.to_thread(self.store.get_password_hash, username) is not None:
+            return {"username": username}
         else:
             raise HTTPException(status_code=404, detail="User not found")
 
-    def set_user_details(self, username: str, password: str):
+    async def set_user_details(self, username: str, password: str):
         """
         Set user details.
 
@@ -113,7 +145,7 @@ class UserService:
         Returns:
             dict: A dictionary containing the success message.
         """
-        self.users_db[username] = password
+        await asyncio.to_thread(self.store.set_password_hash, username, await self.password_hasher.hash(password))
         return {"message": "User details updated"}
 
     def create_token(self, username: str, expires_delta: Optional[timedelta] = None):
@@ -136,27 +168,123 @@ class UserService:
         token = jwt.encode({"sub": username, "exp": expire}, self.secret_key, algorithm='HS256')
         return token
 
-    def verify_token(self, token: str):
+    def decodeJWT(self, token: str):
         """
-        Verify authentication token.
+        Decode authentication token.
 
-        Verifies the validity of the provided authentication token.
+        Decodes the provided JWT and checks its signature and expiry.
 
         Args:
             token (str): The authentication token.
 
         Returns:
-            str: The username associated with the token.
+            dict: The claims of the token.
 
         Raises:
             HTTPException: If the token is expired or invalid.
         """
         try:
-            payload = jwt.decode(token, self.secret_key, algorithm='HS256')
-            username = payload["sub"]
-            if token in self.sessions:
-                self.sessions[token] = datetime.utcnow()
-            return username
+            return jwt.decode(token, self.secret_key, algorithms=[self.algo])
         except jwt.ExpiredSignatureError:
             raise HTTPException(status_code=401, detail="Token has expired")
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Invalid token")
 
+    async def verify_token(self, token: str):
+        """
+        Verify authentication token.
+
+        Verifies that the token belongs to a live session and that its signature and expiry are valid.
+        The token is decoded on its first use only; later requests read its claims from the cache. A session
+        the store has cached is checked without leaving the event loop.
+
+        Args:
+            token (str): The authentication token.
+
+        Returns:
+            str: The username associated with the token.
+
+        Raises:
+            HTTPException: If the token is expired or invalid, or its session has ended.
+        """
+        now = time.time()
+        expiry = self.expiry_time * 60
+        last_seen = self.store.cached_session(token)
+        if last_seen is None:
+            last_seen = await asyncio.to_thread(self.store.get_session, token)
+        if last_seen is not None and now - last_seen > expiry:
+            # Another worker may have used the session since it was cached.
+            last_seen = await asyncio.to_thread(self.store.get_session, token, True)
+        if last_seen is None:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        if now - last_seen > expiry:
+            await self._end_session(token)
+            raise HTTPException(status_code=401, detail="Token has expired")
+        try:
+            claims = self._cached_claims(token)
+        except HTTPException:
+            await self._end_session(token)
+            raise
+        if now - last_seen >= self.touch_interval:
+            await asyncio.to_thread(self.store.touch_session, token, now)
+        return claims["sub"]
+
+    async def sweep_sessions(self):
+        """
+        End the sessions that expired, and drop the cached claims of expired tokens.
+
+        Returns:
+            int: The number of sessions ended.
+        """
+        ended = await asyncio.to_thread(self.store.sweep_sessions, time.time() - self.expiry_time * 60)
+        self._sweep_claims()
+        return ended
+
+    def start_sweeper(self, interval: float):
+        """
+        Starts ending expired sessions in the background, every interval seconds.
+
+        Args:
+            interval (float): Seconds between sweeps.
+        """
+        self._sweeper_task = asyncio.ensure_future(self._sweep_periodically(interval))
+
+    async def stop_sweeper(self):
+        """
+        Stops the background sweeper.
+        """
+        if self._sweeper_task is not None:
+            self._sweeper_task.cancel()
+            await asyncio.gather(self._sweeper_task, return_exceptions=True)
+            self._sweeper_task = None
+
+    async def _sweep_periodically(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            ended = await self.sweep_sessions()
+            if ended:
+                logger.info(f"Ended {ended} expired sessions")
+
+    def _sweep_claims(self):
+        now = time.time()
+        for token in [token for token, (_, expires_at) in self._claims.items() if expires_at <= now]:
+            del self._claims[token]
+
+    def _cached_claims(self, token):
+        entry = self._claims.get(token)
+        if entry is not None:
+            claims, expires_at = entry
+            if time.time() < expires_at:
+                self._claims.move_to_end(token)
+                return claims
+            del self._claims[token]
+        claims = self.decodeJWT(token)
+        self._claims[token] = (claims, claims["exp"])
+        while len(self._claims) > self.claims_cache_size:
+            self._claims.popitem(last=False)
+        return claims
+
+    async def _end_session(self, token):
+        # The claims cache is only ever touched from the event loop.
+        self._claims.pop(token, None)
+        await asyncio.to_thread(self.store.delete_session, token)
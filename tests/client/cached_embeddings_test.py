@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from client.cached_embeddings import CachedEmbeddings
+from repository.embedding_cache import EmbeddingCache
+
+
+class TestCachedEmbeddings(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = EmbeddingCache(os.path.join(self.tmp_dir.name, "embeddings.sqlite3"))
+        self.model = MagicMock(spec=["aembed_documents", "embed_documents"])
+        self.model.aembed_documents = AsyncMock(side_effect=lambda texts: [[float(len(t))] for t in texts])
+        self.model.embed_documents = MagicMock(side_effect=lambda texts: [[float(len(t))] for t in texts])
+        self.embeddings = CachedEmbeddings(self.model, self.cache, model="test-model")
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    async def test_embeds_each_distinct_text_once(self):
+        vectors, stats = await self.embeddings.aembed_documents_with_stats(["one", "three", "one"])
+        self.assertEqual(vectors, [[3.0], [5.0], [3.0]])
+        self.assertEqual(stats["cache_hits"], 0)
+        self.model.aembed_documents.assert_awaited_once_with(["one", "three"])
+
+    async def test_skips_cached_texts(self):
+        await self.embeddings.aembed_documents(["one", "three"])
+        vectors, stats = await self.embeddings.aembed_documents_with_stats(["one", "three", "five"])
+
+        self.assertEqual(vectors, [[3.0], [5.0], [4.0]])
+        self.assertEqual(stats["cache_hits"], 2)
+        self.model.aembed_documents.assert_awaited_with(["five"])
+
+    async def test_query_shares_document_cache(self):
+        await self.embeddings.aembed_documents(["a question"])
+        self.assertEqual(await self.embeddings.aembed_query("a question"), [10.0])
+        self.assertEqual(self.embeddings.embed_query("a question"), [10.0])
+        self.assertEqual(self.model.aembed_documents.await_count, 1)
+        self.model.embed_documents.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
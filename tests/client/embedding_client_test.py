@@ -0,0 +1,109 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import patch
+
+import httpx
+import openai
+from openai import AsyncOpenAI, OpenAI
+
+from client.embedding_client import BatchedEmbeddings
+from tests.fake_encoding import FakeEncoding
+
+
+class FakeEmbeddingServer:
+    """
+    In-process fake of the embeddings endpoint that tracks requests and can reply 429 first.
+    """
+
+    def __init__(self, rate_limited_requests=0, latency=0.0):
+        self.rate_limited_requests = rate_limited_requests
+        self.latency = latency
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def handler(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.rate_limited_requests > 0:
+                self.rate_limited_requests -= 1
+                return httpx.Response(429, json={"error": {"message": "Rate limit reached"}})
+            inputs = json.loads(request.content)["input"]
+            self.requests.append(inputs)
+            return httpx.Response(200, json={
+                "object": "list",
+                "model": "text-embedding-ada-002",
+                "data": [{"object": "embedding", "index": i, "embedding": [float(len(text))]}
+                         for i, text in enumerate(inputs)],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            })
+        finally:
+            self.in_flight -= 1
+
+    def client(self):
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+        return AsyncOpenAI(api_key="test", base_url="http://fake-openai/v1", http_client=http_client)
+
+
+class TestBatchedEmbeddings(unittest.IsolatedAsyncioTestCase):
+
+    def embeddings(self, server, **kwargs):
+        return BatchedEmbeddings(server.client(), OpenAI(api_key="test"), encoding=FakeEncoding(),
+                                 base_delay=0.001, **kwargs)
+
+    def test_batch_ranges_respect_token_and_input_limits(self):
+        embeddings = self.embeddings(FakeEmbeddingServer(), max_batch_tokens=10, max_batch_inputs=3)
+        self.assertEqual(embeddings.batch_ranges([4, 4, 4, 1, 1, 1, 1, 12]), [(0, 2), (2, 5), (5, 7), (7, 8)])
+
+    async def test_embeds_in_order_across_batches(self):
+        server = FakeEmbeddingServer()
+        embeddings = self.embeddings(server, max_batch_tokens=3)
+        texts = ["a b", "c", "d e f", "g"]
+
+        vectors, stats = await embeddings.aembed_documents_with_stats(texts)
+
+        self.assertEqual(vectors, [[3.0], [1.0], [5.0], [1.0]])
+        self.assertEqual(server.requests, [["a b"], ["c"], ["d e f"], ["g"]])
+        self.assertEqual(stats["chunks"], 4)
+        self.assertEqual(stats["tokens"], 3 + 1 + 5 + 1)
+        self.assertEqual(stats["batches"], 4)
+
+    async def test_batches_run_concurrently_under_semaphore(self):
+        server = FakeEmbeddingServer(latency=0.05)
+        embeddings = self.embeddings(server, max_batch_inputs=1, max_concurrency=3)
+
+        await embeddings.aembed_documents([f"text {i}" for i in range(9)])
+
+        self.assertEqual(server.max_in_flight, 3)
+
+    async def test_retries_rate_limited_batches(self):
+        server = FakeEmbeddingServer(rate_limited_requests=2)
+        embeddings = self.embeddings(server)
+
+        self.assertEqual(await embeddings.aembed_query("hello"), [5.0])
+        self.assertEqual(len(server.requests), 1)
+
+    async def test_backoff_releases_the_request_slot(self):
+        server = FakeEmbeddingServer(rate_limited_requests=1)
+        embeddings = self.embeddings(server, max_batch_inputs=1, max_concurrency=1)
+
+        with patch.object(embeddings, "_backoff", return_value=0.05):
+            vectors = await embeddings.aembed_documents(["a", "b c"])
+
+        # The second batch is sent while the first one waits to retry.
+        self.assertEqual(vectors, [[1.0], [3.0]])
+        self.assertEqual(server.requests, [["b c"], ["a"]])
+
+    async def test_gives_up_after_max_retries(self):
+        server = FakeEmbeddingServer(rate_limited_requests=10)
+        embeddings = self.embeddings(server, max_retries=2)
+
+        with self.assertRaises(openai.RateLimitError):
+            await embeddings.aembed_query("hello")
+
+
+if __name__ == "__main__":
+    unittest.main()
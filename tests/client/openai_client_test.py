@@ -1,10 +1,38 @@
+import asyncio
+import json
+import time
 import unittest
 from unittest.mock import MagicMock, patch
 
+import httpx
+from openai import AsyncOpenAI
+
 from client.openai_client import OpenAIClient
 from config import API_KEY
 
 
+def fake_openai_client(latency):
+    """
+    Build an AsyncOpenAI client whose transport is a local fake chat completions server.
+    """
+    async def handler(request):
+        await asyncio.sleep(latency)
+        return httpx.Response(200, json={
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-3.5-turbo",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "fake response"},
+                "finish_reason": "stop",
+            }],
+        })
+
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return AsyncOpenAI(api_key=API_KEY, base_url="http://fake-openai/v1", http_client=http_client)
+
+
 class TestOpenAIClient(unittest.TestCase):
 
     def test_get_prompt(self):
@@ -32,5 +60,63 @@ class TestOpenAIClient(unittest.TestCase):
         self.assertEqual(refined_query, "Test query")
 
 
+def fake_streaming_openai_client(tokens):
+    """
+    Build an AsyncOpenAI client whose transport streams the given tokens as chat completion chunks.
+    """
+    def handler(request):
+        body = ""
+        for token in tokens:
+            chunk = {
+                "id": "chatcmpl-test",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": "gpt-3.5-turbo",
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            body += f"data: {json.dumps(chunk)}\n\n"
+        body += "data: [DONE]\n\n"
+        return httpx.Response(200, content=body.encode(), headers={"content-type": "text/event-stream"})
+
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return AsyncOpenAI(api_key=API_KEY, base_url="http://fake-openai/v1", http_client=http_client)
+
+
+class TestOpenAIClientConcurrency(unittest.IsolatedAsyncioTestCase):
+
+    async def test_get_chat_response(self):
+        client = OpenAIClient(api_key=API_KEY, client=fake_openai_client(latency=0))
+        response = await client.get_chat_response([client.get_prompt("Test query")])
+        self.assertEqual(response, "fake response")
+
+    async def test_concurrent_chat_responses_do_not_serialize(self):
+        latency = 0.2
+        client = OpenAIClient(api_key=API_KEY, client=fake_openai_client(latency=latency))
+        messages = [client.get_prompt("Test query")]
+
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[client.get_chat_response(messages) for _ in range(10)])
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(responses, ["fake response"] * 10)
+        self.assertLess(elapsed, latency * 3)
+
+    async def test_max_concurrency_bounds_in_flight_requests(self):
+        latency = 0.1
+        client = OpenAIClient(api_key=API_KEY, client=fake_openai_client(latency=latency), max_concurrency=1)
+        messages = [client.get_prompt("Test query")]
+
+        start = time.perf_counter()
+        await asyncio.gather(*[client.get_chat_response(messages) for _ in range(3)])
+        elapsed = time.perf_counter() - start
+
+        self.assertGreaterEqual(elapsed, latency * 3)
+
+    async def test_stream_chat_response(self):
+        client = OpenAIClient(api_key=API_KEY, client=fake_streaming_openai_client(["Hel", "lo"]))
+        tokens = [token async for token in client.stream_chat_response([client.get_prompt("Test query")])]
+        self.assertEqual(tokens, ["Hel", "lo"])
+
+
 if __name__ == "__main__":
     unittest.main()
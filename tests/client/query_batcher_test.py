@@ -0,0 +1,73 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from client.query_batcher import QueryBatcher
+
+
+class TestQueryBatcher(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.model = MagicMock(spec=["aembed_documents"])
+        self.model.aembed_documents = AsyncMock(side_effect=lambda texts: [[float(len(t))] for t in texts])
+        self.batcher = QueryBatcher(self.model, window=0.01, max_batch_size=4, buckets=(1, 2, 4))
+
+    async def test_coalesces_concurrent_queries(self):
+        vectors = await asyncio.gather(*(self.batcher.aembed_query(text) for text in ["a", "bb", "ccc"]))
+
+        self.assertEqual(vectors, [[1.0], [2.0], [3.0]])
+        self.model.aembed_documents.assert_awaited_once_with(["a", "bb", "ccc"])
+        self.assertEqual(self.batcher.stats()["batch_size_histogram"], {"1": 0, "2": 0, "4": 1, "+Inf": 0})
+        self.assertEqual(self.batcher.batch_size_histogram(), [0, 0, 1, 0, 3])
+
+    async def test_deduplicates_identical_queries(self):
+        vectors = await asyncio.gather(*(self.batcher.aembed_query(text) for text in ["a", "bb", "a", "a"]))
+
+        self.assertEqual(vectors, [[1.0], [2.0], [1.0], [1.0]])
+        self.model.aembed_documents.assert_awaited_once_with(["a", "bb"])
+        stats = self.batcher.stats()
+        self.assertEqual((stats["queries"], stats["deduplicated"], stats["batches"]), (4, 2, 1))
+
+    async def test_full_batch_is_sent_without_waiting(self):
+        self.batcher.window = 60
+        texts = [str(i) for i in range(8)]
+
+        vectors = await asyncio.wait_for(asyncio.gather(*(self.batcher.aembed_query(t) for t in texts)), timeout=1)
+
+        self.assertEqual(len(vectors), 8)
+        self.assertEqual(self.model.aembed_documents.await_count, 2)
+        self.assertEqual(self.batcher.stats()["mean_batch_size"], 4.0)
+
+    async def test_sequential_queries_are_not_deduplicated(self):
+        await self.batcher.aembed_query("a")
+        await self.batcher.aembed_query("a")
+
+        self.assertEqual(self.model.aembed_documents.await_count, 2)
+        self.assertEqual(self.batcher.stats()["batch_size_histogram"]["1"], 2)
+
+    async def test_errors_reach_every_caller(self):
+        self.model.aembed_documents.side_effect = RuntimeError("embedding failed")
+
+        results = await asyncio.gather(self.batcher.aembed_query("a"), self.batcher.aembed_query("b"),
+                                       return_exceptions=True)
+
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        self.model.aembed_documents.side_effect = lambda texts: [[float(len(t))] for t in texts]
+        self.assertEqual(await self.batcher.aembed_query("a"), [1.0])
+
+    async def test_cancelled_caller_does_not_cancel_shared_query(self):
+        first = asyncio.ensure_future(self.batcher.aembed_query("a"))
+        second = asyncio.ensure_future(self.batcher.aembed_query("a"))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        self.assertEqual(await second, [1.0])
+
+    async def test_documents_pass_through(self):
+        self.assertEqual(await self.batcher.aembed_documents(["a", "bb"]), [[1.0], [2.0]])
+        vectors, stats = await self.batcher.aembed_documents_with_stats(["a"])
+        self.assertEqual((vectors, stats), ([[1.0]], {}))
+        self.assertEqual(self.batcher.stats()["batches"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+import re
+
+
+class FakeEncoding:
+    """
+    Offline stand-in for a tiktoken encoding: every word and every whitespace run is one token.
+    """
+
+    def __init__(self):
+        self.vocabulary = {}
+        self.pieces = []
+
+    def encode_ordinary(self, text):
+        tokens = []
+        for piece in re.findall(r"\s+|\S+", text):
+            if piece not in self.vocabulary:
+                self.vocabulary[piece] = len(self.pieces)
+                self.pieces.append(piece)
+            tokens.append(self.vocabulary[piece])
+        return tokens
+
+    def encode(self, text, **kwargs):
+        return self.encode_ordinary(text)
+
+    def encode_ordinary_batch(self, texts):
+        return [self.encode_ordinary(text) for text in texts]
+
+    def decode(self, tokens):
+        return "".join(self.pieces[token] for token in tokens)
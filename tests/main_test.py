@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+from main import app
+
+
+class TestLifespan(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        settings = patch.multiple(
+            "container",
+            DATA_DIR=self.tmp_dir.name,
+            CACHE_DIR=self.tmp_dir.name,
+            INDEX_DIR=self.tmp_dir.name,
+            USER_DB_PATH=os.path.join(self.tmp_dir.name, "users.sqlite3"),
+            SESSION_SPILL_PATH=os.path.join(self.tmp_dir.name, "sessions.sqlite3"),
+            PASSWORD_SCRYPT_N=2 ** 4,
+            PASSWORD_SCRYPT_R=1,
+            PASSWORD_HASH_WORKERS=0,
+            STARTUP_WARM_TOKENIZERS=False,
+            STARTUP_WARM_CONNECTIONS=0,
+        )
+        settings.start()
+        self.addCleanup(settings.stop)
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+        self.tmp_dir.cleanup()
+
+    async def test_ready_only_while_running(self):
+        async with app.router.lifespan_context(app):
+            live = await self.client.get("/health/live")
+            ready = await self.client.get("/health/ready")
+
+        self.assertEqual(live.status_code, 200)
+        self.assertEqual(ready.status_code, 200)
+        self.assertEqual(ready.json()["status"], "ready")
+        self.assertLessEqual(ready.json()["import_seconds"], ready.json()["startup_seconds"])
+        self.assertEqual((await self.client.get("/health/ready")).status_code, 503)
+        self.assertEqual((await self.client.get("/health/live")).status_code, 200)
+
+    async def test_routes_use_the_container(self):
+        async with app.router.lifespan_context(app):
+            credentials = {"username": "alice", "password": "password"}
+            await self.client.post("/register", json=credentials)
+            token = (await self.client.post("/login", json=credentials)).json()["token"]
+            documents = await self.client.get("/get-documents", headers={"Authorization": f"Bearer {token}"})
+            metrics = await self.client.get("/metrics")
+
+        self.assertEqual(documents.status_code, 200)
+        self.assertEqual(documents.json()["documents"], [])
+        self.assertIn('rag_startup_seconds{phase="ready"}', metrics.text)
+        self.assertIn("rag_cache_hits_total", metrics.text)
+        self.assertIn("rag_response_cache_latency_saved_seconds_total 0", metrics.text)
+        self.assertIn('rag_query_embedding_batch_size_bucket{le="+Inf"} 0', metrics.text)
+
+    async def test_recent_users_are_preloaded_on_restart(self):
+        credentials = {"username": "alice", "password": "password"}
+        async with app.router.lifespan_context(app):
+            await self.client.post("/register", json=credentials)
+            await self.client.post("/login", json=credentials)
+
+        async with app.router.lifespan_context(app):
+            self.assertEqual(app.state.container.shard_store.stats()["resident"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
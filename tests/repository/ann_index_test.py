@@ -0,0 +1,181 @@
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+import faiss
+import numpy as np
+from langchain_community.docstore import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from repository.ann_index import (IndexMigrator, add_documents, create_index, index_ids, remove_documents, search,
+                                  search_and_reconstruct, search_parameters, similarity_search,
+                                  similarity_search_with_vectors, with_ids)
+from repository.index_store import IndexStore
+from utils.locks import ReadWriteLock
+
+_DIMENSION = 16
+
+
+class TestAnnIndex(unittest.TestCase):
+
+    def test_create_index_types(self):
+        self.assertIsInstance(faiss.downcast_index(create_index("flat", _DIMENSION)), faiss.IndexFlat)
+        self.assertIsInstance(create_index("ivf_flat", _DIMENSION, nlist=4), faiss.IndexIVFFlat)
+        self.assertIsInstance(create_index("ivf_pq", _DIMENSION, nlist=4, pq_m=4), faiss.IndexIVFPQ)
+        self.assertIsInstance(create_index("hnsw", _DIMENSION, hnsw_m=8), faiss.IndexHNSWFlat)
+
+    def test_create_index_unknown_type(self):
+        with self.assertRaises(ValueError):
+            create_index("lsh", _DIMENSION)
+
+    def test_search_parameters(self):
+        self.assertIsNone(search_parameters(create_index("flat", _DIMENSION), nprobe=8, ef_search=8))
+        ivf_params = search_parameters(create_index("ivf_flat", _DIMENSION, nlist=4), nprobe=3)
+        self.assertEqual(ivf_params.nprobe, 3)
+        hnsw_params = search_parameters(create_index("hnsw", _DIMENSION, hnsw_m=8), ef_search=40)
+        self.assertEqual(hnsw_params.efSearch, 40)
+
+    def test_search_with_nprobe(self):
+        vectors = np.random.rand(500, _DIMENSION).astype("float32")
+        index = create_index("ivf_flat", _DIMENSION, nlist=8)
+        index.train(vectors)
+        index.add(vectors)
+
+        # Visiting every cell makes IVF search exact.
+        _, ids = search(index, vectors[:5], 1, nprobe=8)
+        self.assertEqual(ids[:, 0].tolist(), [0, 1, 2, 3, 4])
+
+    def test_search_and_reconstruct(self):
+        vectors = np.random.rand(100, _DIMENSION).astype("float32")
+        index = create_index("hnsw", _DIMENSION, hnsw_m=8)
+        index.add(vectors)
+
+        _, ids, reconstructed = search_and_reconstruct(index, vectors[:2], 3, ef_search=32)
+
+        np.testing.assert_array_equal(reconstructed, vectors[ids])
+
+    def test_with_ids_keeps_existing_vectors_as_rows(self):
+        vectors = np.random.rand(10, _DIMENSION).astype("float32")
+        index = create_index("flat", _DIMENSION)
+        index.add(vectors)
+
+        index = with_ids(index)
+        index.add_with_ids(vectors[:1], np.array([100], dtype="int64"))
+
+        self.assertEqual(index_ids(index).tolist(), list(range(10)) + [100])
+        np.testing.assert_array_equal(index.reconstruct(100), vectors[0])
+        self.assertIs(with_ids(index), index)
+
+    def test_remove_documents_keeps_other_ids(self):
+        for index_type in ("flat", "ivf_flat"):
+            with self.subTest(index_type=index_type):
+                vectors = np.random.rand(50, _DIMENSION).astype("float32")
+                vdb = FAISS(embedding_function=None, index=with_ids(create_index(index_type, _DIMENSION, nlist=4)),
+                            docstore=InMemoryDocstore(), index_to_docstore_id={})
+                vdb.index.train(vectors)
+                add_documents(vdb, range(50), [f"text {i}" for i in range(50)], vectors, [{}] * 50)
+
+                self.assertEqual(remove_documents(vdb, [3, 7, 7, 99]), 2)
+
+                self.assertEqual(vdb.index.ntotal, 48)
+                self.assertEqual(sorted(index_ids(vdb.index).tolist()), [i for i in range(50) if i not in (3, 7)])
+                self.assertEqual(len(vdb.docstore._dict), 48)
+                np.testing.assert_array_equal(vdb.index.reconstruct(8), vectors[8])
+
+
+class TestSimilaritySearch(unittest.IsolatedAsyncioTestCase):
+    async def test_skips_vectors_hnsw_could_not_remove(self):
+        vectors = np.random.rand(20, _DIMENSION).astype("float32")
+        embeddings = MagicMock()
+        embeddings.aembed_query = AsyncMock(return_value=vectors[0].tolist())
+        vdb = FAISS(embedding_function=embeddings, index=with_ids(create_index("hnsw", _DIMENSION, hnsw_m=8)),
+                    docstore=InMemoryDocstore(), index_to_docstore_id={})
+        add_documents(vdb, range(20), [f"text {i}" for i in range(20)], vectors, [{}] * 20)
+
+        remove_documents(vdb, [0, 1, 2])
+        _, hits, found = await similarity_search_with_vectors(vdb, "query", k=17, ef_search=64)
+
+        self.assertEqual(vdb.index.ntotal, 20)
+        self.assertEqual(sorted(hit[1].page_content for hit in hits), sorted(f"text {i}" for i in range(3, 20)))
+        self.assertEqual(len(found), 17)
+
+    async def test_search_waits_for_writers(self):
+        vectors = np.random.rand(20, _DIMENSION).astype("float32")
+        embeddings = MagicMock()
+        embeddings.aembed_query = AsyncMock(return_value=vectors[0].tolist())
+        vdb = FAISS(embedding_function=embeddings, index=with_ids(create_index("flat", _DIMENSION)),
+                    docstore=InMemoryDocstore(), index_to_docstore_id={})
+        add_documents(vdb, range(20), [f"text {i}" for i in range(20)], vectors, [{}] * 20)
+        lock = ReadWriteLock()
+
+        async with lock.write():
+            search_task = asyncio.ensure_future(similarity_search(vdb, "query", k=1, lock=lock))
+            await asyncio.sleep(0.01)
+            self.assertFalse(search_task.done())
+            remove_documents(vdb, [0])
+
+        # The search ran after the removal, not during it.
+        docs = await search_task
+        self.assertEqual(len(docs), 1)
+        self.assertNotEqual(docs[0].page_content, "text 0")
+
+
+class TestIndexMigrator(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index_store = IndexStore(self.tmp_dir.name, debounce=60)
+        self.vdb = FAISS(
+            embedding_function=None,
+            index=with_ids(create_index("flat", _DIMENSION)),
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={},
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def add_vectors(self, n, start=0):
+        vectors = np.random.rand(n, _DIMENSION).astype("float32")
+        add_documents(self.vdb, range(start, start + n), [f"text {i}" for i in range(start, start + n)], vectors,
+                      [{}] * n)
+        return vectors
+
+    async def test_waits_for_train_threshold(self):
+        migrator = IndexMigrator("ivf_flat", _DIMENSION, self.index_store, train_threshold=1000, nlist=4)
+        self.add_vectors(100)
+        migrator.maybe_migrate(self.vdb)
+        self.assertIsNone(migrator._migration)
+        self.assertFalse(migrator.is_migrated(self.vdb))
+
+    async def test_migrates_to_trained_index(self):
+        migrator = IndexMigrator("ivf_flat", _DIMENSION, self.index_store, train_threshold=200, nlist=4)
+        vectors = self.add_vectors(300)
+        migrator.maybe_migrate(self.vdb)
+        await migrator._migration
+
+        self.assertIsInstance(self.vdb.index, faiss.IndexIVFFlat)
+        self.assertEqual(self.vdb.index.ntotal, 300)
+        self.assertTrue(migrator.is_migrated(self.vdb))
+        _, ids = search(self.vdb.index, vectors[7:8], 1, nprobe=4)
+        self.assertEqual(self.vdb.docstore.search(self.vdb.index_to_docstore_id[ids[0][0]]).page_content, "text 7")
+        await self.index_store.flush(self.vdb)
+
+    async def test_catches_up_with_changes_during_training(self):
+        migrator = IndexMigrator("ivf_flat", _DIMENSION, self.index_store, train_threshold=200, nlist=4)
+        self.add_vectors(300)
+        migrator.maybe_migrate(self.vdb)
+        # Lets the migration copy the vectors and start training before the store changes.
+        await asyncio.sleep(0)
+        async with self.index_store.lock.write():
+            remove_documents(self.vdb, [5, 6])
+            added = self.add_vectors(10, start=300)
+        await migrator._migration
+
+        self.assertIsInstance(self.vdb.index, faiss.IndexIVFFlat)
+        self.assertEqual(sorted(index_ids(self.vdb.index).tolist()), [i for i in range(310) if i not in (5, 6)])
+        np.testing.assert_array_equal(self.vdb.index.reconstruct(305), added[5])
+
+
+if __name__ == "__main__":
+    unittest.main()
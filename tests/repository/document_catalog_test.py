@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+
+from repository.document_catalog import DocumentCatalog
+
+
+class TestDocumentCatalog(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.catalog = DocumentCatalog(os.path.join(self.tmp_dir.name, "documents.sqlite3"))
+
+    def tearDown(self):
+        self.catalog.close()
+        self.tmp_dir.cleanup()
+
+    def add_documents(self, n, owner="alice"):
+        for i in range(n):
+            self.catalog.add(f"{owner}-{i:02d}", owner, f"file {n - i:02d}.pdf", size=100 * (i % 3))
+
+    def list_all(self, **kwargs):
+        doc_ids, cursor, pages = [], None, 0
+        while True:
+            page = self.catalog.list("alice", cursor=cursor, **kwargs)
+            doc_ids.extend(document["doc_id"] for document in page["documents"])
+            pages += 1
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return doc_ids, pages
+
+    def test_add_update_and_delete(self):
+        document = self.catalog.add("doc", "alice", "file.pdf", 1234)
+        self.assertEqual((document["owner"], document["status"], document["size"]), ("alice", "uploaded", 1234))
+
+        self.catalog.update("doc", status="indexed", pages=3, chunks=7, indexed_at=1.0)
+
+        document = self.catalog.get("doc")
+        self.assertEqual((document["status"], document["pages"], document["chunks"]), ("indexed", 3, 7))
+        self.assertGreaterEqual(document["updated_at"], document["created_at"])
+        with self.assertRaises(ValueError):
+            self.catalog.update("doc", owner="bob")
+        self.assertTrue(self.catalog.delete("doc"))
+        self.assertIsNone(self.catalog.get("doc"))
+        self.assertFalse(self.catalog.delete("doc"))
+
+    def test_keyset_pagination_visits_every_document_once(self):
+        self.add_documents(25)
+        self.add_documents(5, owner="bob")
+
+        doc_ids, pages = self.list_all(limit=10, sort="size", descending=False)
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(sorted(doc_ids), [f"alice-{i:02d}" for i in range(25)])
+        sizes = [self.catalog.get(doc_id)["size"] for doc_id in doc_ids]
+        self.assertEqual(sizes, sorted(sizes))
+
+    def test_newest_first_by_default(self):
+        self.add_documents(3)
+
+        documents = self.catalog.list("alice")["documents"]
+
+        self.assertEqual([document["doc_id"] for document in documents], ["alice-02", "alice-01", "alice-00"])
+
+    def test_documents_added_while_paging_do_not_shift_pages(self):
+        self.add_documents(6)
+        first = self.catalog.list("alice", sort="filename", limit=3)
+        self.catalog.add("alice-new", "alice", "file 00.pdf", 0)
+
+        second = self.catalog.list("alice", sort="filename", limit=3, cursor=first["next_cursor"])
+
+        seen = [document["filename"] for document in first["documents"] + second["documents"]]
+        self.assertEqual(seen, [f"file {i:02d}.pdf" for i in range(6, 0, -1)])
+
+    def test_filter_by_status(self):
+        self.add_documents(4)
+        self.catalog.update("alice-01", status="failed", error="boom")
+
+        page = self.catalog.list("alice", status="failed")
+
+        self.assertEqual([document["doc_id"] for document in page["documents"]], ["alice-01"])
+        self.assertIsNone(page["next_cursor"])
+
+    def test_rejects_invalid_sort_and_cursor(self):
+        self.add_documents(3)
+        cursor = self.catalog.list("alice", limit=1)["next_cursor"]
+
+        with self.assertRaises(ValueError):
+            self.catalog.list("alice", sort="owner")
+        with self.assertRaises(ValueError):
+            self.catalog.list("alice", cursor="not a cursor")
+        with self.assertRaises(ValueError):
+            self.catalog.list("alice", sort="size", cursor=cursor)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+from repository.embedding_cache import EmbeddingCache, cache_key, normalize_text
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "embeddings.sqlite3")
+        self.cache = EmbeddingCache(self.path, max_entries=3)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    def test_cache_key_normalizes_whitespace(self):
+        self.assertEqual(normalize_text("  some\n\ttext  here "), "some text here")
+        self.assertEqual(cache_key("model", "some  text"), cache_key("model", "some\ntext"))
+        self.assertNotEqual(cache_key("model-a", "some text"), cache_key("model-b", "some text"))
+
+    def test_put_and_get(self):
+        self.cache.put_many({"a": [0.5, 1.0], "b": [2.0, 3.0]})
+        found = self.cache.get_many(["a", "b", "c"])
+        self.assertEqual(found, {"a": [0.5, 1.0], "b": [2.0, 3.0]})
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+
+    def test_persists_across_instances(self):
+        self.cache.put_many({"a": [0.5, 1.0]})
+        reopened = EmbeddingCache(self.path, max_entries=3)
+        self.assertEqual(reopened.get_many(["a"]), {"a": [0.5, 1.0]})
+        self.assertEqual(len(reopened), 1)
+        reopened.close()
+
+    def test_evicts_least_recently_used(self):
+        self.cache.put_many({"a": [1.0]})
+        self.cache.put_many({"b": [2.0]})
+        self.cache.put_many({"c": [3.0]})
+        self.cache.get_many(["a"])
+        self.cache.put_many({"d": [4.0]})
+
+        self.assertEqual(len(self.cache), 3)
+        self.assertEqual(set(self.cache.get_many(["a", "b", "c", "d"])), {"a", "c", "d"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import faiss
+import numpy as np
+from langchain_community.docstore import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from repository.ann_index import add_documents, index_ids, remove_documents, with_ids
+from repository.index_store import IndexStore
+
+_DIMENSION = 8
+
+
+def build_vdb(n):
+    vdb = FAISS(
+        embedding_function=None,
+        index=faiss.IndexFlatL2(_DIMENSION),
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+    )
+    vectors = np.random.rand(n, _DIMENSION).astype("float32")
+    vdb.add_embeddings([(f"text {i}", vector) for i, vector in enumerate(vectors)])
+    return vdb, vectors
+
+
+class TestIndexStore(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index_store = IndexStore(self.tmp_dir.name, debounce=0.01)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_load_without_snapshot(self):
+        self.assertIsNone(self.index_store.load(None))
+
+    def test_save_and_load(self):
+        vdb, vectors = build_vdb(10)
+        self.index_store.save(vdb)
+
+        loaded = IndexStore(self.tmp_dir.name).load(None)
+
+        self.assertEqual(loaded.index.ntotal, 10)
+        self.assertEqual(loaded.index_to_docstore_id, vdb.index_to_docstore_id)
+        docs = loaded.similarity_search_by_vector(vectors[3].tolist(), k=1)
+        self.assertEqual(docs[0].page_content, "text 3")
+
+    def test_make_writable_after_mmap_load(self):
+        vdb, _ = build_vdb(10)
+        self.index_store.save(vdb)
+        store = IndexStore(self.tmp_dir.name)
+        loaded = store.load(None)
+        self.assertTrue(store.is_mapped)
+
+        store.make_writable(loaded)
+        add_documents(loaded, [10], ["new text"], np.random.rand(1, _DIMENSION), [{}])
+
+        self.assertFalse(store.is_mapped)
+        self.assertEqual(loaded.index.ntotal, 11)
+
+    def test_load_upgrades_row_indexes_to_ids(self):
+        vdb, vectors = build_vdb(10)
+        self.index_store.save(vdb)
+
+        store = IndexStore(self.tmp_dir.name)
+        loaded = store.load(None)
+
+        self.assertIsInstance(loaded.index, faiss.IndexIDMap2)
+        np.testing.assert_array_equal(index_ids(loaded.index), np.arange(10))
+        store.make_writable(loaded)
+        remove_documents(loaded, [3])
+        docs = loaded.similarity_search_by_vector(vectors[4].tolist(), k=1)
+        self.assertEqual(docs[0].page_content, "text 4")
+
+    def test_lexical_index_skips_removed_ids(self):
+        vdb = FAISS(embedding_function=None, index=with_ids(faiss.IndexFlatL2(_DIMENSION)),
+                    docstore=InMemoryDocstore(), index_to_docstore_id={})
+        add_documents(vdb, range(4), ["zero", "one", "two", "three"], np.random.rand(4, _DIMENSION), [{}] * 4)
+        remove_documents(vdb, [1, 3])
+        self.index_store.save(vdb)
+
+        lexical_index = IndexStore(self.tmp_dir.name).load_lexical(vdb)
+
+        self.assertEqual((len(lexical_index), lexical_index.size), (2, 3))
+        self.assertEqual(lexical_index.search("two", 4)[0].tolist(), [2])
+        self.assertEqual(len(lexical_index.search("one", 4)[0]), 0)
+
+    def test_lexical_index_is_rebuilt_then_saved_with_snapshot(self):
+        vdb, _ = build_vdb(10)
+        self.index_store.save(vdb)
+
+        lexical_index = self.index_store.load_lexical(vdb)
+        self.assertEqual(len(lexical_index), 10)
+        self.assertEqual(lexical_index.search("text 7", 1)[0].tolist(), [7])
+
+        lexical_index.add(["unsaved text"])
+        store = IndexStore(self.tmp_dir.name)
+        self.assertEqual(len(store.load_lexical(vdb)), 10)
+
+        vdb.index = with_ids(vdb.index)
+        add_documents(vdb, [10], ["unsaved text"], np.random.rand(1, _DIMENSION), [{}])
+        self.index_store.save(vdb)
+        with patch("repository.index_store.LexicalIndex.add") as add:
+            loaded = IndexStore(self.tmp_dir.name).load_lexical(vdb)
+        add.assert_not_called()
+        self.assertEqual(loaded.search("unsaved", 1)[0].tolist(), [10])
+
+    async def test_schedule_save_is_debounced(self):
+        vdb, _ = build_vdb(5)
+        self.index_store.schedule_save(vdb)
+        vdb.add_embeddings([("late text", np.random.rand(_DIMENSION).tolist())])
+        self.index_store.schedule_save(vdb)
+        await asyncio.sleep(0.2)
+
+        snapshots = [p for p in self.index_store.directory.iterdir() if p.name.startswith("snapshot-")]
+        self.assertEqual(len(snapshots), 1)
+        self.assertEqual(IndexStore(self.tmp_dir.name).load(None).index.ntotal, 6)
+
+    async def test_flush_saves_pending_changes(self):
+        vdb, _ = build_vdb(5)
+        self.index_store.debounce = 60
+        self.index_store.schedule_save(vdb)
+        await self.index_store.flush(vdb)
+
+        self.assertEqual(IndexStore(self.tmp_dir.name).load(None).index.ntotal, 5)
+
+    async def test_writers_take_turns_across_processes(self):
+        vdb, _ = build_vdb(5)
+        self.index_store.debounce = 60
+        other = IndexStore(self.tmp_dir.name, lease_poll=0.01)
+        async with self.index_store.writing():
+            self.index_store.schedule_save(vdb)
+        entered = asyncio.Event()
+
+        async def write():
+            async with other.writing():
+                entered.set()
+
+        writer = asyncio.ensure_future(write())
+        await asyncio.sleep(0.1)
+        self.assertFalse(entered.is_set())
+        await self.index_store.flush(vdb)
+        await writer
+
+        self.assertTrue(other.is_stale())
+        self.assertFalse(self.index_store.is_stale())
+
+    async def test_lease_is_released_without_changes(self):
+        other = IndexStore(self.tmp_dir.name)
+
+        async def write(store):
+            async with store.writing():
+                pass
+
+        await write(self.index_store)
+        await asyncio.wait_for(write(other), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
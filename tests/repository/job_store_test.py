@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from repository.job_store import JobStore
+
+
+class TestJobStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "jobs.sqlite3")
+        self.job_store = JobStore(self.path)
+
+    def tearDown(self):
+        self.job_store.close()
+        self.tmp_dir.cleanup()
+
+    def test_create_and_update(self):
+        job = self.job_store.create("doc-1", "file.pdf")
+        self.assertEqual(job["status"], "uploading")
+        self.assertEqual(job["timings"], {})
+
+        self.job_store.update(job["id"], stage="extracting", pages_total=10, timings={"uploading": 0.5})
+
+        job = self.job_store.get(job["id"])
+        self.assertEqual((job["stage"], job["pages_total"]), ("extracting", 10))
+        self.assertEqual(job["timings"], {"uploading": 0.5})
+
+    def test_update_rejects_unknown_fields(self):
+        job = self.job_store.create("doc-1", "file.pdf")
+        with self.assertRaises(ValueError):
+            self.job_store.update(job["id"], doc_id="other")
+
+    def test_claim_only_queued_jobs(self):
+        job = self.job_store.create("doc-1", "file.pdf")
+        self.assertIsNone(self.job_store.claim(job["id"]))
+
+        self.job_store.update(job["id"], status="queued")
+        self.assertEqual(self.job_store.claim(job["id"])["status"], "running")
+        self.assertIsNone(self.job_store.claim(job["id"]))
+
+    def test_count_pending(self):
+        uploading = self.job_store.create("doc-1", "file.pdf")
+        queued = self.job_store.create("doc-2", "file.pdf")
+        self.job_store.update(queued["id"], status="queued")
+        done = self.job_store.create("doc-3", "file.pdf")
+        self.job_store.update(done["id"], status="done")
+
+        self.assertEqual(self.job_store.count_pending(), 2)
+
+    def test_create_is_bounded_by_pending_jobs(self):
+        self.assertIsNotNone(self.job_store.create("doc-1", "file.pdf", max_pending=2))
+        done = self.job_store.create("doc-2", "file.pdf", max_pending=2)
+        self.assertIsNone(self.job_store.create("doc-3", "file.pdf", max_pending=2))
+
+        self.job_store.update(done["id"], status="done")
+        self.assertIsNotNone(self.job_store.create("doc-3", "file.pdf", max_pending=2))
+        self.assertEqual(self.job_store.count_pending(), 2)
+
+    def test_recover_after_restart(self):
+        uploading = self.job_store.create("doc-1", "file.pdf")
+        running = self.job_store.create("doc-2", "file.pdf")
+        self.job_store.update(running["id"], status="queued")
+        self.job_store.claim(running["id"])
+        self.job_store.close()
+
+        self.job_store = JobStore(self.path)
+        self.assertEqual(self.job_store.recover(stale_after=0), [running["id"]])
+        job = self.job_store.get(running["id"])
+        self.assertEqual((job["status"], job["owner"]), ("queued", self.job_store.owner))
+        self.assertEqual(self.job_store.get(uploading["id"])["status"], "failed")
+
+    def test_recover_leaves_jobs_of_live_workers(self):
+        uploading = self.job_store.create("doc-1", "file.pdf")
+        running = self.job_store.create("doc-2", "file.pdf")
+        self.job_store.update(running["id"], status="queued")
+        self.job_store.claim(running["id"])
+        other = JobStore(self.path)
+        self.addCleanup(other.close)
+
+        self.assertEqual(other.recover(stale_after=60), [])
+        self.assertEqual(self.job_store.get(running["id"])["status"], "running")
+        self.assertEqual(self.job_store.get(uploading["id"])["status"], "uploading")
+        # A process never takes over its own jobs, however old their heartbeat.
+        self.assertEqual(self.job_store.recover(stale_after=0), [])
+
+    def test_heartbeat_keeps_jobs_alive(self):
+        job = self.job_store.create("doc-1", "file.pdf")
+        self.job_store.update(job["id"], status="queued")
+        self.job_store.claim(job["id"])
+        other = JobStore(self.path)
+        self.addCleanup(other.close)
+
+        with patch("repository.job_store.time.time", return_value=time.time() + 100):
+            self.assertEqual(self.job_store.heartbeat(), 1)
+        self.assertEqual(other.recover(stale_after=60), [])
+        self.assertEqual(other.recover(stale_after=-200), [job["id"]])
+
+    def test_adds_namespace_to_older_databases(self):
+        path = os.path.join(self.tmp_dir.name, "old.sqlite3")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE jobs (id TEXT PRIMARY KEY, doc_id TEXT NOT NULL, filename TEXT, "
+                     "status TEXT NOT NULL, stage TEXT, pages_done INTEGER NOT NULL DEFAULT 0, pages_total INTEGER, "
+                     "chunks_done INTEGER NOT NULL DEFAULT 0, chunks_total INTEGER, error TEXT, result TEXT, "
+                     "timings TEXT NOT NULL DEFAULT '{}', created_at REAL NOT NULL, started_at REAL, "
+                     "finished_at REAL)")
+        conn.execute("INSERT INTO jobs (id, doc_id, status, created_at) VALUES ('old', 'doc-1', 'done', 0)")
+        conn.commit()
+        conn.close()
+
+        job_store = JobStore(path)
+        self.addCleanup(job_store.close)
+
+        self.assertEqual(job_store.get("old")["namespace"], "")
+        self.assertIsNone(job_store.get("old")["owner"])
+        self.assertEqual(job_store.create("doc-2", "file.pdf", "alice")["namespace"], "alice")
+
+
+if __name__ == "__main__":
+    unittest.main()
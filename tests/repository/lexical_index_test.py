@@ -0,0 +1,85 @@
+import io
+import unittest
+
+import numpy as np
+
+from repository.lexical_index import LexicalIndex, tokenize
+
+
+class TestTokenize(unittest.TestCase):
+    def test_keeps_identifiers_whole_and_split(self):
+        self.assertEqual(tokenize("Order XR-1200/b now."), ["order", "xr-1200/b", "xr", "1200", "b", "now"])
+
+
+class TestLexicalIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = LexicalIndex()
+        self.rows = self.index.add([
+            "The pump model XR-1200 needs a new seal.",
+            "Seals wear out over time in every pump.",
+            "Invoices are sent at the end of the month.",
+            "pump pump pump pump pump pump pump pump pump pump pump pump",
+        ])
+
+    def test_add_assigns_sequential_rows(self):
+        self.assertEqual(list(self.rows), [0, 1, 2, 3])
+        self.assertEqual(list(self.index.add(["another"])), [4])
+        self.assertEqual(len(self.index), 5)
+
+    def test_exact_identifier_ranks_first(self):
+        rows, scores = self.index.search("what about the xr-1200 pump?", k=3)
+
+        self.assertEqual(rows[0], 0)
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(np.all(np.diff(scores) <= 0))
+
+    def test_documents_without_query_terms_are_not_returned(self):
+        rows, _ = self.index.search("invoices", k=10)
+        self.assertEqual(rows.tolist(), [2])
+        rows, _ = self.index.search("unknown words", k=10)
+        self.assertEqual(len(rows), 0)
+
+    def test_term_frequency_saturates(self):
+        rows, scores = self.index.search("pump", k=4)
+
+        self.assertEqual(set(rows.tolist()), {0, 1, 3})
+        # Twelve repetitions in a long document score far less than twelve times one mention.
+        self.assertLess(scores[0], 3 * scores[-1])
+
+    def test_dense_and_sparse_scoring_agree(self):
+        index = LexicalIndex()
+        index.add([f"common word{i % 7}" for i in range(200)])
+
+        dense_rows, dense_scores = index.search("common word3", k=200)
+        sparse_rows, sparse_scores = index.search("word3", k=200)
+
+        self.assertEqual(len(dense_rows), 200)
+        self.assertEqual(set(sparse_rows.tolist()), set(range(3, 200, 7)))
+        np.testing.assert_allclose(np.sort(dense_scores[:len(sparse_rows)] - dense_scores[-1]),
+                                   np.sort(sparse_scores), rtol=1e-5)
+
+    def test_removed_documents_are_not_returned(self):
+        self.assertEqual(self.index.remove([0, 0, 9]), 1)
+
+        rows, _ = self.index.search("pump seal", k=4)
+
+        self.assertEqual(set(rows.tolist()), {1, 3})
+        self.assertEqual((len(self.index), self.index.size), (3, 4))
+        self.assertEqual(list(self.index.add(["new pump"])), [4])
+
+    def test_dump_and_load(self):
+        self.index.remove([2])
+        buffer = io.BytesIO()
+        self.index.dump(buffer)
+        buffer.seek(0)
+
+        loaded = LexicalIndex.load(buffer)
+
+        self.assertEqual(len(loaded), 3)
+        for query in ["xr-1200", "pump seal", "month"]:
+            np.testing.assert_array_equal(loaded.search(query, 4)[0], self.index.search(query, 4)[0])
+        self.assertEqual(list(loaded.add(["more text"])), [4])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from repository.response_cache import ResponseCache, context_fingerprint
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(3, threshold=0.95, max_entries=2, ttl=60)
+
+    def test_hit_on_similar_question_with_same_fingerprint(self):
+        self.cache.put(np.array([1.0, 0.0, 0.0]), "context", "answer", latency=2.0)
+
+        self.assertEqual(self.cache.lookup(np.array([0.99, 0.05, 0.0]), "context"), "answer")
+        self.assertEqual(self.cache.stats()["latency_saved_seconds"], 2.0)
+
+    def test_miss_on_dissimilar_question(self):
+        self.cache.put(np.array([1.0, 0.0, 0.0]), "context", "answer", latency=2.0)
+
+        self.assertIsNone(self.cache.lookup(np.array([0.5, 0.5, 0.0]), "context"))
+
+    def test_miss_on_different_fingerprint(self):
+        self.cache.put(np.array([1.0, 0.0, 0.0]), "context", "answer", latency=2.0)
+
+        self.assertIsNone(self.cache.lookup(np.array([1.0, 0.0, 0.0]), "other context"))
+
+    def test_expired_entries_are_dropped(self):
+        with patch("repository.response_cache.time.time", return_value=1000):
+            self.cache.put(np.array([1.0, 0.0, 0.0]), "context", "answer", latency=2.0)
+        with patch("repository.response_cache.time.time", return_value=1061):
+            self.assertIsNone(self.cache.lookup(np.array([1.0, 0.0, 0.0]), "context"))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.put(np.array([1.0, 0.0, 0.0]), "context", "first", latency=1.0)
+        self.cache.put(np.array([0.0, 1.0, 0.0]), "context", "second", latency=1.0)
+        self.cache.lookup(np.array([1.0, 0.0, 0.0]), "context")
+        self.cache.put(np.array([0.0, 0.0, 1.0]), "context", "third", latency=1.0)
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.lookup(np.array([0.0, 1.0, 0.0]), "context"))
+        self.assertEqual(self.cache.lookup(np.array([1.0, 0.0, 0.0]), "context"), "first")
+
+    def test_invalidate(self):
+        self.cache.put(np.array([1.0, 0.0, 0.0]), "context", "answer", latency=2.0)
+
+        self.cache.invalidate()
+
+        self.assertIsNone(self.cache.lookup(np.array([1.0, 0.0, 0.0]), "context"))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_miss_in_other_namespace(self):
+        self.cache.put(np.array([1.0, 0.0, 0.0]), "context", "answer", latency=2.0, namespace="alice")
+
+        self.assertIsNone(self.cache.lookup(np.array([1.0, 0.0, 0.0]), "context", namespace="bob"))
+        self.assertEqual(self.cache.lookup(np.array([1.0, 0.0, 0.0]), "context", namespace="alice"), "answer")
+
+    def test_invalidate_namespace(self):
+        self.cache.put(np.array([1.0, 0.0, 0.0]), "context", "alice's answer", latency=2.0, namespace="alice")
+        self.cache.put(np.array([1.0, 0.0, 0.0]), "context", "bob's answer", latency=2.0, namespace="bob")
+
+        self.cache.invalidate("alice")
+
+        self.assertIsNone(self.cache.lookup(np.array([1.0, 0.0, 0.0]), "context", namespace="alice"))
+        self.assertEqual(self.cache.lookup(np.array([1.0, 0.0, 0.0]), "context", namespace="bob"), "bob's answer")
+        self.assertEqual(len(self.cache), 1)
+
+    def test_stats(self):
+        self.cache.put(np.array([1.0, 0.0, 0.0]), "context", "answer", latency=2.0)
+        self.cache.lookup(np.array([1.0, 0.0, 0.0]), "context")
+        self.cache.lookup(np.array([0.0, 1.0, 0.0]), "context")
+
+        self.assertEqual(self.cache.stats(), {"entries": 1, "hits": 1, "misses": 1, "hit_rate": 0.5,
+                                              "latency_saved_seconds": 2.0})
+
+    def test_context_fingerprint(self):
+        history = [{"role": "user", "content": "hi"}]
+
+        self.assertEqual(context_fingerprint(["a", "b"], history), context_fingerprint(["a", "b"], list(history)))
+        self.assertNotEqual(context_fingerprint(["a", "b"], history), context_fingerprint(["b", "a"], history))
+        self.assertNotEqual(context_fingerprint(["a"], history), context_fingerprint(["a"], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
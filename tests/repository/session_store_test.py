@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from repository.session_store import Session, SessionStore
+
+
+def message(content, role="user"):
+    return {"role": role, "content": content}
+
+
+class TestSessionStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.spill_path = os.path.join(self.tmp_dir.name, "sessions.sqlite3")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_unknown_session_is_empty(self):
+        session = SessionStore().get("alice", "default")
+
+        self.assertEqual(session.key, ("alice", "default"))
+        self.assertEqual(session.messages, [])
+
+    def test_sessions_are_keyed_by_user_and_conversation(self):
+        store = SessionStore()
+        store.save(Session("alice", "a", [message("alice a")]))
+        store.save(Session("alice", "b", [message("alice b")]))
+        store.save(Session("bob", "a", [message("bob a")]))
+
+        self.assertEqual(store.get("alice", "a").messages, [message("alice a")])
+        self.assertEqual(store.get("alice", "b").messages, [message("alice b")])
+        self.assertEqual(store.get("bob", "a").messages, [message("bob a")])
+
+    def test_get_returns_a_copy(self):
+        store = SessionStore()
+        store.save(Session("alice", "default", [message("hi")]))
+
+        store.get("alice", "default").messages.append(message("not saved"))
+
+        self.assertEqual(store.get("alice", "default").messages, [message("hi")])
+
+    def test_save_bounds_messages_and_characters(self):
+        store = SessionStore(max_messages=3, max_chars=10)
+        session = Session("alice", "default", [message("a" * 4), message("b" * 4), message("c" * 4), message("d" * 4)])
+
+        store.save(session)
+
+        self.assertEqual(store.get("alice", "default").messages, [message("c" * 4), message("d" * 4)])
+
+    def test_trim_drops_whole_exchanges(self):
+        store = SessionStore(max_messages=2)
+        history = [message("q1"), message("a1", "assistant"), message("q2")]
+
+        self.assertEqual(store.trim(history), [message("q2")])
+        self.assertEqual(SessionStore(max_messages=4).trim(history), history)
+        self.assertEqual(SessionStore(max_messages=4).trim(history + [message("a2", "assistant"), message("q3")]),
+                         [message("q2"), message("a2", "assistant"), message("q3")])
+
+    def test_expired_sessions_are_discarded(self):
+        store = SessionStore(ttl=60)
+        with patch("repository.session_store.time.time", return_value=1000):
+            store.save(Session("alice", "default", [message("hi")]))
+        with patch("repository.session_store.time.time", return_value=1061):
+            self.assertEqual(store.get("alice", "default").messages, [])
+        self.assertEqual(len(store), 0)
+
+    def test_least_recently_used_session_is_evicted(self):
+        store = SessionStore(max_sessions=2)
+        store.save(Session("alice", "default", [message("alice")]))
+        store.save(Session("bob", "default", [message("bob")]))
+        store.get("alice", "default")
+        store.save(Session("carol", "default", [message("carol")]))
+
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.get("bob", "default").messages, [])
+        self.assertEqual(store.get("alice", "default").messages, [message("alice")])
+
+    def test_evicted_sessions_spill_to_sqlite(self):
+        store = SessionStore(max_sessions=1, spill_path=self.spill_path)
+        store.save(Session("alice", "default", [message("alice")]))
+        store.save(Session("bob", "default", [message("bob")]))
+
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.get("alice", "default").messages, [message("alice")])
+        self.assertEqual(store.get("bob", "default").messages, [message("bob")])
+
+    def test_close_spills_sessions_for_the_next_process(self):
+        store = SessionStore(spill_path=self.spill_path)
+        store.save(Session("alice", "default", [message("alice")]))
+        store.close()
+
+        self.assertEqual(SessionStore(spill_path=self.spill_path).get("alice", "default").messages,
+                         [message("alice")])
+
+
+if __name__ == '__main__':
+    unittest.main()
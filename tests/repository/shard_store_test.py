@@ -0,0 +1,132 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+import faiss
+import numpy as np
+
+from repository.ann_index import add_documents, with_ids
+from repository.shard_store import ShardStore, namespace_directory
+
+_DIMENSION = 8
+# Flat vectors of the test dimension plus the fixed per-chunk overhead.
+_CHUNK_BYTES = 4 * _DIMENSION + 2048
+
+
+class TestShardStore(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def store(self, memory_budget=2 ** 30):
+        return ShardStore(self.tmp_dir.name, None, lambda: with_ids(faiss.IndexFlatL2(_DIMENSION)),
+                          memory_budget=memory_budget, debounce=60)
+
+    @staticmethod
+    async def add_chunks(shard, doc_id, n):
+        texts = [f"{doc_id} text {i}" for i in range(n)]
+        async with shard.writing():
+            ids = shard.lexical_index.add(texts)
+            add_documents(shard.vdb, ids, texts, np.random.rand(n, _DIMENSION), [{"doc_id": doc_id}] * n)
+            shard.vector_ids[doc_id] = list(ids)
+            shard.index_store.schedule_save(shard.vdb)
+
+    def test_namespace_directory(self):
+        self.assertTrue(namespace_directory("alice").startswith("alice-"))
+        self.assertTrue(namespace_directory("../etc").startswith("___etc-"))
+        self.assertNotEqual(namespace_directory("a/b"), namespace_directory("a_b"))
+
+    async def test_namespaces_are_isolated(self):
+        store = self.store()
+        async with store.open("alice") as shard:
+            await self.add_chunks(shard, "doc", 3)
+
+        async with store.open("bob") as shard:
+            self.assertEqual(shard.vdb.index.ntotal, 0)
+            self.assertEqual(len(shard.lexical_index.search("doc", 4)[0]), 0)
+        async with store.open("alice") as shard:
+            self.assertEqual(shard.vdb.index.ntotal, 3)
+        self.assertEqual((store.loads, store.hits), (2, 1))
+
+    async def test_concurrent_first_uses_load_once(self):
+        store = self.store()
+
+        async def use():
+            async with store.open("alice") as shard:
+                return shard
+
+        shards = await asyncio.gather(*(use() for _ in range(5)))
+
+        self.assertEqual(len({id(shard) for shard in shards}), 1)
+        self.assertEqual(store.loads, 1)
+
+    async def test_evicts_least_recently_used_shard_to_disk(self):
+        store = self.store(memory_budget=15 * _CHUNK_BYTES)
+        for namespace in ("alice", "bob"):
+            async with store.open(namespace) as shard:
+                await self.add_chunks(shard, "doc", 10)
+
+        self.assertEqual(store.stats()["resident"], 1)
+        self.assertEqual(store.evictions, 1)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir.name, namespace_directory("alice"), "CURRENT")))
+
+        async with store.open("alice") as shard:
+            self.assertEqual(shard.vdb.index.ntotal, 10)
+            self.assertEqual(shard.vector_ids, {"doc": list(range(10))})
+            self.assertEqual(shard.lexical_index.search("text", 20)[0].tolist(), list(range(10)))
+        self.assertEqual(store.loads, 3)
+        await store.flush()
+
+    async def test_shards_in_use_are_not_evicted(self):
+        store = self.store(memory_budget=15 * _CHUNK_BYTES)
+        async with store.open("alice") as alice:
+            await self.add_chunks(alice, "doc", 10)
+            async with store.open("bob") as bob:
+                await self.add_chunks(bob, "doc", 10)
+            self.assertEqual(store.stats()["resident"], 2)
+
+        # Once released, alice is the most recently used shard and bob is evicted instead.
+        self.assertEqual(list(store._shards), ["alice"])
+        await store.flush()
+
+    async def test_preload_keeps_the_likeliest_shards(self):
+        store = self.store()
+        for namespace in ("alice", "bob", "carol"):
+            async with store.open(namespace) as shard:
+                await self.add_chunks(shard, "doc", 10)
+        await store.flush()
+
+        store = self.store(memory_budget=25 * _CHUNK_BYTES)
+        self.assertEqual(await store.preload(["carol", "alice", "bob"]), 2)
+
+        self.assertEqual(list(store._shards), ["alice", "carol"])
+        self.assertEqual(store.stats()["vectors"], 20)
+
+    async def test_processes_sharing_the_directory_see_and_keep_each_others_writes(self):
+        first, second = self.store(), self.store()
+        async with first.open("alice") as shard:
+            await self.add_chunks(shard, "one", 3)
+        async with second.open("alice") as shard:
+            # Not saved yet, and the second process waits to write until it is.
+            self.assertEqual(shard.vdb.index.ntotal, 0)
+            write = asyncio.ensure_future(self.add_chunks(shard, "two", 2))
+            await asyncio.sleep(0.1)
+            self.assertFalse(write.done())
+            await first.flush()
+            await write
+            self.assertEqual(shard.vector_ids, {"one": [0, 1, 2], "two": [3, 4]})
+        await second.flush()
+
+        async with first.open("alice") as shard:
+            self.assertEqual(shard.vdb.index.ntotal, 5)
+            self.assertEqual(shard.vector_ids, {"one": [0, 1, 2], "two": [3, 4]})
+            self.assertEqual(shard.lexical_index.search("two", 5)[0].tolist(), [3, 4])
+        async with self.store().open("alice") as shard:
+            self.assertEqual(shard.vdb.index.ntotal, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
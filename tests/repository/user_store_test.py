@@ -0,0 +1,135 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from repository.user_store import InMemoryUserStore, SQLiteUserStore, UserStore
+
+
+class UserStoreTests:
+    def test_users(self):
+        self.assertIsNone(self.store.get_password_hash("alice"))
+        self.assertTrue(self.store.add_user("alice", "hash1"))
+        self.assertFalse(self.store.add_user("alice", "hash2"))
+        self.assertEqual(self.store.get_password_hash("alice"), "hash1")
+
+        self.assertFalse(self.store.set_password_hash("alice", "hash3", expected="hash2"))
+        self.assertTrue(self.store.set_password_hash("alice", "hash3", expected="hash1"))
+        self.assertTrue(self.store.set_password_hash("bob", "hash4"))
+        self.assertEqual((self.store.get_password_hash("alice"), self.store.get_password_hash("bob")),
+                         ("hash3", "hash4"))
+
+    def test_sessions(self):
+        self.store.add_session("old", "alice", 100.0)
+        self.store.add_session("new", "alice", 200.0)
+        self.store.touch_session("old", 300.0)
+        self.store.touch_session("unknown", 300.0)
+
+        self.assertEqual(self.store.get_session("old"), 300.0)
+        self.assertIsNone(self.store.get_session("unknown"))
+        self.assertEqual(self.store.session_count(), 2)
+        self.assertEqual(self.store.sweep_sessions(250.0), 1)
+        self.assertIsNone(self.store.get_session("new"))
+
+        self.store.delete_session("old")
+        self.store.delete_session("unknown")
+        self.assertIsNone(self.store.get_session("old"))
+        self.assertEqual(self.store.session_count(), 0)
+
+    def test_recent_users(self):
+        self.store.add_session("alice1", "alice", 100.0)
+        self.store.add_session("bob", "bob", 200.0)
+        self.store.add_session("carol", "carol", 300.0)
+        self.store.add_session("alice2", "alice", 150.0)
+        self.store.touch_session("alice1", 400.0)
+
+        self.assertEqual(self.store.recent_users(2), ["alice", "carol"])
+        self.assertEqual(self.store.recent_users(10), ["alice", "carol", "bob"])
+
+
+class TestUserStore(unittest.TestCase):
+    def test_stores_must_implement_every_method(self):
+        class IncompleteUserStore(UserStore):
+            def get_password_hash(self, username):
+                return None
+
+        with self.assertRaises(TypeError):
+            IncompleteUserStore()
+
+
+class TestInMemoryUserStore(UserStoreTests, unittest.TestCase):
+    def setUp(self):
+        self.store = InMemoryUserStore()
+
+
+class TestSQLiteUserStore(UserStoreTests, unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "users.sqlite3")
+        self.store = SQLiteUserStore(self.path, pool_size=2, cache_ttl=60)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+    def test_survives_restart(self):
+        self.store.add_user("alice", "hash")
+        self.store.add_session("token", "alice", 100.0)
+        self.store.close()
+
+        self.store = SQLiteUserStore(self.path)
+
+        self.assertEqual(self.store.get_password_hash("alice"), "hash")
+        self.assertEqual(self.store.get_session("token"), 100.0)
+
+    def test_shared_between_processes(self):
+        other = SQLiteUserStore(self.path, cache_ttl=60)
+        self.addCleanup(other.close)
+        self.store.add_session("token", "alice", 100.0)
+        self.assertEqual(other.get_session("token"), 100.0)
+
+        self.store.touch_session("token", 200.0)
+        self.store.delete_session("token")
+
+        # Served from the cache until it expires, unless fresh.
+        self.assertEqual(other.get_session("token"), 100.0)
+        self.assertIsNone(other.get_session("token", fresh=True))
+        self.assertIsNone(other.cached_session("token"))
+        self.store.add_session("token", "alice", 300.0)
+        with patch("repository.user_store.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertEqual(other.get_session("token"), 300.0)
+
+    def test_cache_is_bounded(self):
+        self.store.cache_size = 2
+        for i in range(3):
+            self.store.add_session(f"token{i}", "alice", float(i))
+
+        self.assertEqual(list(self.store._cache), ["token1", "token2"])
+        self.assertEqual(self.store.get_session("token0"), 0.0)
+
+    def test_pool_is_bounded(self):
+        errors = []
+
+        def work(i):
+            try:
+                for j in range(50):
+                    self.store.add_session(f"token{i}-{j}", "alice", float(j))
+                    self.store.get_session(f"token{i}-{j}", fresh=True)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.store.session_count(), 400)
+        self.assertLessEqual(len(self.store._connections), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
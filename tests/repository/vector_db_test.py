@@ -0,0 +1,59 @@
+import unittest
+
+import numpy as np
+
+from repository.vector_db import VectorDB
+
+
+def normalized(rows):
+    rows = np.asarray(rows, dtype="float32")
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+class TestVectorDB(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.vdb = VectorDB(dimension=4)
+        self.vectors = np.eye(4, dtype="float32")
+        self.vdb.add_batch(self.vectors, payloads=["a", "b", "c", "d"])
+
+    def test_add_batch_assigns_sequential_ids(self):
+        ids = self.vdb.add_batch(normalized([[1, 1, 0, 0]]), payloads=[{"text": "e"}])
+        self.assertEqual(ids.tolist(), [4])
+        self.assertEqual(len(self.vdb), 5)
+        result = self.vdb.search_batch(normalized([[1, 1, 0, 0]]), k=1)
+        self.assertEqual(result.payloads[0, 0], {"text": "e"})
+
+    def test_add_batch_rejects_mismatched_payloads(self):
+        with self.assertRaises(ValueError):
+            self.vdb.add_batch(self.vectors, payloads=["a"])
+
+    def test_add_batch_grows_payload_store(self):
+        vdb = VectorDB(dimension=4)
+        vectors = normalized(np.random.default_rng(0).random((3000, 4)))
+        vdb.add_batch(vectors, payloads=[str(i) for i in range(3000)])
+        result = vdb.search_batch(vectors[[0, 2999]], k=1)
+        self.assertEqual(result.ids[:, 0].tolist(), [0, 2999])
+        self.assertEqual(result.payloads[:, 0].tolist(), ["0", "2999"])
+
+    def test_search_batch_returns_ranked_scores_per_query(self):
+        queries = normalized([[1, 0.5, 0, 0], [0, 0, 0.2, 1]])
+        result = self.vdb.search_batch(queries, k=2)
+        self.assertEqual(result.ids.tolist(), [[0, 1], [3, 2]])
+        self.assertEqual(result.payloads.tolist(), [["a", "b"], ["d", "c"]])
+        expected = np.take_along_axis(queries @ self.vectors.T, result.ids, axis=1)
+        np.testing.assert_allclose(result.scores, expected, atol=1e-6)
+
+    def test_search_batch_pads_missing_results(self):
+        result = self.vdb.search_batch(self.vectors[:1], k=6)
+        self.assertEqual(result.ids[0, 4:].tolist(), [-1, -1])
+        self.assertEqual(result.payloads[0, 4:].tolist(), [None, None])
+        self.assertTrue(np.isneginf(result.scores[0, 4:]).all())
+
+    async def test_get_similar_data_uses_rank_positions(self):
+        matches = await self.vdb.get_similar_data(normalized([[0, 0, 1, 0.5]])[0], threshold=0.2, k=4)
+        self.assertEqual([(i, payload) for i, _, payload in matches], [(2, "c"), (3, "d")])
+        self.assertAlmostEqual(matches[0][1], 1 / np.sqrt(1.25), places=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import json
+import unittest
+from unittest.mock import MagicMock
+
+import httpx
+from fastapi import FastAPI
+
+from router.conversation import conversation_router, current_user
+
+
+def parse_events(body):
+    events = []
+    for message in body.split("\n\n"):
+        if not message:
+            continue
+        fields = dict(line.split(": ", 1) for line in message.split("\n"))
+        events.append((fields.get("event", "message"), fields["data"]))
+    return events
+
+
+class TestChatStream(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        app = FastAPI()
+        app.include_router(conversation_router)
+        app.dependency_overrides[current_user] = lambda: "alice"
+        self.container = MagicMock()
+        app.state.container = self.container
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+
+    def stream(self, *events, error=None):
+        async def chat_stream(session, query, nprobe=None, ef_search=None):
+            for event in events:
+                yield event
+            if error is not None:
+                raise error
+
+        self.container.conversation_service.chat_stream = MagicMock(side_effect=chat_stream)
+
+    async def test_streams_tokens_then_metrics_then_done(self):
+        self.stream({"token": "Hel"}, {"token": "lo"}, {"metrics": {"total_time_ms": 1.5}})
+
+        response = await self.client.post("/chat/stream?conversation_id=one", json="hi")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        self.assertEqual(parse_events(response.text), [
+            ("message", json.dumps({"token": "Hel"})),
+            ("message", json.dumps({"token": "lo"})),
+            ("metrics", json.dumps({"total_time_ms": 1.5})),
+            ("message", "[DONE]"),
+        ])
+        self.container.session_store.get.assert_called_once_with("alice", "one")
+        session = self.container.session_store.get.return_value
+        self.container.conversation_service.chat_stream.assert_called_once_with(session, "hi", None, None)
+
+    async def test_failure_mid_stream_ends_with_error_event(self):
+        self.stream({"token": "Hel"}, error=RuntimeError("connection reset"))
+
+        response = await self.client.post("/chat/stream", json="hi")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(parse_events(response.text), [
+            ("message", json.dumps({"token": "Hel"})),
+            ("error", json.dumps({"detail": "Failed to generate the response"})),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
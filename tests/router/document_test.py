@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import httpx
+from fastapi import FastAPI
+
+from repository.document_catalog import DocumentCatalog
+from router.document import current_user, document_router
+from service.document_service import DocumentService
+
+PAGES = ["première page\n", "second page\n", "third page\n"]
+
+
+class TestGetDocument(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        patcher = patch("service.document_service.UPLOAD_DIR", self.tmp_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        catalog = DocumentCatalog(os.path.join(self.tmp_dir.name, "documents.sqlite3"))
+        self.addCleanup(catalog.close)
+        self.document_service = DocumentService(MagicMock(), MagicMock(), MagicMock(), catalog)
+
+        catalog.add("doc", "alice", "file.pdf", 0)
+        catalog.add("other", "bob", "other.pdf", 0)
+        self.text = "".join(PAGES).encode("utf-8")
+        for doc_id in ("doc", "other"):
+            with open(self.document_service.text_path(doc_id), "wb") as f:
+                f.write(self.text)
+            offsets = [0]
+            for page in PAGES:
+                offsets.append(offsets[-1] + len(page.encode("utf-8")))
+            self.document_service._write_page_offsets(doc_id, offsets)
+
+        app = FastAPI()
+        app.include_router(document_router)
+        app.dependency_overrides[current_user] = lambda: "alice"
+        app.state.container = MagicMock(document_service=self.document_service)
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+        self.tmp_dir.cleanup()
+
+    async def test_get_document(self):
+        response = await self.client.get("/get-document/doc")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.text)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        self.assertIn("etag", response.headers)
+        self.assertIn("last-modified", response.headers)
+
+    async def test_range_request(self):
+        response = await self.client.get("/get-document/doc", headers={"Range": "bytes=0-9"})
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, self.text[:10])
+        self.assertEqual(response.headers["content-range"], f"bytes 0-9/{len(self.text)}")
+
+    async def test_not_modified(self):
+        for path in ("/get-document/doc", "/get-document/doc/pages/2"):
+            with self.subTest(path=path):
+                first = await self.client.get(path)
+
+                by_etag = await self.client.get(path, headers={"If-None-Match": first.headers["etag"]})
+                by_date = await self.client.get(path, headers={"If-Modified-Since": first.headers["last-modified"]})
+                changed = await self.client.get(path, headers={"If-None-Match": '"stale"'})
+
+                self.assertEqual((by_etag.status_code, by_etag.content), (304, b""))
+                self.assertEqual((by_date.status_code, by_date.content), (304, b""))
+                self.assertEqual(changed.status_code, 200)
+
+    async def test_get_page(self):
+        response = await self.client.get("/get-document/doc/pages/1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.decode("utf-8"), PAGES[0])
+        self.assertEqual(response.headers["content-length"], str(len(PAGES[0].encode("utf-8"))))
+
+    async def test_not_found(self):
+        for path in ("/get-document/other", "/get-document/other/pages/1", "/get-document/missing",
+                     "/get-document/doc/pages/0", "/get-document/doc/pages/4"):
+            with self.subTest(path=path):
+                self.assertEqual((await self.client.get(path)).status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+
+from service.chunker import TextChunker
+from tests.fake_encoding import FakeEncoding
+
+
+def sentences(prefix, count):
+    return " ".join(f"{prefix} sentence {i} ends here." for i in range(count))
+
+
+class TestTextChunker(unittest.TestCase):
+    def setUp(self):
+        self.encoding = FakeEncoding()
+        self.chunker = TextChunker(chunk_size=40, chunk_overlap=10, encoding=self.encoding)
+
+    def chunk(self, pages):
+        return list(self.chunker.split_pages(pages, "doc"))
+
+    def test_chunks_stay_within_token_budget(self):
+        chunks = self.chunk([sentences("Alpha", 30), sentences("Beta", 30)])
+
+        self.assertGreater(len(chunks), 2)
+        for chunk in chunks:
+            self.assertLessEqual(len(self.encoding.encode(chunk.page_content)), 40)
+
+    def test_chunks_end_at_sentence_boundaries(self):
+        for chunk in self.chunk([sentences("Alpha", 30)]):
+            self.assertTrue(chunk.page_content.endswith("ends here."))
+            self.assertTrue(chunk.page_content.startswith("Alpha sentence"))
+
+    def test_metadata_offsets_point_into_document_text(self):
+        pages = [sentences("Alpha", 12), "\n" + sentences("Beta", 12)]
+        text = "".join(pages)
+
+        chunks = self.chunk(pages)
+
+        for i, chunk in enumerate(chunks):
+            metadata = chunk.metadata
+            self.assertEqual(metadata["doc_id"], "doc")
+            self.assertEqual(metadata["chunk"], i)
+            self.assertEqual(text[metadata["start_index"]:metadata["end_index"]], chunk.page_content)
+        self.assertEqual(chunks[0].metadata["page"], 1)
+        self.assertEqual(chunks[-1].metadata["page"], 2)
+
+    def test_consecutive_chunks_overlap(self):
+        chunks = self.chunk([sentences("Alpha", 30)])
+
+        for previous, chunk in zip(chunks, chunks[1:]):
+            self.assertLess(chunk.metadata["start_index"], previous.metadata["end_index"])
+            self.assertGreater(chunk.metadata["end_index"], previous.metadata["end_index"])
+
+    def test_prefers_paragraph_boundaries(self):
+        first = sentences("Alpha", 3)
+        second = sentences("Beta", 3)
+        chunker = TextChunker(chunk_size=40, chunk_overlap=0, encoding=self.encoding)
+
+        chunks = list(chunker.split_pages([f"{first}\n\n{second}"], "doc"))
+
+        self.assertEqual([chunk.page_content for chunk in chunks], [first, second])
+
+    def test_splits_long_sentences_and_words(self):
+        long_sentence = " ".join(f"word{i}" for i in range(100))
+        chunks = self.chunk([long_sentence + " " + "x" * 10])
+
+        self.assertEqual(" ".join(chunk.page_content.strip() for chunk in chunks).split(), long_sentence.split() + ["x" * 10])
+        for chunk in chunks:
+            self.assertLessEqual(len(self.encoding.encode(chunk.page_content)), 40)
+
+    def test_blank_pages_produce_no_chunks(self):
+        self.assertEqual(self.chunk(["", "  \n\n "]), [])
+
+    def test_rejects_overlap_not_smaller_than_chunk_size(self):
+        with self.assertRaises(ValueError):
+            TextChunker(chunk_size=10, chunk_overlap=10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import asyncio
+import unittest
+
+import faiss
+import numpy as np
+from langchain_community.docstore import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from repository.lexical_index import LexicalIndex
+from service.context_builder import ContextBuilder, maximal_marginal_relevance, reciprocal_rank_fusion
+from tests.fake_encoding import FakeEncoding
+from utils.locks import ReadWriteLock
+
+
+class FakeEmbeddings:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    async def aembed_query(self, text):
+        return self.vectors[text]
+
+
+def build_vdb(chunks, queries):
+    vdb = FAISS(
+        embedding_function=FakeEmbeddings(queries),
+        index=faiss.IndexFlatL2(3),
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+    )
+    if chunks:
+        vdb.add_embeddings([(text, vector) for text, vector in chunks], ids=[text for text, _ in chunks])
+    return vdb
+
+
+class TestContextBuilder(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        chunks = [
+            ("alpha one", [1.0, 0.0, 0.0]),
+            ("alpha two", [0.99, 0.0, 0.1]),
+            ("beta words here", [0.6, 0.8, 0.0]),
+            ("gamma", [0.0, 0.0, 1.0]),
+        ]
+        self.vdb = build_vdb(chunks, {"query": [1.0, 0.3, 0.0], "gamma": [1.0, 0.3, 0.0]})
+        self.lexical_index = LexicalIndex()
+        self.lexical_index.add([text for text, _ in chunks])
+
+    def builder(self, **kwargs):
+        return ContextBuilder(self.vdb, encoding=FakeEncoding(), **kwargs)
+
+    async def test_packs_top_chunks_with_scores(self):
+        context = await self.builder(k=3).build("query")
+
+        self.assertEqual([chunk["id"] for chunk in context["chunks"]], ["alpha one", "alpha two", "beta words here"])
+        self.assertEqual(context["text"], "alpha one\n\nalpha two\n\nbeta words here")
+        self.assertAlmostEqual(context["chunks"][0]["score"], 0.958, places=3)
+        scores = [chunk["score"] for chunk in context["chunks"]]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    async def test_respects_token_budget(self):
+        # "alpha one" and "alpha two" are three tokens each, plus one for the separator.
+        context = await self.builder(k=3, token_budget=7).build("query")
+
+        self.assertEqual([chunk["id"] for chunk in context["chunks"]], ["alpha one", "alpha two"])
+        self.assertEqual(context["tokens"], 7)
+
+    async def test_skips_chunks_that_do_not_fit(self):
+        context = await self.builder(k=4, token_budget=4).build("query")
+
+        self.assertEqual([chunk["id"] for chunk in context["chunks"]], ["alpha one"])
+
+    async def test_mmr_avoids_near_duplicates(self):
+        context = await self.builder(k=2, fetch_k=4, mmr=True, mmr_lambda=0.5).build("query")
+
+        self.assertEqual([chunk["id"] for chunk in context["chunks"]], ["alpha one", "beta words here"])
+
+    async def test_hybrid_finds_exact_terms_missed_by_dense_search(self):
+        dense = await self.builder(k=2).build("gamma")
+        hybrid = await self.builder(k=2, fetch_k=2, lexical_index=self.lexical_index).build("gamma")
+
+        self.assertNotIn("gamma", [chunk["id"] for chunk in dense["chunks"]])
+        self.assertEqual([chunk["id"] for chunk in hybrid["chunks"]], ["alpha one", "gamma"])
+        self.assertAlmostEqual(hybrid["chunks"][1]["score"], 0.0, places=4)
+
+    async def test_hybrid_with_mmr(self):
+        context = await self.builder(k=2, fetch_k=4, mmr=True, lexical_index=self.lexical_index).build("gamma")
+
+        self.assertEqual({chunk["id"] for chunk in context["chunks"]}, {"alpha one", "gamma"})
+
+    async def test_waits_for_writers(self):
+        lock = ReadWriteLock()
+        builder = self.builder(k=2, fetch_k=2).bind(self.vdb, self.lexical_index, lock=lock)
+
+        async with lock.write():
+            build = asyncio.ensure_future(builder.build("gamma"))
+            await asyncio.sleep(0.01)
+            self.assertFalse(build.done())
+
+        self.assertEqual([chunk["id"] for chunk in (await build)["chunks"]], ["alpha one", "gamma"])
+
+    async def test_empty_store(self):
+        vdb = build_vdb([], {"query": [1.0, 0.0, 0.0]})
+
+        context = await ContextBuilder(vdb, encoding=FakeEncoding()).build("query")
+
+        self.assertEqual((context["text"], context["tokens"], context["chunks"]), ("", 0, []))
+
+
+class TestReciprocalRankFusion(unittest.TestCase):
+    def test_items_in_both_rankings_rise(self):
+        fused = reciprocal_rank_fusion([["a", "b", "c", "d"], ["c", "d"]], k=1)
+
+        self.assertEqual([item for item, _ in fused], ["c", "d", "a", "b"])
+        self.assertAlmostEqual(fused[0][1], 1 / 4 + 1 / 2)
+        self.assertAlmostEqual(fused[1][1], 1 / 5 + 1 / 3)
+
+
+class TestMaximalMarginalRelevance(unittest.TestCase):
+    def test_pure_relevance_keeps_similarity_order(self):
+        vectors = np.array([[0.0, 1.0], [1.0, 0.0], [0.9, 0.1]])
+
+        self.assertEqual(maximal_marginal_relevance(np.array([1.0, 0.0]), vectors, 3, lambda_mult=1.0), [1, 2, 0])
+
+    def test_selects_at_most_the_candidates(self):
+        vectors = np.array([[1.0, 0.0]])
+
+        self.assertEqual(maximal_marginal_relevance(np.array([1.0, 0.0]), vectors, 5), [0])
+        self.assertEqual(maximal_marginal_relevance(np.array([1.0, 0.0]), np.empty((0, 2)), 5), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
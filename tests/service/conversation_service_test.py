@@ -1,74 +1,186 @@
+import tempfile
 import unittest
-from unittest.mock import MagicMock, patch
 
+import faiss
+import numpy as np
+from unittest.mock import patch
+
+from client.openai_client import OpenAIClient
+from config import API_KEY, INDEX_EF_SEARCH, INDEX_NPROBE
+from repository.ann_index import with_ids
+from repository.response_cache import ResponseCache, context_fingerprint
+from repository.session_store import Session, SessionStore
+from repository.shard_store import ShardStore
 from service.conversation_service import ConversationService
 import client
 import utils
 
-class TestConversationService(unittest.TestCase):
-    def setUp(self):
-        self.conversation_service = ConversationService()
+PROMPT = {"role": "user", "content": "test prompt"}
+RESPONSE = {"role": "assistant", "content": "test response"}
+EMPTY_CONTEXT = {"text": "", "tokens": 0, "chunks": [], "query_vector": np.ones(4)}
+
 
+class TestConversationService(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.session_store = SessionStore(max_messages=4)
+        self.response_cache = ResponseCache(4)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        shards = ShardStore(self.tmp_dir.name, None, lambda: with_ids(faiss.IndexFlatL2(4)),
+                            memory_budget=2 ** 30)
+        self.conversation_service = ConversationService(self.session_store, self.response_cache, shards,
+                                                        OpenAIClient(API_KEY))
+        self.session = Session("alice", "default")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @patch('service.context_builder.ContextBuilder.build')
     @patch('client.openai_client.OpenAIClient.get_prompt')
     @patch('client.openai_client.OpenAIClient.get_chat_response')
-    @patch('utils.logger.logger.info')
-    def test_chat_with_context(self, mock_logger_info, mock_get_chat_response, mock_get_prompt):
+    @patch('utils.logger.logger.debug')
+    async def test_chat_with_context(self, mock_logger_debug, mock_get_chat_response, mock_get_prompt,
+                                     mock_build_context):
         query = "test query"
         context = "test context"
-        mock_get_prompt.return_value = "test prompt"
+        mock_get_prompt.return_value = PROMPT
         mock_get_chat_response.return_value = "test response"
-        self.conversation_service.vdb.similarity_search = MagicMock(return_value=[MockDocument(page_content=context)])
+        mock_build_context.return_value = {"text": context, "tokens": 2, "chunks": [{"id": "chunk", "score": 0.9, "tokens": 2}],
+                                           "query_vector": np.ones(4)}
 
-        result = self.conversation_service.chat(query)
+        result = await self.conversation_service.chat(self.session, query)
 
         mock_get_prompt.assert_called_once_with(query)
-        self.assertEqual(self.conversation_service.prompt_list, ["test prompt"])
-        self.conversation_service.vdb.similarity_search.assert_called_once_with(query)
-        mock_logger_info.assert_called_once_with([self.conversation_service.default_message, "test prompt"])
-        mock_get_chat_response.assert_called_once_with([self.conversation_service.default_message, "test prompt"])
+        mock_build_context.assert_awaited_once_with(query, nprobe=INDEX_NPROBE, ef_search=INDEX_EF_SEARCH)
+        expected_messages = [self.conversation_service.default_message,
+                             {"role": "user", "content": context}, PROMPT]
+        mock_logger_debug.assert_called_with("chat messages: %s", expected_messages)
+        mock_get_chat_response.assert_awaited_once_with(expected_messages)
 
         self.assertEqual(result, "test response")
+        self.assertEqual(self.session_store.get("alice", "default").messages, [PROMPT, RESPONSE])
 
+    @patch('service.context_builder.ContextBuilder.build')
     @patch('client.openai_client.OpenAIClient.get_prompt')
     @patch('client.openai_client.OpenAIClient.get_chat_response')
-    @patch('utils.logger.logger.info')
-    def test_chat_without_context(self, mock_logger_info, mock_get_chat_response, mock_get_prompt):
+    @patch('utils.logger.logger.debug')
+    async def test_chat_without_context(self, mock_logger_debug, mock_get_chat_response, mock_get_prompt,
+                                        mock_build_context):
         query = "test query"
-        mock_get_prompt.return_value = "test prompt"
+        mock_get_prompt.return_value = PROMPT
         mock_get_chat_response.return_value = "test response"
-        self.conversation_service.vdb.similarity_search = MagicMock(return_value=[])
+        mock_build_context.return_value = EMPTY_CONTEXT
 
-        result = self.conversation_service.chat(query)
+        result = await self.conversation_service.chat(self.session, query)
 
         mock_get_prompt.assert_called_once_with(query)
-        self.assertEqual(self.conversation_service.prompt_list, ["test prompt"])
-        self.conversation_service.vdb.similarity_search.assert_called_once_with(query)
-        mock_logger_info.assert_called_once_with([self.conversation_service.default_message, "test prompt"])
-        mock_get_chat_response.assert_called_once_with([self.conversation_service.default_message, "test prompt"])
+        mock_build_context.assert_awaited_once_with(query, nprobe=INDEX_NPROBE, ef_search=INDEX_EF_SEARCH)
+        expected_messages = [self.conversation_service.default_message,
+                             {"role": "user", "content": ""}, PROMPT]
+        mock_logger_debug.assert_called_with("chat messages: %s", expected_messages)
+        mock_get_chat_response.assert_awaited_once_with(expected_messages)
 
         self.assertEqual(result, "test response")
+        self.assertEqual(self.session_store.get("alice", "default").messages, [PROMPT, RESPONSE])
 
     @patch('client.openai_client.OpenAIClient.get_prompt')
     @patch('client.openai_client.OpenAIClient.get_chat_response')
-    @patch('utils.logger.logger.info')
-    def test_new_chat(self, mock_logger_info, mock_get_chat_response, mock_get_prompt):
+    @patch('utils.logger.logger.debug')
+    async def test_new_chat(self, mock_logger_debug, mock_get_chat_response, mock_get_prompt):
         query = "test query"
-        mock_get_prompt.return_value = "test prompt"
+        mock_get_prompt.return_value = PROMPT
         mock_get_chat_response.return_value = "test response"
 
-        result = self.conversation_service.new_chat(query)
+        result = await self.conversation_service.new_chat(self.session, query)
 
         mock_get_prompt.assert_called_once_with(query)
-        self.assertEqual(self.conversation_service.prompt_list, ["test prompt"])
-        mock_logger_info.assert_called_once_with([self.conversation_service.default_message, "test prompt"])
-        mock_get_chat_response.assert_called_once_with([self.conversation_service.default_message, "test prompt"])
+        mock_logger_debug.assert_called_once_with("chat messages: %s",
+                                                  [self.conversation_service.default_message, PROMPT])
+        mock_get_chat_response.assert_awaited_once_with([self.conversation_service.default_message, PROMPT])
 
         self.assertEqual(result, "test response")
+        self.assertEqual(self.session_store.get("alice", "default").messages, [PROMPT, RESPONSE])
+
+    @patch('service.context_builder.ContextBuilder.build', return_value=EMPTY_CONTEXT)
+    @patch('utils.logger.logger.info')
+    async def test_chat_stream(self, mock_logger_info, mock_build_context):
+        async def fake_stream(messages):
+            for token in ["Hello", ", ", "world"]:
+                yield token
+
+        mock_build_context.return_value = EMPTY_CONTEXT
+        self.conversation_service.open_ai_client.stream_chat_response = fake_stream
+
+        events = [event async for event in self.conversation_service.chat_stream(self.session, "test query")]
+
+        self.assertEqual(events[:-1], [{"token": "Hello"}, {"token": ", "}, {"token": "world"}])
+        metrics = events[-1]["metrics"]
+        self.assertEqual(metrics["completion_tokens"], 3)
+        self.assertIsNotNone(metrics["time_to_first_token_ms"])
+        self.assertEqual((metrics["context_tokens"], metrics["context_chunks"]), (0, []))
+        self.assertFalse(metrics["cached"])
+        self.assertEqual(self.session_store.get("alice", "default").messages[-1],
+                         {"role": "assistant", "content": "Hello, world"})
+
+    @patch('service.context_builder.ContextBuilder.build', return_value=EMPTY_CONTEXT)
+    @patch('client.openai_client.OpenAIClient.get_chat_response')
+    @patch('utils.logger.logger.info')
+    async def test_sessions_are_isolated(self, mock_logger_info, mock_get_chat_response, mock_build_context):
+        mock_get_chat_response.side_effect = ["answer for alice", "answer for bob", "second answer for alice"]
+        # Unrelated questions, so that none of them is answered from the response cache.
+        vectors = iter(np.eye(4))
+        mock_build_context.side_effect = lambda query, **kwargs: dict(EMPTY_CONTEXT, query_vector=next(vectors))
+
+        await self.conversation_service.chat(self.session_store.get("alice", "default"), "alice asks")
+        await self.conversation_service.chat(self.session_store.get("bob", "default"), "bob asks")
+        await self.conversation_service.chat(self.session_store.get("alice", "default"), "alice asks again")
+
+        sent = mock_get_chat_response.await_args_list[2].args[0]
+        self.assertEqual(sent[2:], [{"role": "user", "content": "alice asks"},
+                                    {"role": "assistant", "content": "answer for alice"},
+                                    {"role": "user", "content": "alice asks again"}])
+        self.assertEqual(self.session_store.get("bob", "default").messages[-1]["content"], "answer for bob")
+
+    @patch('service.context_builder.ContextBuilder.build', return_value=EMPTY_CONTEXT)
+    @patch('client.openai_client.OpenAIClient.get_chat_response', return_value="test response")
+    @patch('utils.logger.logger.info')
+    async def test_repeated_question_is_answered_from_cache(self, mock_logger_info, mock_get_chat_response,
+                                                           mock_build_context):
+        first = await self.conversation_service.chat(Session("alice", "one"), "test query")
+        second = await self.conversation_service.chat(Session("alice", "two"), "test query")
+
+        self.assertEqual(first, second)
+        mock_get_chat_response.assert_awaited_once()
+        self.assertEqual(self.response_cache.stats()["hits"], 1)
+        self.assertEqual(self.session_store.get("alice", "two").messages[-1], RESPONSE)
+
+    @patch('service.context_builder.ContextBuilder.build', return_value=EMPTY_CONTEXT)
+    @patch('client.openai_client.OpenAIClient.get_chat_response', return_value="test response")
+    @patch('utils.logger.logger.info')
+    async def test_cache_is_keyed_by_user(self, mock_logger_info, mock_get_chat_response, mock_build_context):
+        await self.conversation_service.chat(Session("alice", "one"), "test query")
+        await self.conversation_service.chat(Session("bob", "one"), "test query")
+
+        self.assertEqual(mock_get_chat_response.await_count, 2)
+
+    @patch('service.context_builder.ContextBuilder.build', return_value=EMPTY_CONTEXT)
+    @patch('client.openai_client.OpenAIClient.get_chat_response', return_value="test response")
+    @patch('utils.logger.logger.info')
+    async def test_cache_is_keyed_by_history(self, mock_logger_info, mock_get_chat_response, mock_build_context):
+        await self.conversation_service.chat(Session("alice", "one"), "test query")
+        history = [{"role": "user", "content": "earlier query"}, {"role": "assistant", "content": "earlier"}]
+        await self.conversation_service.chat(Session("bob", "two", history), "test query")
+
+        self.assertEqual(mock_get_chat_response.await_count, 2)
+
+    @patch('service.context_builder.ContextBuilder.build', return_value=EMPTY_CONTEXT)
+    @patch('utils.logger.logger.info')
+    async def test_chat_stream_from_cache(self, mock_logger_info, mock_build_context):
+        self.response_cache.put(np.ones(4), context_fingerprint([], []), "cached answer", 1.5, "alice")
 
+        events = [event async for event in self.conversation_service.chat_stream(self.session, "test query")]
 
-class MockDocument:
-    def __init__(self, page_content):
-        self.page_content = page_content
+        self.assertEqual(events[0], {"token": "cached answer"})
+        self.assertTrue(events[-1]["metrics"]["cached"])
 
 
 if __name__ == '__main__':
@@ -1,46 +1,273 @@
+import asyncio
+import io
+import os
+import tempfile
 import unittest
-from unittest.mock import MagicMock, patch
-from fastapi import UploadFile
+from unittest.mock import AsyncMock, MagicMock, patch
 
+import faiss
+import pymupdf
+from fastapi import HTTPException, UploadFile
+
+from repository.ann_index import with_ids
+from repository.document_catalog import DocumentCatalog
+from repository.shard_store import ShardStore
+from service.chunker import TextChunker
 from service.document_service import DocumentService
+from tests.fake_encoding import FakeEncoding
+
+
+def write_pdf(path, pages):
+    document = pymupdf.open()
+    for text in pages:
+        document.new_page().insert_text((72, 72), text)
+    document.save(path)
+    document.close()
 
 
-class TestDocumentService(unittest.TestCase):
+class TestDocumentService(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
-        self.document_service = DocumentService()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        patcher = patch('service.document_service.UPLOAD_DIR', self.tmp_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.document_service = DocumentService(MagicMock(), MagicMock(), MagicMock(),
+                                                DocumentCatalog(os.path.join(self.data_dir.name, "documents.sqlite3")))
+        self.document_service.chunker = TextChunker(chunk_size=64, chunk_overlap=8, encoding=FakeEncoding())
 
     def tearDown(self):
-        pass
+        self.document_service.catalog.close()
+        self.tmp_dir.cleanup()
+        self.data_dir.cleanup()
+
+    def add_document(self, doc_id, pages, filename=None, owner="alice"):
+        write_pdf(self.document_service.source_path(doc_id), pages)
+        self.document_service.catalog.add(doc_id, owner, filename or f"{doc_id}.pdf", 0)
+
+    async def test_save_upload_streams_to_source_file(self):
+        contents = os.urandom(3 * 1024 * 1024 + 17)
+        file = UploadFile(io.BytesIO(contents), filename="mock_filename.pdf")
+
+        with patch('service.document_service.UPLOAD_CHUNK_SIZE', 1024 * 1024):
+            doc_id = await self.document_service.save_upload(file, namespace="alice")
 
-    @patch('document_service.os')
-    @patch('document_service.PdfReader')
-    @patch('document_service.TextLoader')
-    @patch('document_service.CharacterTextSplitter')
-    def test_file_upload(self, mock_text_splitter, mock_text_loader, mock_pdf_reader, mock_os):
-        mock_os.path.join.return_value = "mock_file_path"
-        mock_text_splitter.return_value.split_documents.return_value = ["mock_document"]
-        mock_pdf_reader.return_value.pages.__getitem__.return_value.extract_text.return_value = "mock_text"
+        with open(self.document_service.source_path(doc_id), "rb") as f:
+            self.assertEqual(f.read(), contents)
+        document = await self.document_service.get_document(doc_id, "alice")
+        self.assertEqual((document["filename"], document["size"], document["status"]),
+                         ("mock_filename.pdf", len(contents), "uploaded"))
+        self.assertEqual(os.listdir(self.tmp_dir.name), [f"{doc_id}.source.pdf"])
 
+    async def test_save_upload_removes_partial_file_on_error(self):
         file = MagicMock(spec=UploadFile)
-        file.filename = "mock_filename"
-        file.file.read.return_value = b"mock_contents"
+        file.read = AsyncMock(side_effect=[b"partial", OSError("connection reset")])
+
+        with self.assertRaises(OSError):
+            await self.document_service.save_upload(file, doc_id="doc")
+
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+        self.assertIsNone(self.document_service.catalog.get("doc"))
+
+    async def test_iter_pages_yields_pages_in_order(self):
+        write_pdf(self.document_service.source_path("doc"), [f"page {i}" for i in range(10)])
+        progress = MagicMock()
+
+        pages = [page async for page in self.document_service.iter_pages("doc", progress=progress,
+                                                                         pages_per_task=3, prefetch=2)]
+
+        self.assertEqual([page.strip() for page in pages], [f"page {i}" for i in range(10)])
+        progress.assert_any_call(pages_total=10, pages_done=0)
+        progress.assert_called_with(pages_done=10)
+
+    def use_vector_store(self):
+        embeddings = MagicMock()
+        embeddings.aembed_documents_with_stats = AsyncMock(
+            side_effect=lambda texts, progress=None: ([[float(len(t))] for t in texts], {"cache_hits": 0}))
+        self.document_service.embeddings = embeddings
+        self.document_service.shards = ShardStore(os.path.join(self.data_dir.name, "shards"), embeddings,
+                                                  lambda: with_ids(faiss.IndexFlatL2(1)), memory_budget=2 ** 30,
+                                                  debounce=60)
+        self.document_service.response_cache = MagicMock()
+
+    async def shard(self, namespace="alice"):
+        async with self.document_service.shards.open(namespace) as shard:
+            return shard
+
+    async def chunks(self, namespace="alice"):
+        vdb = (await self.shard(namespace)).vdb
+        return {vdb.docstore.search(docstore_id).page_content: vector_id
+                for vector_id, docstore_id in vdb.index_to_docstore_id.items()}
+
+    async def test_process_document_for_rag(self):
+        doc_id = "doc"
+        self.add_document(doc_id, ["first page", "second page"], filename="mock_filename.pdf")
+        self.use_vector_store()
+
+        result = await self.document_service.process_document_for_rag(doc_id, "alice")
+
+        self.assertEqual(result, f'Document processed successfully with docId: {doc_id} and filename: mock_filename.pdf')
+        self.assertEqual(await self.chunks(), {"first page\nsecond page": 0})
+        shard = await self.shard()
+        metadata = shard.vdb.docstore.search(shard.vdb.index_to_docstore_id[0]).metadata
+        self.assertEqual(metadata["doc_id"], doc_id)
+        self.assertEqual((metadata["page"], metadata["end_page"]), (1, 2))
+        self.assertEqual(shard.vector_ids, {doc_id: [0]})
+        with open(os.path.join(self.tmp_dir.name, f"{doc_id}.pdf")) as f:
+            self.assertIn("second page", f.read())
+        self.assertEqual(shard.lexical_index.search("second", 1)[0].tolist(), [0])
+        self.assertTrue(shard.index_store.has_pending_save)
+        self.document_service.response_cache.invalidate.assert_called_once_with("alice")
+        self.assertEqual(await self.chunks("bob"), {})
+        document = self.document_service.catalog.get(doc_id)
+        self.assertEqual((document["status"], document["pages"], document["chunks"]), ("indexed", 2, 1))
+        self.assertIsNotNone(document["indexed_at"])
+
+    async def test_get_page_locates_page_text(self):
+        self.use_vector_store()
+        self.add_document("doc", ["première page", "second page", "third page"])
+        await self.document_service.process_document_for_rag("doc", "alice")
+
+        path, stat_result = await self.document_service.get_text("doc", "alice")
+        with open(path, "rb") as f:
+            text = f.read()
+        self.assertEqual(stat_result.st_size, len(text))
+        for page, expected in ((1, "première page"), (2, "second page"), (3, "third page")):
+            _, start, end, _ = await self.document_service.get_page("doc", "alice", page)
+            self.assertEqual(text[start:end].decode("utf-8").strip(), expected)
+        for page in (0, 4):
+            with self.assertRaises(HTTPException) as context:
+                await self.document_service.get_page("doc", "alice", page)
+            self.assertEqual(context.exception.status_code, 404)
+        with self.assertRaises(HTTPException) as context:
+            await self.document_service.get_text("doc", "bob")
+        self.assertEqual(context.exception.status_code, 404)
+
+    async def test_get_text_of_unprocessed_document(self):
+        self.add_document("doc", ["text"])
+
+        with self.assertRaises(HTTPException) as context:
+            await self.document_service.get_text("doc", "alice")
+
+        self.assertEqual(context.exception.status_code, 404)
+
+    async def test_failed_processing_is_recorded(self):
+        self.use_vector_store()
+        self.add_document("doc", ["text"])
+        self.document_service.embeddings.aembed_documents_with_stats.side_effect = RuntimeError("rate limited")
+
+        with self.assertRaises(RuntimeError):
+            await self.document_service.process_document_for_rag("doc", "alice")
+
+        document = self.document_service.catalog.get("doc")
+        self.assertEqual((document["status"], document["error"]), ("failed", "rate limited"))
+
+    async def test_reprocessing_replaces_chunks(self):
+        self.use_vector_store()
+        self.add_document("doc", ["old text"])
+        self.add_document("other", ["other text"])
+        for doc_id in ("doc", "other"):
+            await self.document_service.process_document_for_rag(doc_id, "alice")
+
+        write_pdf(self.document_service.source_path("doc"), ["new text"])
+        await self.document_service.process_document_for_rag("doc", "alice")
+
+        shard = await self.shard()
+        self.assertEqual(await self.chunks(), {"other text": 1, "new text": 2})
+        self.assertEqual(shard.vdb.index.ntotal, 2)
+        self.assertEqual(shard.lexical_index.search("text", 4)[0].tolist(), [1, 2])
+
+    async def test_concurrent_reprocessing_writes_separate_files(self):
+        self.use_vector_store()
+        self.add_document("doc", ["first page", "second page"])
+
+        await asyncio.gather(*(self.document_service.process_document_for_rag("doc", "alice") for _ in range(2)))
+
+        path, _ = await self.document_service.get_text("doc", "alice")
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(f.read().split(), ["first", "page", "second", "page"])
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name)), ["doc.pages", "doc.pdf", "doc.source.pdf"])
+
+    async def test_failed_extraction_removes_partial_text(self):
+        self.add_document("doc", ["text"])
+        self.document_service.chunker = MagicMock()
+        self.document_service.chunker.stream.return_value.add_page.side_effect = RuntimeError("chunking failed")
+
+        with self.assertRaises(RuntimeError):
+            await self.document_service.process_document_for_rag("doc", "alice")
+
+        self.assertEqual(os.listdir(self.tmp_dir.name), ["doc.source.pdf"])
+
+    async def test_delete_document(self):
+        self.use_vector_store()
+        for doc_id in ("doc", "other"):
+            self.add_document(doc_id, [f"{doc_id} text"])
+            await self.document_service.process_document_for_rag(doc_id, "alice")
+
+        result = await self.document_service.delete_document("doc", "alice")
+
+        shard = await self.shard()
+        self.assertEqual(result, {"doc_id": "doc", "chunks_deleted": 1})
+        self.assertEqual(await self.chunks(), {"other text": 1})
+        self.assertEqual(len(shard.vdb.docstore._dict), 1)
+        self.assertEqual(shard.lexical_index.search("text", 4)[0].tolist(), [1])
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name)), ["other.pages", "other.pdf", "other.source.pdf"])
+        self.assertIsNone(self.document_service.catalog.get("doc"))
+
+    async def test_delete_waits_for_searches(self):
+        self.use_vector_store()
+        self.add_document("doc", ["doc text"])
+        await self.document_service.process_document_for_rag("doc", "alice")
+        shard = await self.shard()
+
+        async with shard.index_store.lock.read():
+            delete = asyncio.ensure_future(self.document_service.delete_document("doc", "alice"))
+            await asyncio.sleep(0.01)
+            self.assertFalse(delete.done())
+            self.assertEqual(await self.chunks(), {"doc text": 0})
+
+        self.assertEqual((await delete)["chunks_deleted"], 1)
+        self.assertEqual(await self.chunks(), {})
+
+    async def test_document_deleted_while_processing_is_not_indexed(self):
+        self.use_vector_store()
+        self.add_document("doc", ["doc text"])
+        embed = self.document_service.embeddings.aembed_documents_with_stats.side_effect
+
+        async def embed_while_deleted(texts, progress=None):
+            await self.document_service.delete_document("doc", "alice")
+            return embed(texts, progress)
+
+        self.document_service.embeddings.aembed_documents_with_stats.side_effect = embed_while_deleted
+        with self.assertRaises(HTTPException) as context:
+            await self.document_service.process_document_for_rag("doc", "alice")
 
-        doc_id = self.document_service.file_upload(file)
+        self.assertEqual(context.exception.status_code, 404)
+        self.assertEqual(await self.chunks(), {})
+        self.assertEqual((await self.shard()).vector_ids, {})
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+        self.assertIsNone(self.document_service.catalog.get("doc"))
 
-        self.assertIsInstance(doc_id, str)
-        self.assertGreater(len(doc_id), 0)
+    async def test_delete_unknown_document(self):
+        self.use_vector_store()
 
-    @patch('document_service.faiss')
-    @patch('document_service.TextLoader')
-    @patch('document_service.CharacterTextSplitter')
-    def test_process_document_for_rag(self, mock_text_splitter, mock_text_loader, mock_faiss):
-        mock_text_splitter.return_value.split_documents.return_value = ["mock_document"]
+        with self.assertRaises(HTTPException) as context:
+            await self.document_service.delete_document("missing", "alice")
 
-        doc_id = "temp"
+        self.assertEqual(context.exception.status_code, 404)
 
-        result = self.document_service.process_document_for_rag(doc_id)
+    async def test_documents_of_other_users_are_not_found(self):
+        self.use_vector_store()
+        self.add_document("doc", ["private text"])
+        await self.document_service.process_document_for_rag("doc", "alice")
 
-        self.assertEqual(result, f'Document processed successfully with docId: {doc_id} and filename: {self.document_service.file_to_doc_map[f"{doc_id}.pdf"]}')
+        for call in (lambda: self.document_service.process_document_for_rag("doc", "bob"),
+                     lambda: self.document_service.delete_document("doc", "bob")):
+            with self.assertRaises(HTTPException) as context:
+                await call()
+            self.assertEqual(context.exception.status_code, 404)
+        self.assertEqual((await self.document_service.get_document("doc", "alice"))["status"], "indexed")
+        self.assertEqual(await self.chunks(), {"private text": 0})
 
 
 if __name__ == '__main__':
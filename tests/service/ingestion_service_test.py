@@ -0,0 +1,179 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import ANY, AsyncMock, MagicMock, patch
+
+from fastapi import HTTPException, UploadFile
+
+from repository.job_store import JobStore
+from service.ingestion_service import IngestionService
+
+
+class TestIngestionService(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.job_store = JobStore(os.path.join(self.tmp_dir.name, "jobs.sqlite3"))
+
+        async def process_document_for_rag(doc_id, namespace, executor=None, progress=None, pages_per_task=16):
+            progress(stage="extracting", pages_total=3, pages_done=3)
+            progress(stage="embedding", chunks_total=5, chunks_done=5)
+            return f"processed {doc_id} for {namespace}"
+
+        self.document_service = MagicMock()
+        self.document_service.get_document = AsyncMock(
+            return_value={"doc_id": "doc", "owner": "alice", "filename": "file.pdf"})
+        self.document_service.save_upload = AsyncMock()
+        self.document_service.process_document_for_rag = AsyncMock(side_effect=process_document_for_rag)
+        self.ingestion_service = IngestionService(self.document_service, self.job_store, max_queue_depth=2,
+                                                  process_workers=1)
+
+    async def asyncTearDown(self):
+        await self.ingestion_service.stop()
+        self.job_store.close()
+        self.tmp_dir.cleanup()
+
+    def upload(self):
+        file = MagicMock(spec=UploadFile)
+        file.filename = "file.pdf"
+        return file
+
+    async def wait_for(self, job_id, status):
+        for _ in range(100):
+            job = self.job_store.get(job_id)
+            if job["status"] == status:
+                return job
+            await asyncio.sleep(0.01)
+        self.fail(f"job {job_id} never reached {status}: {job}")
+
+    async def test_submit_and_process(self):
+        job = await self.ingestion_service.submit(self.upload(), "alice")
+        self.assertEqual((job["status"], job["namespace"]), ("queued", "alice"))
+        self.document_service.save_upload.assert_awaited_once()
+
+        self.ingestion_service.start()
+        job = await self.wait_for(job["id"], "done")
+
+        self.assertEqual(job["result"], f"processed {job['doc_id']} for alice")
+        self.assertEqual((job["pages_done"], job["pages_total"]), (3, 3))
+        self.assertEqual((job["chunks_done"], job["chunks_total"]), (5, 5))
+        self.assertEqual(set(job["timings"]), {"extracting", "embedding"})
+        self.document_service.save_upload.assert_awaited_once_with(ANY, doc_id=job["doc_id"], namespace="alice")
+
+    async def test_rejects_submissions_when_queue_is_full(self):
+        await self.ingestion_service.submit(self.upload())
+        await self.ingestion_service.submit(self.upload())
+
+        with self.assertRaises(HTTPException) as context:
+            await self.ingestion_service.submit(self.upload())
+        self.assertEqual(context.exception.status_code, 429)
+
+    async def test_concurrent_submissions_do_not_overshoot_the_queue(self):
+        async def save_upload(*args, **kwargs):
+            await asyncio.sleep(0.01)
+
+        self.document_service.save_upload.side_effect = save_upload
+
+        results = await asyncio.gather(*(self.ingestion_service.submit(self.upload()) for _ in range(4)),
+                                       return_exceptions=True)
+
+        self.assertEqual(sum(isinstance(result, dict) for result in results), 2)
+        self.assertEqual(self.job_store.count_pending(), 2)
+
+    async def test_failed_job_records_error(self):
+        self.document_service.process_document_for_rag.side_effect = RuntimeError("embedding failed")
+        job = await self.ingestion_service.submit(self.upload())
+
+        self.ingestion_service.start()
+        job = await self.wait_for(job["id"], "failed")
+
+        self.assertEqual(job["error"], "embedding failed")
+
+    async def test_progress_updates_are_merged_while_a_write_is_in_flight(self):
+        async def process_document_for_rag(doc_id, namespace, executor=None, progress=None, pages_per_task=16):
+            progress(stage="extracting", pages_total=100, pages_done=0)
+            for pages_done in range(1, 101):
+                progress(pages_done=pages_done)
+            return "processed"
+
+        self.document_service.process_document_for_rag.side_effect = process_document_for_rag
+        job = await self.ingestion_service.submit(self.upload())
+        job = await asyncio.to_thread(self.job_store.claim, job["id"])
+
+        with patch.object(self.job_store, "update", wraps=self.job_store.update) as update:
+            await self.ingestion_service.run_job(job)
+
+        job = self.job_store.get(job["id"])
+        self.assertEqual((job["status"], job["pages_done"], job["result"]), ("done", 100, "processed"))
+        self.assertLess(update.call_count, 10)
+
+    async def test_resumes_jobs_after_restart(self):
+        job = await self.ingestion_service.submit(self.upload())
+        self.job_store.claim(job["id"])
+
+        # A new process over the same database picks the interrupted job up again once its heartbeat is stale.
+        job_store = JobStore(os.path.join(self.tmp_dir.name, "jobs.sqlite3"))
+        self.addCleanup(job_store.close)
+        self.ingestion_service = IngestionService(self.document_service, job_store, process_workers=1, stale_after=0)
+        self.ingestion_service.start()
+        await self.wait_for(job["id"], "done")
+
+    async def test_takes_over_jobs_of_stopped_workers(self):
+        job = await self.ingestion_service.submit(self.upload())
+        self.job_store.claim(job["id"])
+        job_store = JobStore(os.path.join(self.tmp_dir.name, "jobs.sqlite3"))
+        self.addCleanup(job_store.close)
+        other = IngestionService(self.document_service, job_store, process_workers=1, heartbeat_interval=0.01,
+                                 stale_after=0.2)
+        other.start()
+        self.addAsyncCleanup(other.stop)
+
+        # Left alone while the first worker's heartbeat is fresh, then taken over once it is stale.
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.job_store.get(job["id"])["status"], "running")
+        job = await self.wait_for(job["id"], "done")
+        self.assertEqual(job["owner"], job_store.owner)
+
+    async def test_reindex_queues_stored_document(self):
+        source = os.path.join(self.tmp_dir.name, "doc.source.pdf")
+        open(source, "wb").close()
+        self.document_service.source_path.return_value = source
+
+        job = await self.ingestion_service.reindex("doc", "alice")
+        self.assertEqual((job["doc_id"], job["filename"], job["status"]), ("doc", "file.pdf", "queued"))
+
+        self.ingestion_service.start()
+        job = await self.wait_for(job["id"], "done")
+        self.assertEqual(job["result"], "processed doc for alice")
+        self.document_service.save_upload.assert_not_awaited()
+
+    async def test_reindex_document_without_upload(self):
+        self.document_service.source_path.return_value = os.path.join(self.tmp_dir.name, "missing.source.pdf")
+
+        with self.assertRaises(HTTPException) as context:
+            await self.ingestion_service.reindex("missing", "alice")
+        self.assertEqual(context.exception.status_code, 404)
+
+    async def test_reindex_document_of_another_user(self):
+        self.document_service.get_document.side_effect = HTTPException(status_code=404)
+
+        with self.assertRaises(HTTPException) as context:
+            await self.ingestion_service.reindex("doc", "bob")
+        self.assertEqual(context.exception.status_code, 404)
+
+    async def test_get_job_of_another_user(self):
+        job = await self.ingestion_service.submit(self.upload(), "alice")
+
+        self.assertEqual((await self.ingestion_service.get_job(job["id"], "alice"))["id"], job["id"])
+        with self.assertRaises(HTTPException) as context:
+            await self.ingestion_service.get_job(job["id"], "bob")
+        self.assertEqual(context.exception.status_code, 404)
+
+    async def test_get_unknown_job(self):
+        with self.assertRaises(HTTPException) as context:
+            await self.ingestion_service.get_job("missing")
+        self.assertEqual(context.exception.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
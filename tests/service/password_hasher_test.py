@@ -0,0 +1,72 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+
+from fastapi import HTTPException
+
+from service.password_hasher import PasswordHasher
+
+
+class TestPasswordHasher(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.hasher = PasswordHasher(n=2 ** 4, r=1, workers=2)
+
+    def tearDown(self):
+        self.hasher.close()
+
+    async def test_hash_and_verify(self):
+        password_hash = await self.hasher.hash("pässword")
+
+        self.assertTrue(password_hash.startswith("$scrypt$ln=4,r=1,p=1$"))
+        self.assertNotEqual(await self.hasher.hash("pässword"), password_hash)
+        self.assertTrue(await self.hasher.verify("pässword", password_hash))
+        self.assertFalse(await self.hasher.verify("password", password_hash))
+        self.assertFalse(await self.hasher.verify("pässword", None))
+        self.assertFalse(await self.hasher.verify("pässword", password_hash[:-4]))
+        self.assertFalse(await self.hasher.verify("pässword", "$scrypt$malformed"))
+
+    async def test_verifies_other_parameters_and_plain_text(self):
+        old = PasswordHasher(n=2 ** 3, r=2, workers=0)
+        old_hash = await old.hash("password")
+
+        self.assertTrue(await self.hasher.verify("password", old_hash))
+        self.assertTrue(await self.hasher.verify("password", "password"))
+        self.assertFalse(await self.hasher.verify("other", "password"))
+        self.assertTrue(self.hasher.needs_rehash(old_hash))
+        self.assertTrue(self.hasher.needs_rehash("password"))
+        self.assertFalse(self.hasher.needs_rehash(await self.hasher.hash("password")))
+
+    async def test_unknown_user_hash_is_made_in_the_pool(self):
+        self.assertIsNone(self.hasher._dummy_hash)
+        threads = []
+        hash_ = self.hasher._hash
+
+        def record_thread(password):
+            threads.append(threading.current_thread())
+            return hash_(password)
+
+        with patch.object(self.hasher, "_hash", side_effect=record_thread):
+            self.assertFalse(await self.hasher.verify("password", None))
+            self.assertFalse(await self.hasher.verify("password", None))
+
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+        self.assertTrue(self.hasher._dummy_hash.startswith("$scrypt$ln=4,r=1,p=1$"))
+
+    async def test_rejects_beyond_max_pending(self):
+        self.hasher.max_pending = 2
+
+        results = await asyncio.gather(*[self.hasher.hash("password") for _ in range(3)], return_exceptions=True)
+
+        rejected = [result for result in results if isinstance(result, HTTPException)]
+        self.assertEqual([error.status_code for error in rejected], [429])
+        self.assertEqual(self.hasher.pending, 0)
+
+    def test_n_must_be_power_of_two(self):
+        with self.assertRaises(ValueError):
+            PasswordHasher(n=1000, workers=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,76 +1,105 @@
+import os
+import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import patch, MagicMock
 from datetime import datetime, timedelta
+import jwt
 from fastapi import HTTPException
 
+from repository.user_store import SQLiteUserStore
+from service.password_hasher import PasswordHasher
 from service.user_service import UserService
 
 
-class TestUserService(unittest.TestCase):
+class TestUserService(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
-        self.user_service = UserService()
+        self.user_service = UserService(password_hasher=PasswordHasher(n=2 ** 4, r=1, workers=1))
 
-    def test_login_success(self):
+    def tearDown(self):
+        self.user_service.password_hasher.close()
+
+    async def test_login_success(self):
         username = "test_user"
         password = "test_password"
-        self.user_service.users_db = {username: password}
+        await self.user_service.register(username, password)
         expected_token = "test_token"
         with patch.object(self.user_service, 'create_token', return_value=expected_token):
-            response = self.user_service.login(username, password)
+            response = await self.user_service.login(username, password)
             self.assertEqual(response['message'], "Login successful")
             self.assertEqual(response['token'], expected_token)
 
-    def test_login_invalid_credentials(self):
-        with self.assertRaises(HTTPException) as context:
-            self.user_service.login("invalid_user", "invalid_password")
-        self.assertEqual(context.exception.status_code, 401)
-        self.assertEqual(context.exception.detail, "Invalid username or password")
-
-    def test_register_success(self):
+    async def test_login_invalid_credentials(self):
+        await self.user_service.register("test_user", "test_password")
+        for username, password in (("invalid_user", "invalid_password"), ("test_user", "invalid_password")):
+            with self.assertRaises(HTTPException) as context:
+                await self.user_service.login(username, password)
+            self.assertEqual(context.exception.status_code, 401)
+            self.assertEqual(context.exception.detail, "Invalid username or password")
+
+    async def test_login_rehashes_outdated_password(self):
+        self.user_service.store.users = {"plain": "password"}
+        await self.user_service.register("old", "password")
+        old_hash = self.user_service.store.users["old"]
+        self.user_service.password_hasher = PasswordHasher(n=2 ** 5, r=1, workers=0)
+
+        for username in ("plain", "old"):
+            await self.user_service.login(username, "password")
+
+            stored = self.user_service.store.users[username]
+            self.assertTrue(stored.startswith("$scrypt$ln=5,r=1,p=1$"))
+            self.assertFalse(self.user_service.password_hasher.needs_rehash(stored))
+            await self.user_service.login(username, "password")
+        self.assertNotEqual(self.user_service.store.users["old"], old_hash)
+
+    async def test_register_success(self):
         username = "new_user"
         password = "new_password"
-        response = self.user_service.register(username, password)
+        response = await self.user_service.register(username, password)
         self.assertEqual(response['message'], "Registration successful")
-        self.assertEqual(self.user_service.users_db[username], password)
+        self.assertNotEqual(self.user_service.store.users[username], password)
+        self.assertTrue(await self.user_service.password_hasher.verify(password, self.user_service.store.users[username]))
 
-    def test_register_existing_user(self):
+    async def test_register_existing_user(self):
         username = "existing_user"
         password = "existing_password"
-        self.user_service.users_db = {username: password}
+        self.user_service.store.users = {username: password}
         with self.assertRaises(HTTPException) as context:
-            self.user_service.register(username, "new_password")
+            await self.user_service.register(username, "new_password")
         self.assertEqual(context.exception.status_code, 400)
         self.assertEqual(context.exception.detail, "Username already exists")
 
-    def test_logout_success(self):
+    async def test_logout_success(self):
         token = "test_token"
-        self.user_service.sessions[token] = datetime.utcnow()
-        response = self.user_service.logout(token)
+        self.user_service.store.add_session(token, "test_user", time.time())
+        response = await self.user_service.logout(token)
         self.assertEqual(response['message'], "Logout successful")
-        self.assertNotIn(token, self.user_service.sessions)
+        self.assertIsNone(self.user_service.store.get_session(token))
 
-    def test_get_user_details_success(self):
+    async def test_get_user_details_success(self):
         username = "test_user"
         password = "test_password"
-        self.user_service.users_db = {username: password}
-        response = self.user_service.get_user_details(username)
-        self.assertEqual(response['username'], username)
-        self.assertEqual(response['password'], password)
+        self.user_service.store.users = {username: password}
+        response = await self.user_service.get_user_details(username)
+        self.assertEqual(response, {'username': username})
 
-    def test_get_user_details_not_found(self):
+    async def test_get_user_details_not_found(self):
         with self.assertRaises(HTTPException) as context:
-            self.user_service.get_user_details("non_existing_user")
+            await self.user_service.get_user_details("non_existing_user")
         self.assertEqual(context.exception.status_code, 404)
         self.assertEqual(context.exception.detail, "User not found")
 
-    def test_set_user_details_success(self):
+    async def test_set_user_details_success(self):
         username = "test_user"
         password = "test_password"
         new_password = "new_password"
-        self.user_service.users_db = {username: password}
-        response = self.user_service.set_user_details(username, new_password)
+        self.user_service.store.users = {username: password}
+        response = await self.user_service.set_user_details(username, new_password)
         self.assertEqual(response['message'], "User details updated")
-        self.assertEqual(self.user_service.users_db[username], new_password)
+        await self.user_service.login(username, new_password)
+        with self.assertRaises(HTTPException):
+            await self.user_service.login(username, password)
 
     def test_create_token(self):
         username = "test_user"
@@ -79,21 +108,117 @@ class TestUserService(unittest.TestCase):
             token = self.user_service.create_token(username)
             self.assertEqual(token, expected_token)
 
-    def test_verify_token_expired(self):
+    async def test_verify_token_expired(self):
         token = "expired_token"
-        self.user_service.sessions = {token: datetime.utcnow() - timedelta(minutes=20)}
+        self.user_service.store.add_session(token, "test_user", time.time() - 20 * 60)
         with self.assertRaises(HTTPException) as context:
-            self.user_service.verify_token(token)
+            await self.user_service.verify_token(token)
         self.assertEqual(context.exception.status_code, 401)
         self.assertEqual(context.exception.detail, "Token has expired")
 
-    def test_verify_token_invalid(self):
+    async def test_verify_token_invalid(self):
         token = "invalid_token"
         with self.assertRaises(HTTPException) as context:
-            self.user_service.verify_token(token)
+            await self.user_service.verify_token(token)
         self.assertEqual(context.exception.status_code, 401)
         self.assertEqual(context.exception.detail, "Invalid token")
 
+    async def login(self, username="test_user"):
+        self.user_service.store.users[username] = "password"
+        return (await self.user_service.login(username, "password"))["token"]
+
+    async def test_verify_token_decodes_once(self):
+        token = await self.login()
+        with patch('jwt.decode', wraps=jwt.decode) as decode:
+            for _ in range(3):
+                self.assertEqual(await self.user_service.verify_token(token), "test_user")
+        decode.assert_called_once()
+
+    async def test_logout_revokes_cached_token(self):
+        token = await self.login()
+        await self.user_service.verify_token(token)
+
+        await self.user_service.logout(token)
+
+        with self.assertRaises(HTTPException) as context:
+            await self.user_service.verify_token(token)
+        self.assertEqual(context.exception.detail, "Invalid token")
+        self.assertEqual(self.user_service._claims, {})
+
+    async def test_verify_expired_jwt_ends_session(self):
+        token = self.user_service.create_token("test_user", expires_delta=timedelta(seconds=-1))
+        self.user_service.store.add_session(token, "test_user", time.time())
+        with self.assertRaises(HTTPException) as context:
+            await self.user_service.verify_token(token)
+        self.assertEqual(context.exception.detail, "Token has expired")
+        self.assertIsNone(self.user_service.store.get_session(token))
+
+    async def test_claims_cache_is_bounded(self):
+        self.user_service.claims_cache_size = 2
+        tokens = [await self.login(f"user{i}") for i in range(3)]
+        for token in tokens:
+            await self.user_service.verify_token(token)
+        self.assertEqual(list(self.user_service._claims), tokens[1:])
+        self.assertEqual(await self.user_service.verify_token(tokens[0]), "user0")
+
+    async def test_sweep_sessions(self):
+        idle = await self.login("idle")
+        active = await self.login("active")
+        self.user_service.store.sessions[idle] = ("idle", time.time() - 20 * 60)
+        await self.user_service.verify_token(active)
+
+        self.assertEqual(await self.user_service.sweep_sessions(), 1)
+
+        self.assertEqual(list(self.user_service.store.sessions), [active])
+        self.assertEqual(await self.user_service.verify_token(active), "active")
+
+    async def test_workers_share_users_and_sessions(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "users.sqlite3")
+            workers = [UserService(password_hasher=self.user_service.password_hasher,
+                                   store=SQLiteUserStore(path, cache_ttl=0)) for _ in range(2)]
+            await workers[0].register("alice", "password")
+            token = (await workers[1].login("alice", "password"))["token"]
+
+            self.assertEqual(await workers[0].verify_token(token), "alice")
+            await workers[1].logout(token)
+            with self.assertRaises(HTTPException):
+                await workers[0].verify_token(token)
+            for worker in workers:
+                worker.store.close()
+
+    async def test_store_is_called_off_the_event_loop(self):
+        token = await self.login()
+        threads = []
+        get_session = self.user_service.store.get_session
+
+        def record(*args):
+            threads.append(threading.current_thread())
+            return get_session(*args)
+
+        # As a store without a cache of its own.
+        with patch.object(self.user_service.store, "cached_session", return_value=None), \
+                patch.object(self.user_service.store, "get_session", side_effect=record):
+            self.assertEqual(await self.user_service.verify_token(token), "test_user")
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    async def test_cached_session_is_verified_on_the_event_loop(self):
+        token = await self.login()
+        await self.user_service.verify_token(token)
+
+        with patch("service.user_service.asyncio.to_thread") as to_thread:
+            self.assertEqual(await self.user_service.verify_token(token), "test_user")
+        to_thread.assert_not_called()
+
+    async def test_session_used_elsewhere_is_not_expired(self):
+        token = await self.login()
+        await self.user_service.verify_token(token)
+        stale = time.time() - 20 * 60
+        with patch.object(self.user_service.store, 'get_session',
+                          side_effect=lambda token, fresh=False: time.time() if fresh else stale):
+            self.assertEqual(await self.user_service.verify_token(token), "test_user")
+
     def test_decodeJWT(self):
         token = "test_token"
         expected_payload = {"sub": "test_user", "exp": datetime.utcnow() + timedelta(minutes=15)}
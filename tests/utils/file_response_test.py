@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+from utils.file_response import caching_headers, is_not_modified, iter_file_range
+
+
+class TestFileResponse(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "text")
+        with open(self.path, "wb") as f:
+            f.write(bytes(range(256)) * 1000)
+        self.stat_result = os.stat(self.path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_etag_changes_with_file_and_variant(self):
+        headers = caching_headers(self.stat_result)
+        self.assertEqual(headers["Cache-Control"], "private, no-cache")
+        self.assertNotEqual(caching_headers(self.stat_result, variant="-p1")["ETag"], headers["ETag"])
+
+        with open(self.path, "ab") as f:
+            f.write(b"more")
+        self.assertNotEqual(caching_headers(os.stat(self.path))["ETag"], headers["ETag"])
+
+    def test_is_not_modified(self):
+        headers = caching_headers(self.stat_result)
+        etag = headers["ETag"]
+        cases = [
+            ({}, False),
+            ({"if-none-match": etag}, True),
+            ({"if-none-match": f'"other", W/{etag}'}, True),
+            ({"if-none-match": "*"}, True),
+            ({"if-none-match": '"other"'}, False),
+            # If-None-Match takes precedence over a matching If-Modified-Since.
+            ({"if-none-match": '"other"', "if-modified-since": headers["Last-Modified"]}, False),
+            ({"if-modified-since": headers["Last-Modified"]}, True),
+            ({"if-modified-since": "Thu, 01 Jan 1970 00:00:00 GMT"}, False),
+            ({"if-modified-since": "not a date"}, False),
+        ]
+        for request_headers, expected in cases:
+            with self.subTest(request_headers=request_headers):
+                self.assertEqual(is_not_modified(request_headers, self.stat_result, etag), expected)
+
+    async def test_iter_file_range(self):
+        with open(self.path, "rb") as f:
+            contents = f.read()
+
+        chunks = [chunk async for chunk in iter_file_range(self.path, 1000, 201000, chunk_size=64 * 1024)]
+
+        self.assertEqual(b"".join(chunks), contents[1000:201000])
+        self.assertTrue(all(len(chunk) <= 64 * 1024 for chunk in chunks))
+        self.assertEqual([chunk async for chunk in iter_file_range(self.path, 10, 10)], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from unittest.mock import patch
+
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from service.password_hasher import PasswordHasher
+from service.user_service import UserService
+from utils.get_current_user import CurrentUser, JWTBearer
+
+
+def make_request(token=None):
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+class TestCurrentUser(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.user_service = UserService(password_hasher=PasswordHasher(n=2 ** 4, r=1, workers=0))
+        self.user_service.store.users = {"alice": "password"}
+        self.token = (await self.user_service.login("alice", "password"))["token"]
+
+    async def test_injects_identity_into_request(self):
+        request = make_request(self.token)
+
+        self.assertEqual(await JWTBearer(self.user_service)(request), self.token)
+
+        self.assertEqual((request.state.user, request.state.token), ("alice", self.token))
+
+    async def test_request_is_verified_once(self):
+        request = make_request(self.token)
+        await JWTBearer(self.user_service)(request)
+
+        with patch.object(self.user_service, 'verify_token') as verify_token:
+            self.assertEqual(await CurrentUser(self.user_service)(request), "alice")
+        verify_token.assert_not_called()
+
+    async def test_rejects_unknown_token(self):
+        for request in (make_request("unknown"), make_request()):
+            with self.assertRaises(HTTPException) as context:
+                await CurrentUser(self.user_service)(request)
+            self.assertIn(context.exception.status_code, (401, 403))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import asyncio
+import unittest
+
+from utils.locks import ReadWriteLock
+
+
+class TestReadWriteLock(unittest.IsolatedAsyncioTestCase):
+    async def test_readers_share_the_lock(self):
+        lock = ReadWriteLock()
+        async with lock.read():
+            async with lock.read():
+                self.assertEqual(lock.readers, 2)
+                self.assertFalse(lock.locked())
+        self.assertEqual(lock.readers, 0)
+
+    async def test_writer_waits_for_readers(self):
+        lock = ReadWriteLock()
+        events = []
+
+        async def write():
+            async with lock.write():
+                events.append("write")
+
+        async with lock.read():
+            writer = asyncio.ensure_future(write())
+            await asyncio.sleep(0)
+            events.append("read")
+        await writer
+
+        self.assertEqual(events, ["read", "write"])
+
+    async def test_readers_wait_behind_a_waiting_writer(self):
+        lock = ReadWriteLock()
+        events = []
+
+        async def use(name, write):
+            async with (lock.write() if write else lock.read()):
+                events.append(name)
+                await asyncio.sleep(0)
+
+        async with lock.read():
+            tasks = [asyncio.ensure_future(use("writer", True)), asyncio.ensure_future(use("reader", False))]
+            await asyncio.sleep(0)
+            self.assertEqual(events, [])
+        await asyncio.gather(*tasks)
+
+        self.assertEqual(events, ["writer", "reader"])
+
+    async def test_cancelled_writer_lets_readers_in(self):
+        lock = ReadWriteLock()
+        events = []
+
+        async def use(name, write):
+            async with (lock.write() if write else lock.read()):
+                events.append(name)
+
+        async with lock.read():
+            writer = asyncio.ensure_future(use("writer", True))
+            await asyncio.sleep(0)
+            reader = asyncio.ensure_future(use("reader", False))
+            await asyncio.sleep(0)
+            self.assertEqual(events, [])
+            writer.cancel()
+            await reader
+
+        self.assertEqual(events, ["reader"])
+        self.assertEqual(lock.readers, 0)
+        self.assertFalse(lock.locked())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import asyncio
+import time
+import unittest
+
+from utils.metrics import EventLoopLagMonitor, Histogram, Registry
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_render(self):
+        tokens = self.registry.counter("tokens_total", "Tokens.", ("kind",))
+        self.registry.gauge("entries", "Entries.", callback=lambda: 3)
+        tokens.inc(2, kind="prompt")
+        tokens.inc(kind="prompt")
+        tokens.inc(1.5, kind='say "hi"\n')
+
+        self.assertEqual(self.registry.render(), "\n".join([
+            "# HELP tokens_total Tokens.",
+            "# TYPE tokens_total counter",
+            'tokens_total{kind="prompt"} 3',
+            'tokens_total{kind="say \\"hi\\"\\n"} 1.5',
+            "# HELP entries Entries.",
+            "# TYPE entries gauge",
+            "entries 3",
+        ]) + "\n")
+
+    def test_histogram(self):
+        latency = self.registry.histogram("latency_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            latency.observe(value, stage="auth")
+
+        self.assertIn('latency_seconds_bucket{stage="auth",le="0.1"} 2', self.registry.render())
+        self.assertEqual(latency.collect()[1:], [
+            ("latency_seconds_bucket", {"stage": "auth", "le": "1"}, 3),
+            ("latency_seconds_bucket", {"stage": "auth", "le": "+Inf"}, 4),
+            ("latency_seconds_sum", {"stage": "auth"}, 2.65),
+            ("latency_seconds_count", {"stage": "auth"}, 4),
+        ])
+        self.assertEqual(latency.snapshot(stage="auth"), {"count": 4, "sum": 2.65})
+        self.assertEqual(latency.snapshot(stage="chunk"), {"count": 0, "sum": 0.0})
+
+    def test_histogram_times_failing_blocks(self):
+        latency = Histogram("latency_seconds", "Latency.")
+        with self.assertRaises(RuntimeError):
+            with latency.time():
+                raise RuntimeError()
+
+        self.assertEqual(latency.snapshot()["count"], 1)
+
+    def test_callback_with_labels(self):
+        self.registry.counter("hits_total", "Hits.", ("cache",), callback=lambda: {("response",): 1, ("shard",): None})
+
+        self.assertIn('hits_total{cache="response"} 1', self.registry.render())
+        self.assertNotIn("shard", self.registry.render())
+
+    def test_histogram_callback(self):
+        self.registry.histogram("batch_size", "Batch size.", buckets=(1, 4), callback=lambda: [2, 1, 1, 13])
+
+        self.assertEqual(self.registry.render().splitlines()[2:], [
+            'batch_size_bucket{le="1"} 2',
+            'batch_size_bucket{le="4"} 3',
+            'batch_size_bucket{le="+Inf"} 4',
+            "batch_size_sum 13",
+            "batch_size_count 4",
+        ])
+
+    def test_labels_are_checked(self):
+        tokens = self.registry.counter("tokens_total", "Tokens.", ("kind",))
+
+        with self.assertRaises(ValueError):
+            tokens.inc()
+        with self.assertRaises(ValueError):
+            tokens.inc(kind="prompt", model="gpt")
+        with self.assertRaises(ValueError):
+            self.registry.gauge("tokens_total", "Tokens.")
+
+
+class TestEventLoopLagMonitor(unittest.IsolatedAsyncioTestCase):
+    async def test_measures_blocked_loop(self):
+        lag = Histogram("lag_seconds", "Lag.")
+        monitor = EventLoopLagMonitor(lag, interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0.02)
+        time.sleep(0.1)
+        await asyncio.sleep(0.02)
+        await monitor.stop()
+
+        self.assertGreaterEqual(lag.snapshot()["sum"], 0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
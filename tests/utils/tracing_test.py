@@ -0,0 +1,58 @@
+import unittest
+
+import httpx
+from fastapi import FastAPI
+
+from utils.logger import trace_id
+from utils.metrics import HTTP_REQUEST_SECONDS
+from utils.tracing import TraceMiddleware
+
+
+def create_app():
+    app = FastAPI()
+    app.add_middleware(TraceMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: str):
+        return {"trace_id": trace_id.get()}
+
+    return app
+
+
+class TestTraceMiddleware(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app()), base_url="http://test")
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+
+    async def test_request_id_is_kept(self):
+        response = await self.client.get("/items/1", headers={"X-Request-ID": "abc-123"})
+
+        self.assertEqual(response.headers["X-Request-ID"], "abc-123")
+        self.assertEqual(response.json(), {"trace_id": "abc-123"})
+        self.assertEqual(trace_id.get(), "-")
+
+    async def test_trace_id_is_generated(self):
+        for headers in ({}, {"X-Request-ID": "x" * 65}, {"X-Request-ID": "a b"}):
+            response = await self.client.get("/items/1", headers=headers)
+
+            self.assertEqual(len(response.headers["X-Request-ID"]), 32)
+            self.assertEqual(response.json(), {"trace_id": response.headers["X-Request-ID"]})
+
+    async def test_requests_are_timed_by_route(self):
+        labels = {"method": "GET", "route": "/items/{item_id}", "status": "200"}
+        unmatched = {"method": "GET", "route": "unmatched", "status": "404"}
+        before = HTTP_REQUEST_SECONDS.snapshot(**labels)["count"], HTTP_REQUEST_SECONDS.snapshot(**unmatched)["count"]
+
+        await self.client.get("/items/1")
+        await self.client.get("/items/2")
+        await self.client.get("/missing")
+
+        self.assertEqual((HTTP_REQUEST_SECONDS.snapshot(**labels)["count"],
+                          HTTP_REQUEST_SECONDS.snapshot(**unmatched)["count"]),
+                         (before[0] + 2, before[1] + 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
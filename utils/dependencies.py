@@ -0,0 +1,14 @@
+from fastapi import Request
+
+
+def get_container(request: Request):
+    """
+    Dependency resolving the services shared by the application.
+
+    Args:
+        request (Request): The HTTP request object.
+
+    Returns:
+        Container: The container built by the application's lifespan.
+    """
+    return request.app.state.container
@@ -0,0 +1,79 @@
+from email.utils import formatdate, parsedate_to_datetime
+
+import anyio
+
+# Size of the pieces a file is sent in.
+CHUNK_SIZE = 64 * 1024
+
+
+def caching_headers(stat_result, variant=""):
+    """
+    Validators and cache policy of a response made from a file.
+
+    The ETag changes whenever the file is replaced or rewritten, so clients can revalidate with
+    If-None-Match and get a 304 instead of the content. Documents belong to one user, so only private
+    caches may store them.
+
+    Args:
+        stat_result (os.stat_result): The file's status.
+        variant (str): Distinguishes responses made from different parts of the same file, e.g. a page number.
+
+    Returns:
+        dict: The ETag, Last-Modified and Cache-Control headers.
+    """
+    etag = f'"{stat_result.st_ino:x}-{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}{variant}"'
+    return {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": "private, no-cache",
+    }
+
+
+def is_not_modified(request_headers, stat_result, etag):
+    """
+    Evaluate the conditional headers of a GET request for a file, as in RFC 9110.
+
+    Args:
+        request_headers (Mapping): The request's headers.
+        stat_result (os.stat_result): The file's status.
+        etag (str): The response's ETag.
+
+    Returns:
+        bool: True if the client's copy is current and a 304 should be sent.
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence over If-Modified-Since and compares weakly.
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(stat_result.st_mtime) <= since
+    return False
+
+
+async def iter_file_range(path, start, end, chunk_size=CHUNK_SIZE):
+    """
+    Read a byte range of a file piece by piece, so that memory does not grow with the size of the range.
+
+    Args:
+        path (str): The file.
+        start (int): Offset of the first byte.
+        end (int): Offset just past the last byte.
+        chunk_size (int): Maximum size of each piece.
+
+    Yields:
+        bytes: The pieces of the range, in order.
+    """
+    async with await anyio.open_file(path, "rb") as file:
+        await file.seek(start)
+        while start < end:
+            chunk = await file.read(min(chunk_size, end - start))
+            if not chunk:
+                break
+            start += len(chunk)
+            yield chunk
@@ -1,9 +1,7 @@
-from datetime import datetime
-
 from fastapi import HTTPException, Request
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
-from utils.logger import logger
+from utils.metrics import stage_timer
 
 
 class JWTBearer(HTTPBearer):
@@ -14,12 +12,13 @@ class JWTBearer(HTTPBearer):
     Verifies the validity of JWT tokens and their association with user sessions.
 
     Args:
-        user_service: An instance of the UserService class for token verification.
+        user_service (optional): An instance of the UserService class for token verification; the one of the
+                                 application's container by default.
         auto_error (bool, optional): Whether to raise HTTPException automatically on authentication error.
                                      Defaults to True.
     """
 
-    def __init__(self, user_service, auto_error: bool = True):
+    def __init__(self, user_service=None, auto_error: bool = True):
         super(JWTBearer, self).__init__(auto_error=auto_error)
         self.user_service = user_service
 
@@ -27,7 +26,8 @@ class JWTBearer(HTTPBearer):
         """
         Middleware to validate JWT tokens.
 
-        Verifies the JWT token provided in the request header.
+        Verifies the JWT token provided in the request header and injects the identity it carries into the
+        request, as request.state.user, and the token itself as request.state.token.
         Raises HTTPException if the token is invalid or expired.
 
         Args:
@@ -43,34 +43,44 @@ class JWTBearer(HTTPBearer):
         if credentials:
             if not credentials.scheme == "Bearer":
                 raise HTTPException(status_code=403, detail="Invalid authentication scheme.")
-            if not self.verify_jwt(credentials.credentials):
-                raise HTTPException(status_code=403, detail="Invalid token or expired token.")
+            user_service = self.user_service or request.app.state.container.user_service
+            with stage_timer("auth"):
+                request.state.user = await user_service.verify_token(credentials.credentials)
+            request.state.token = credentials.credentials
             return credentials.credentials
         else:
             raise HTTPException(status_code=403, detail="Invalid authorization code.")
 
-    def verify_jwt(self, jwt_token: str) -> bool:
-        """
-        Verify JWT token validity.
 
-        Verifies the validity of the provided JWT token.
-        Updates user session if the token is valid.
+class CurrentUser:
+    """
+    Dependency resolving the user an authenticated request is made by.
+
+    Authenticates the request like JWTBearer and returns the subject of its JWT. A request that was already
+    authenticated, e.g. by a JWTBearer dependency of its route, is not verified again.
+
+    Args:
+        user_service (optional): An instance of the UserService class for token verification; the one of the
+                                 application's container by default.
+    """
+
+    def __init__(self, user_service=None):
+        self.user_service = user_service
+        self.jwt_bearer = JWTBearer(user_service)
 
+    async def __call__(self, request: Request) -> str:
+        """
         Args:
-            jwt_token (str): The JWT token to verify.
+            request (Request): The HTTP request object.
 
         Returns:
-            bool: True if the token is valid, False otherwise.
+            str: The username of the authenticated user.
+
+        Raises:
+            HTTPException: If the token is invalid or expired.
         """
-        isTokenValid: bool = True
-        try:
-            #payload = self.user_service.decodeJWT(jwt_token)
-            if jwt_token in self.user_service.sessions:
-                self.user_service.sessions[jwt_token] = datetime.utcnow()
-            else:
-                isTokenValid = False
-        except Exception as e:
-            logger.info("error: ", str(e))
-            isTokenValid = False
-
-        return isTokenValid
+        user = getattr(request.state, "user", None)
+        if user is None:
+            await self.jwt_bearer(request)
+            user = request.state.user
+        return user
@@ -0,0 +1,102 @@
+import asyncio
+import contextlib
+from collections import deque
+
+
+class ReadWriteLock:
+    """
+    An asyncio lock held either by any number of readers at once or by a single writer.
+
+    Waiters are served in arrival order: a writer waits for the readers ahead of it, and readers that arrive
+    after a waiting writer wait behind it, so a steady stream of readers cannot starve writers. Consecutive
+    readers at the head of the queue are admitted together.
+    """
+
+    def __init__(self):
+        self._readers = 0
+        self._writer = False
+        # (write, future) of each waiter, in arrival order.
+        self._waiters = deque()
+
+    @property
+    def readers(self):
+        """
+        int: The number of readers holding the lock.
+        """
+        return self._readers
+
+    def locked(self):
+        """
+        Returns:
+            bool: Whether a writer holds the lock.
+        """
+        return self._writer
+
+    @contextlib.asynccontextmanager
+    async def read(self):
+        """
+        Hold the lock shared with other readers, e.g. to search an index from a worker thread.
+        """
+        await self._acquire(write=False)
+        try:
+            yield
+        finally:
+            self._release(write=False)
+
+    @contextlib.asynccontextmanager
+    async def write(self):
+        """
+        Hold the lock exclusively, e.g. to add to or remove from an index.
+        """
+        await self._acquire(write=True)
+        try:
+            yield
+        finally:
+            self._release(write=True)
+
+    def _can_grant(self, write):
+        return not self._writer and (not write or self._readers == 0)
+
+    def _grant(self, write):
+        if write:
+            self._writer = True
+        else:
+            self._readers += 1
+
+    async def _acquire(self, write):
+        if not self._waiters and self._can_grant(write):
+            self._grant(write)
+            return
+        future = asyncio.get_running_loop().create_future()
+        entry = (write, future)
+        self._waiters.append(entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just before the waiter was cancelled: pass the lock on.
+                self._release(write)
+            else:
+                self._waiters.remove(entry)
+                # A cancelled writer may have been holding back the readers queued behind it.
+                self._wake()
+            raise
+
+    def _release(self, write):
+        if write:
+            self._writer = False
+        else:
+            self._readers -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters:
+            write, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._can_grant(write):
+                return
+            self._waiters.popleft()
+            self._grant(write)
+            future.set_result(None)
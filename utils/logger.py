@@ -1,5 +1,24 @@
+import contextvars
 import logging
 import os
 
 level = os.environ.get("LOGLEVEL", "INFO").upper()
-logger = logging.Logger(name="rag_app", level=level)
\ No newline at end of file
+# Id of the request being served, set by the tracing middleware; "-" outside of requests.
+trace_id = contextvars.ContextVar("trace_id", default="-")
+
+
+class TraceIdFilter(logging.Filter):
+    """
+    Adds the id of the current request to every record, as trace_id.
+    """
+
+    def filter(self, record):
+        record.trace_id = trace_id.get()
+        return True
+
+
+handler = logging.StreamHandler()
+handler.addFilter(TraceIdFilter())
+handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(trace_id)s] %(name)s: %(message)s"))
+logger = logging.Logger(name="rag_app", level=level)
+logger.addHandler(handler)
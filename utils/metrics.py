@@ -0,0 +1,288 @@
+import asyncio
+import bisect
+import math
+import threading
+import time
+
+# Upper bounds, in seconds, of the latency buckets: from sub-millisecond lookups to LLM calls.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    """
+    A named metric with a fixed set of label names, rendered in the Prometheus text format.
+
+    Args:
+        name (str): The metric's name.
+        help (str): Its description.
+        labelnames (tuple[str]): Names of the labels its samples are told apart by.
+        callback (callable, optional): Called at collection time, returns the current value, or a dict
+            from label value tuples to values; for values that are already tracked elsewhere.
+    """
+
+    type = None
+
+    def __init__(self, name, help, labelnames=(), callback=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._lock = threading.Lock()
+        # label values -> value
+        self._values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames) or not all(name in labels for name in self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple([labels[name] for name in self.labelnames])
+
+    def collect(self):
+        """
+        Returns:
+            list[tuple]: (name, labels, value) of every sample.
+        """
+        if self.callback is not None:
+            values = self.callback()
+            values = values if isinstance(values, dict) else {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in values.items()
+                if value is not None]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}"
+                     for name, labels, value in self.collect())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """
+    A value that only goes up, e.g. a number of tokens.
+    """
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down, e.g. the size of an index.
+    """
+
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """
+    Counts of observations by bucket, with their sum, e.g. latencies.
+
+    Observing costs a binary search and an increment, so it can sit on every request's path.
+
+    Args:
+        name (str): The metric's name.
+        help (str): Its description.
+        labelnames (tuple[str]): Names of the labels its samples are told apart by.
+        buckets (tuple[float]): Upper bounds of the buckets, increasing.
+        callback (callable, optional): Called at collection time for distributions that are already tracked
+            elsewhere; returns the count of observations in each bucket, plus one for those above the last
+            bucket, then their sum, or a dict from label value tuples to such lists.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, callback=None):
+        super().__init__(name, help, labelnames, callback)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        self._observe(self._key(labels), value)
+
+    def time(self, **labels):
+        """
+        Observe the seconds spent in a block, whether it exits normally or by raising.
+
+        Returns:
+            contextmanager: Times the block it is entered for.
+        """
+        return _Timer(self, self._key(labels))
+
+    def _observe(self, key, value):
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Counts per bucket, plus one for +Inf, then the sum of the observations.
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[bisect.bisect_left(self.buckets, value)] += 1
+            state[-1] += value
+
+    def collect(self):
+        if self.callback is not None:
+            values = self.callback()
+            values = values if isinstance(values, dict) else {(): values}
+        else:
+            with self._lock:
+                values = {key: list(state) for key, state in self._values.items()}
+        samples = []
+        for key, state in values.items():
+            labels = dict(zip(self.labelnames, key))
+            count = 0
+            for bound, bucket in zip(self.buckets + (math.inf,), state):
+                count += bucket
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(float(bound))}, count))
+            samples.append((f"{self.name}_sum", labels, state[-1]))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+    def snapshot(self, **labels):
+        """
+        Returns:
+            dict: The "count" and "sum" of the observations with the given labels.
+        """
+        with self._lock:
+            state = self._values.get(self._key(labels))
+        return {"count": sum(state[:-1]), "sum": state[-1]} if state else {"count": 0, "sum": 0.0}
+
+
+class _Timer:
+    # A class rather than a generator-based context manager, which costs several times as much to enter.
+    __slots__ = ("histogram", "key", "start")
+
+    def __init__(self, histogram, key):
+        self.histogram = histogram
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram._observe(self.key, time.perf_counter() - self.start)
+
+
+class Registry:
+    """
+    The metrics exported by the application.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name):
+        """
+        Stop exporting a metric, e.g. one whose callback reads a store that is being closed.
+
+        Args:
+            name (str): The metric's name; unknown names are ignored.
+        """
+        self._metrics.pop(name, None)
+
+    def counter(self, name, help, labelnames=(), callback=None):
+        return self.register(Counter(name, help, labelnames, callback))
+
+    def gauge(self, name, help, labelnames=(), callback=None):
+        return self.register(Gauge(name, help, labelnames, callback))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, callback=None):
+        return self.register(Histogram(name, help, labelnames, buckets, callback))
+
+    def render(self):
+        """
+        Returns:
+            str: Every metric in the Prometheus text exposition format, version 0.0.4.
+        """
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+class EventLoopLagMonitor:
+    """
+    Measures how late the event loop wakes up a task that sleeps for interval seconds.
+
+    Any lag is time during which the loop was busy running something that did not yield, and during which
+    every other request waited.
+
+    Args:
+        histogram (Histogram): Where the lags are observed, in seconds.
+        interval (float): Seconds between measurements.
+    """
+
+    def __init__(self, histogram, interval=0.5):
+        self.histogram = histogram
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.histogram.observe(max(0.0, time.perf_counter() - start - self.interval))
+
+
+registry = Registry()
+STAGE_SECONDS = registry.histogram(
+    "rag_stage_seconds", "Seconds spent in each stage of serving requests and ingesting documents.", ("stage",))
+TOKENS = registry.counter("rag_tokens_total", "Tokens sent to or received from the models, by kind.", ("kind",))
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "rag_http_request_seconds", "Seconds to serve HTTP requests, by method, route and status.",
+    ("method", "route", "status"))
+EVENT_LOOP_LAG_SECONDS = registry.histogram(
+    "rag_event_loop_lag_seconds", "Seconds the event loop was late waking up a sleeping task.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+STARTUP_SECONDS = registry.gauge(
+    "rag_startup_seconds", "Seconds to import the app, and from the start of the import until ready.", ("phase",))
+
+
+def stage_timer(stage):
+    """
+    Time a block as one stage of serving a request or ingesting a document.
+
+    Args:
+        stage (str): The stage, e.g. "auth" or "faiss_search".
+
+    Returns:
+        contextmanager: Observes the block's duration into rag_stage_seconds.
+    """
+    return STAGE_SECONDS.time(stage=stage)
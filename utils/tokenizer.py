@@ -0,0 +1,20 @@
+import functools
+
+import tiktoken
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model):
+    """
+    Get the tiktoken encoding for a model, loading it at most once per process.
+
+    Args:
+        model (str): Model name, e.g. "gpt-3.5-turbo" or "text-embedding-ada-002".
+
+    Returns:
+        tiktoken.Encoding: The model's encoding, or cl100k_base for models tiktoken does not know.
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
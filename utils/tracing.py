@@ -0,0 +1,61 @@
+import time
+import uuid
+
+from utils.logger import trace_id
+from utils.metrics import HTTP_REQUEST_SECONDS
+
+TRACE_HEADER = b"x-request-id"
+# Longest client-supplied request id that is kept; longer ones are replaced, so logs stay readable.
+MAX_TRACE_ID_LENGTH = 64
+
+
+class TraceMiddleware:
+    """
+    ASGI middleware tagging every HTTP request with a trace id and timing it.
+
+    The trace id is the request's X-Request-ID header if it has a usable one, or a new random id otherwise.
+    It is set as the logger's trace_id for everything the request runs, so its log lines can be told apart
+    from those of concurrent requests, and returned in the response's X-Request-ID header. The request's
+    duration is observed into rag_http_request_seconds, by method, route template and status; requests that
+    match no route are counted under "unmatched", so arbitrary paths cannot grow the number of series.
+
+    Args:
+        app: The ASGI application to wrap.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = _request_id(scope)
+        token = trace_id.set(request_id)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_trace_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (TRACE_HEADER, request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=scope["method"],
+                                         route=getattr(route, "path", "unmatched"), status=str(status))
+            trace_id.reset(token)
+
+
+def _request_id(scope):
+    for name, value in scope["headers"]:
+        if name == TRACE_HEADER:
+            value = value.decode("latin-1")
+            if 0 < len(value) <= MAX_TRACE_ID_LENGTH and value.isprintable() and " " not in value:
+                return value
+            break
+    return uuid.uuid4().hex